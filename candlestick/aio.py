@@ -0,0 +1,67 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.db import transaction
+import candlestick.yahoo as yahoo
+
+async def afetch(instrument, resolution, upsert=False):
+    """The async equivalent of yahoo.fetch. Prices are requested in a worker
+    thread, so that other requests can run at the same time, and are then
+    saved on the thread which all async database work shares."""
+
+    history = await request_history(instrument, resolution)
+    return await sync_to_async(save_atomically)(
+        yahoo.save_history, history, instrument, resolution, upsert=upsert
+    )
+
+
+async def aupdate(instrument, resolution, upsert=False, incremental=False):
+    """The async equivalent of yahoo.update."""
+
+    start = await sync_to_async(yahoo.get_update_start)(
+        instrument, resolution, incremental=incremental
+    )
+    if start is None:
+        return await afetch(instrument, resolution, upsert=upsert or incremental)
+    history = await request_history(instrument, resolution, start=start)
+    return await sync_to_async(save_atomically)(
+        yahoo.save_update, history, instrument, resolution, start,
+        upsert=upsert, incremental=incremental
+    )
+
+
+async def aupdate_many(instruments, resolution, concurrency=10, **kwargs):
+    """Updates many instruments concurrently, with no more than some number
+    of requests for prices in progress at once. Any keyword arguments are
+    passed to aupdate. A dictionary of symbols to saved bars is returned,
+    with the exception in place of the bars for any instrument which
+    failed."""
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def update(instrument):
+        async with semaphore:
+            return await aupdate(instrument, resolution, **kwargs)
+
+    results = await asyncio.gather(*[
+        update(instrument) for instrument in instruments
+    ], return_exceptions=True)
+    return {
+        instrument.symbol: result
+        for instrument, result in zip(instruments, results)
+    }
+
+
+async def request_history(instrument, resolution, start=None):
+    """Requests an instrument's prices in a thread of its own, as
+    yahoo.get_history doesn't touch the database."""
+
+    return await sync_to_async(yahoo.get_history, thread_sensitive=False)(
+        instrument, resolution, start=start
+    )
+
+
+def save_atomically(func, *args, **kwargs):
+    """Calls a saving function in a transaction."""
+
+    with transaction.atomic():
+        return func(*args, **kwargs)
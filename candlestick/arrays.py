@@ -0,0 +1,207 @@
+import io
+import json
+import os
+import shutil
+import numpy as np
+from django.conf import settings
+from candlestick.fields import encode_resolution
+
+FIELDS = ["timestamp", "open", "high", "low", "close", "volume"]
+MAX_BYTES = 10 ** 9
+
+def get_directory():
+    """Gets the directory bar arrays are cached in, if the
+    CANDLESTICK_ARRAY_CACHE setting names one."""
+
+    return getattr(settings, "CANDLESTICK_ARRAY_CACHE", None)
+
+
+def series_path(directory, instrument_id, resolution):
+    """Gets the directory an instrument's bars of a resolution are cached in.
+    Resolutions are encoded, as m and M can't be told apart on every file
+    system."""
+
+    return os.path.join(
+        directory, f"{instrument_id}_{encode_resolution(resolution)}"
+    )
+
+
+def load_arrays(instrument, resolution):
+    """Loads an instrument's bars of a resolution into a dictionary of NumPy
+    arrays, like BarQuerySet.to_arrays.
+
+    If an array cache directory is configured, the arrays are memory-mapped,
+    read-only, from .npy files there - so repeated loads are cheap and don't
+    copy anything. The files are checked against the instrument's latest bar
+    first, and rewritten from the database if it doesn't match."""
+
+    directory = get_directory()
+    bars = instrument.bars.filter(resolution=resolution)
+    if not directory: return bars.to_arrays()
+    path = series_path(directory, instrument.id, resolution)
+    latest = instrument.latest_bar(resolution)
+    meta = read_meta(path)
+    if latest and in_sync(meta, latest.timestamp, latest.close) or (
+        not latest and meta and not meta["count"]
+    ):
+        os.utime(os.path.join(path, "meta.json"))
+    else:
+        meta = write_arrays(path, bars.to_arrays())
+        limit_size(directory, keep=path)
+    if not meta["count"]:
+        return {field: np.load(os.path.join(path, f"{field}.npy")) for field in FIELDS}
+    return {field: np.load(
+        os.path.join(path, f"{field}.npy"), mmap_mode="r"
+    )[:meta["count"]] for field in FIELDS}
+
+
+def append_arrays(instrument_id, resolution, arrays):
+    """Adds newly saved bars to an instrument's cached arrays, if it has any,
+    before its latest bar is refreshed. New bars may replace cached bars with
+    the same timestamps, as long as no other cached bar would be left after
+    them - otherwise the cached arrays are removed, to be rewritten from the
+    database when next loaded."""
+
+    from candlestick.models import LatestBar
+    directory = get_directory()
+    if not directory or not len(arrays["timestamp"]): return
+    path = series_path(directory, instrument_id, resolution)
+    meta = read_meta(path)
+    if meta is None: return
+    latest = LatestBar.objects.filter(
+        instrument_id=instrument_id, resolution=resolution
+    ).values_list("timestamp", "close").first()
+    if not (latest and in_sync(meta, *latest) or (not latest and not meta["count"])):
+        return invalidate(instrument_id, resolution)
+    order = np.argsort(arrays["timestamp"], kind="stable")
+    new = {field: np.asarray(arrays[field])[order] for field in FIELDS}
+    cached = np.load(
+        os.path.join(path, "timestamp.npy"), mmap_mode="r"
+    )[:meta["count"]] if meta["count"] else np.empty(0, dtype="int64")
+    cut = int(np.searchsorted(cached, new["timestamp"][0]))
+    if not np.isin(cached[cut:], new["timestamp"]).all():
+        return invalidate(instrument_id, resolution)
+    if cut == meta["count"] and meta["count"]:
+        for field in FIELDS:
+            append_npy(os.path.join(path, f"{field}.npy"), meta["count"], new[field])
+        write_meta(path, meta["count"] + len(order), new)
+    else:
+        write_arrays(path, {field: np.concatenate([np.load(
+            os.path.join(path, f"{field}.npy"), mmap_mode="r" if cut else None
+        )[:cut], new[field]]) for field in FIELDS})
+
+
+def invalidate(instrument_id, resolution):
+    """Removes an instrument's cached arrays of a resolution."""
+
+    directory = get_directory()
+    if directory: shutil.rmtree(
+        series_path(directory, instrument_id, resolution), ignore_errors=True
+    )
+
+
+def invalidate_resolution(resolution):
+    """Removes every instrument's cached arrays of a resolution."""
+
+    directory = get_directory()
+    if not directory or not os.path.isdir(directory): return
+    suffix = f"_{encode_resolution(resolution)}"
+    for name in os.listdir(directory):
+        if name.endswith(suffix):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def in_sync(meta, timestamp, close):
+    """Whether cached arrays end with the latest bar of their instrument and
+    resolution."""
+
+    return bool(meta) and meta["timestamp"] == timestamp and meta["close"] == close
+
+
+def read_meta(path):
+    """Reads the number of cached bars and the timestamp and close of the last
+    of them, if there are cached arrays."""
+
+    try:
+        with open(os.path.join(path, "meta.json")) as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_meta(path, count, arrays):
+    """Records the number of bars in some arrays, and the timestamp and close
+    of the last of them. This is written last, so that readers never see more
+    bars than have been written."""
+
+    meta = {"count": count, "timestamp": None, "close": None}
+    if len(arrays["timestamp"]):
+        meta["timestamp"] = int(arrays["timestamp"][-1])
+        meta["close"] = float(arrays["close"][-1])
+    temp = os.path.join(path, "meta.json.tmp")
+    with open(temp, "w") as f: json.dump(meta, f)
+    os.replace(temp, os.path.join(path, "meta.json"))
+    return meta
+
+
+def write_arrays(path, arrays):
+    """Writes arrays to .npy files, replacing any existing files rather than
+    overwriting them so that arrays already memory-mapped are unaffected."""
+
+    os.makedirs(path, exist_ok=True)
+    for field in FIELDS:
+        temp = os.path.join(path, f"{field}.npy.tmp")
+        with open(temp, "wb") as f: np.save(f, arrays[field])
+        os.replace(temp, os.path.join(path, f"{field}.npy"))
+    return write_meta(path, len(arrays["timestamp"]), arrays)
+
+
+def append_npy(path, count, values):
+    """Appends values to a .npy file's array after some number of its rows,
+    then updates the length in its header. If the longer header wouldn't fit
+    in the space of the old one, the file is rewritten instead."""
+
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            offset, header = f.tell(), io.BytesIO()
+            np.lib.format.write_array_header_1_0(header, {
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": fortran, "shape": (count + len(values),)
+            })
+        if version == (1, 0) and len(header.getvalue()) == offset:
+            f.seek(offset + count * dtype.itemsize)
+            f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+            f.truncate()
+            f.seek(0)
+            f.write(header.getvalue())
+            return
+    existing = np.load(path)[:count]
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        np.save(f, np.concatenate([existing, values.astype(existing.dtype)]))
+    os.replace(temp, path)
+
+
+def limit_size(directory, keep=None, max_bytes=None):
+    """Removes the least recently used cached arrays until the cache directory
+    is no larger than the CANDLESTICK_ARRAY_CACHE_MAX_BYTES setting (1GB by
+    default). Arrays are used whenever they are loaded or written."""
+
+    if max_bytes is None:
+        max_bytes = getattr(settings, "CANDLESTICK_ARRAY_CACHE_MAX_BYTES", MAX_BYTES)
+    series = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(path): continue
+        files = [os.path.join(path, f) for f in os.listdir(path)]
+        size = sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+        meta = os.path.join(path, "meta.json")
+        used = os.path.getmtime(meta) if os.path.exists(meta) else 0
+        series.append((used, size, path))
+    total = sum(size for _, size, _ in series)
+    for used, size, path in sorted(series):
+        if total <= max_bytes: break
+        if path == keep: continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
@@ -0,0 +1,87 @@
+from time import time
+from django.db import transaction
+from candlestick.models import Backfill
+from candlestick.providers import period_seconds
+from candlestick.yahoo import get_yahoo_params, get_history_between, index_to_timestamps, upsert_bars
+
+WINDOW_DAYS = {"m": 7, "2m": 7, "5m": 30, "15m": 30, "30m": 30, "H": 90}
+DEFAULT_WINDOW_DAYS = 3650
+
+def backfill(instrument, resolution, start=None, end=None, window=None,
+             restart=False, callback=None):
+    """Gets an instrument's bars for a long range one window at a time, so that
+    only one window of prices is ever held in memory. Each window's bars are
+    upserted and the backfill's position saved in the same transaction, which
+    is committed before the next window is requested.
+
+    The range defaults to all the prices Yahoo has for the resolution, up to
+    now. If an earlier backfill of the instrument and resolution was
+    interrupted, it carries on from its position over its original range,
+    unless restart is True. Windows are given in days, and default to a size
+    that suits the resolution.
+
+    After each window the callback, if there is one, is called with the
+    Backfill and that window's counts. The summed counts are returned."""
+
+    checkpoint = get_checkpoint(
+        instrument, resolution, start=start, end=end, restart=restart
+    )
+    window = (window or get_window(resolution)) * 86400
+    totals = {"inserted": 0, "updated": 0, "unchanged": 0}
+    while not checkpoint.finished:
+        window_end = min(checkpoint.position + window, checkpoint.end)
+        counts = save_window(instrument, resolution, checkpoint, window_end)
+        for key in totals: totals[key] += counts[key]
+        if callback: callback(checkpoint, counts)
+    return totals
+
+
+def get_checkpoint(instrument, resolution, start=None, end=None, restart=False):
+    """Gets the Backfill to carry on from for an instrument and resolution, or
+    starts a new one if there isn't an unfinished one. New backfills start at
+    a midnight."""
+
+    checkpoint = Backfill.objects.filter(
+        instrument=instrument, resolution=resolution
+    ).first()
+    if checkpoint and not checkpoint.finished and not restart:
+        return checkpoint
+    end = int(time()) if end is None else end
+    if start is None:
+        start = end - period_seconds(get_yahoo_params(resolution)[1])
+    start -= start % 86400
+    checkpoint = checkpoint or Backfill(
+        instrument=instrument, resolution=resolution
+    )
+    checkpoint.start, checkpoint.end, checkpoint.position = start, end, start
+    checkpoint.save()
+    return checkpoint
+
+
+def get_window(resolution):
+    """Gets the default number of days to request at once for a resolution -
+    intraday windows are kept within what Yahoo will return in one request."""
+
+    if resolution[0] == "1" and len(resolution) > 1 and resolution[1].isalpha():
+        resolution = resolution[1:]
+    return WINDOW_DAYS.get(resolution, DEFAULT_WINDOW_DAYS)
+
+
+def save_window(instrument, resolution, checkpoint, end):
+    """Requests the prices between a backfill's position and some later
+    timestamp, and upserts the bars which start in that range while moving the
+    position on to it."""
+
+    history = get_history_between(
+        instrument, resolution, checkpoint.position, end
+    )
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    with transaction.atomic():
+        if history is not None and len(history):
+            timestamps = index_to_timestamps(history.index, resolution)
+            counts = upsert_bars(history[
+                (timestamps >= checkpoint.position) & (timestamps < end)
+            ], instrument, resolution)
+        checkpoint.position = end
+        checkpoint.save(update_fields=["position"])
+    return counts
@@ -0,0 +1,134 @@
+import platform
+from datetime import datetime
+from itertools import cycle
+from time import perf_counter
+import django
+import numpy as np
+from django.db import connection, transaction
+from django.test.utils import override_settings
+import candlestick
+from candlestick.models import Instrument, Bar
+from candlestick.providers import SyntheticProvider
+from candlestick.utils import timestamps_to_datetimes, end_timestamps
+from candlestick.yahoo import save_bars, get_bar_arrays, create_bars
+
+NOW = 1624406400
+PROVIDER = "candlestick.providers.SyntheticProvider"
+
+def run_benchmarks(sizes=(10 ** 4,), repeat=20):
+    """Measures how fast bars are saved, updated and queried for tables of
+    several sizes, using made up prices from the synthetic provider, and
+    returns the results as a JSON-serialisable dictionary.
+
+    Everything runs in a transaction which is rolled back afterwards, so the
+    configured database is left as it was."""
+
+    results = {
+        "candlestick": candlestick.__version__, "django": django.__version__,
+        "python": platform.python_version(), "database": connection.vendor,
+        "sizes": {}
+    }
+    with override_settings(
+        CANDLESTICK_PROVIDER=PROVIDER, CANDLESTICK_PROVIDER_OPTIONS={"now": NOW}
+    ):
+        with transaction.atomic():
+            for size in sizes:
+                results["sizes"][str(size)] = benchmark_size(size, repeat)
+            transaction.set_rollback(True)
+    return results
+
+
+def benchmark_size(size, repeat=20):
+    """Runs every benchmark against one instrument with a given number of
+    minute bars."""
+
+    instrument = Instrument.objects.create(
+        symbol="BENCH", exchange=str(size), currency="USD", timezone="UTC"
+    )
+    df = SyntheticProvider(now=NOW).history(
+        [instrument.symbol], "1m", start=NOW - size * 60
+    )[instrument.symbol]
+    results = benchmark_conversion(df, instrument)
+    seconds = timed(lambda: save_bars(df, instrument, "m"))
+    results["save_bars_rows_per_second"] = size / seconds
+    results["latest_price_ms"] = timed(
+        lambda: Instrument.objects.get(id=instrument.id).latest_price, repeat
+    ) * 1000
+    results["latest_bar_scan_ms"] = timed(
+        lambda: instrument.bars.filter(resolution="m").last(), repeat
+    ) * 1000
+    windows = cycle(range(NOW - size * 60, NOW, max(size * 60 // repeat, 60)))
+    results["range_query_ms"] = timed(lambda: range_query(
+        instrument, next(windows)
+    ), repeat) * 1000
+    results["update_ms"] = timed(lambda: instrument.update("m"), 3) * 1000
+    results.update(benchmark_datetimes(instrument))
+    return results
+
+
+def benchmark_conversion(df, instrument, rows=10 ** 5):
+    """Compares the rate at which a dataframe of prices is converted to unsaved
+    bars by the original row by row conversion, kept here as a baseline, and
+    by the vectorised one save_bars uses. Only the first rows are converted,
+    as every bar is kept in memory."""
+
+    df = df.iloc[:rows]
+    return {
+        "row_conversion_rows_per_second": len(df) / timed(
+            lambda: convert_rows(df, instrument, "m")
+        ),
+        "vectorised_conversion_rows_per_second": len(df) / timed(
+            lambda: create_bars(get_bar_arrays(df), instrument, "m")
+        ),
+    }
+
+
+def convert_rows(df, instrument, resolution):
+    """Converts a dataframe of prices to unsaved bars a row at a time, as
+    save_bars originally did."""
+
+    return [Bar(
+        instrument=instrument, resolution=resolution,
+        open=round(bar.Open, 3), close=round(bar.Close, 3),
+        high=round(bar.High, 3), low=round(bar.Low, 3),
+        volume=int(bar.Volume), timestamp=datetime.timestamp(bar.name)
+    ) for bar in df.replace({np.nan: 0}).iloc()]
+
+
+def range_query(instrument, start, seconds=86400):
+    """Loads a day of minute bars as arrays."""
+
+    return instrument.bars.filter(
+        resolution="m", timestamp__gte=start, timestamp__lt=start + seconds
+    ).to_arrays()
+
+
+def benchmark_datetimes(instrument, count=10000):
+    """Compares the rate at which bar datetimes and end timestamps are worked
+    out one bar at a time, and for arrays of bars at once."""
+
+    bars = list(instrument.bars.select_related("instrument")[:count])
+    timestamps = [bar.timestamp for bar in bars]
+    return {
+        "datetime_per_second": len(bars) / timed(
+            lambda: [bar.datetime for bar in bars]
+        ),
+        "end_timestamp_per_second": len(bars) / timed(
+            lambda: [bar.end_timestamp for bar in bars]
+        ),
+        "timestamps_to_datetimes_per_second": len(bars) / timed(
+            lambda: timestamps_to_datetimes(timestamps, instrument.timezone, "m")
+        ),
+        "end_timestamps_per_second": len(bars) / timed(
+            lambda: end_timestamps(timestamps, "m")
+        ),
+    }
+
+
+def timed(func, repeat=1):
+    """Calls a function some number of times and returns the mean number of
+    seconds each call took."""
+
+    start = perf_counter()
+    for _ in range(repeat): func()
+    return max((perf_counter() - start) / repeat, 1e-9)
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from time import time
+from django.db import transaction, close_old_connections
+import candlestick.yahoo as yahoo
+
+def update_concurrently(instruments, resolution, workers=4, timeout=None,
+                        batch_size=50, upsert=False, incremental=False,
+                        callback=None):
+    """Updates many instruments at once. Prices are requested from Yahoo by a
+    pool of worker threads, while the calling thread is the only one to touch
+    the database - it saves results as they arrive, a batch of instruments per
+    transaction.
+
+    If incremental is True, only prices from each instrument's most recent bar
+    onwards are requested and upserted, as with yahoo.update.
+
+    Worker threads close any database connections which have failed or
+    outlived CONN_MAX_AGE before and after each request, as Django does
+    around requests, since the threads may be kept by a long-running process.
+
+    No more than twice as many requests as there are workers are submitted
+    ahead of the saving, so that downloaded prices don't pile up in memory
+    while earlier ones are saved.
+
+    The timeout is applied to each instrument's request - there is no overall
+    deadline. An instrument which fails does not affect the others - the error
+    is passed to the callback (along with the symbol and seconds taken) in
+    place of the saved bars.
+
+    A summary of the update, with throughput figures, is returned."""
+
+    instruments = list(instruments)
+    lasts = yahoo.get_last_timestamps(instruments, resolution)
+    summary = {"symbols": 0, "bars": 0, "errors": 0}
+    started, pending = time(), []
+
+    def download(instrument):
+        begin, last = time(), lasts.get(instrument.id)
+        start = last if incremental or last is None else (
+            yahoo.get_start_date(last, resolution)
+        )
+        close_old_connections()
+        try:
+            history = yahoo.get_history(
+                instrument, resolution, start=start, timeout=timeout
+            )
+        except Exception as e: history = e
+        finally: close_old_connections()
+        return instrument, history, start, begin
+
+    def report(instrument, result, begin):
+        if isinstance(result, Exception):
+            summary["errors"] += 1
+        else:
+            summary["symbols"] += 1
+            summary["bars"] += count_saved(result)
+        if callback: callback(instrument.symbol, result, time() - begin)
+
+    def flush():
+        with transaction.atomic():
+            for instrument, history, start, begin in pending:
+                try:
+                    with transaction.atomic():
+                        if start is None:
+                            result = yahoo.save_history(
+                                history, instrument, resolution,
+                                upsert=upsert or incremental
+                            )
+                        else:
+                            result = yahoo.save_update(
+                                history, instrument, resolution, start,
+                                upsert=upsert, incremental=incremental
+                            )
+                except Exception as e: result = e
+                report(instrument, result, begin)
+        pending.clear()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        remaining, running = iter(instruments), set()
+        while True:
+            for instrument in islice(remaining, workers * 2 - len(running)):
+                running.add(executor.submit(download, instrument))
+            if not running: break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                instrument, history, start, begin = future.result()
+                if isinstance(history, Exception):
+                    report(instrument, history, begin)
+                else:
+                    pending.append((instrument, history, start, begin))
+                if len(pending) >= batch_size: flush()
+    if pending: flush()
+    summary["seconds"] = time() - started
+    duration = summary["seconds"] or 1e-9
+    summary["symbols_per_second"] = summary["symbols"] / duration
+    summary["bars_per_second"] = summary["bars"] / duration
+    return summary
+
+
+def count_saved(saved):
+    """Gets the number of bars written from the result of saving bars - either
+    the timestamps of the bars saved or a dictionary of upsert counts."""
+
+    if isinstance(saved, dict): return saved["inserted"] + saved["updated"]
+    return len(saved)
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models
+
+PRICE_SCALE = 1000
+MAX_PRICE = (2 ** 31 - 1) / PRICE_SCALE
+UNITS = "smHDWMY"
+
+def compact_storage():
+    """Whether prices and resolutions are stored in compact form, according to
+    the CANDLESTICK_COMPACT_STORAGE setting. This decides the database column
+    types, so must be set before migrating and not changed afterwards."""
+
+    return getattr(settings, "CANDLESTICK_COMPACT_STORAGE", False)
+
+
+def encode_resolution(resolution):
+    """Converts a resolution like 15m to a small integer - eight times its
+    number of periods plus the position of its unit."""
+
+    digits = resolution[:-1]
+    return int(digits or 0) * 8 + UNITS.index(resolution[-1])
+
+
+def decode_resolution(code):
+    """Converts a small integer back to the resolution it was encoded from."""
+
+    count, unit = divmod(int(code), 8)
+    return f"{count or ''}{UNITS[unit]}"
+
+
+
+class PriceField(models.FloatField):
+    """A price, which is a float in Python. With compact storage it is stored
+    as a 4-byte integer number of thousandths, so prices are limited to three
+    decimal places and a little over two million - otherwise it is stored as
+    a double like any FloatField. Prices too large for compact storage fail
+    validation, and raise a ValueError if saved without it."""
+
+    def db_type(self, connection):
+        if compact_storage():
+            return models.IntegerField().db_type(connection)
+        return super().db_type(connection)
+
+
+    def validate(self, value, model_instance):
+        super().validate(value, model_instance)
+        if value is not None and compact_storage() and abs(value) > MAX_PRICE:
+            raise ValidationError(
+                f"{self.verbose_name.title()} is too large for compact storage "
+                f"(the maximum is {MAX_PRICE:,})"
+            )
+
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None or not compact_storage(): return value
+        if abs(value) > MAX_PRICE:
+            raise ValueError(f"Price {value} is too large for compact storage")
+        return int(round(value * PRICE_SCALE))
+
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or not compact_storage(): return value
+        return value / PRICE_SCALE
+
+
+
+class ResolutionField(models.CharField):
+    """A resolution, which is a string like 15m in Python. With compact storage
+    it is stored as a 2-byte integer code - otherwise it is stored as text like
+    any CharField."""
+
+    def db_type(self, connection):
+        if compact_storage():
+            return models.SmallIntegerField().db_type(connection)
+        return super().db_type(connection)
+
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None or not compact_storage(): return value
+        return encode_resolution(value)
+
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or not compact_storage(): return value
+        return decode_resolution(value)
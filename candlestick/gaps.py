@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+from candlestick.backfill import get_window
+from candlestick.models import Bar
+from candlestick.utils import end_timestamps, resolution_seconds, resolution_months
+from candlestick.yahoo import get_history_between, index_to_timestamps, upsert_bars
+
+def find_gaps(instrument, resolution, start=None, end=None):
+    """Finds the ranges of time missing from an instrument's bars of a
+    resolution, as a list of (start, end) timestamps - each from the end of
+    the bar before a gap to the start of the bar after it. Only gaps between
+    bars are found, optionally only those between bars from the start
+    timestamp and before the end timestamp.
+
+    Bars are compared with the bar before them in the database, with a LAG
+    window, and only pairs further apart than one period are returned. Those
+    are then checked against the instrument's calendar in Python - if the
+    instrument has a timezone it is taken to trade on weekdays there, so
+    nights and weekends without bars are not gaps, and a gap between intraday
+    bars on different days is only found if a whole weekday is missing.
+    Instruments without a timezone are expected to have a bar every period.
+    Holidays are not known, so a missing weekday may just have been one."""
+
+    pairs = np.array(get_bar_pairs(instrument, resolution, start, end), dtype="int64")
+    if not len(pairs): return []
+    previous, timestamps = pairs[:, 0], pairs[:, 1]
+    ends = end_timestamps(previous, resolution)
+    missing = timestamps > ends
+    if instrument.timezone and resolution[-1] in "smHD":
+        missing &= weekdays_between(previous, timestamps, instrument.timezone, resolution)
+    return [(int(s), int(e)) for s, e in zip(ends[missing], timestamps[missing])]
+
+
+def get_bar_pairs(instrument, resolution, start=None, end=None):
+    """Gets the timestamps of each of an instrument's bars of a resolution
+    and the bar before it, wherever they are more than the shortest possible
+    period apart, in one query."""
+
+    bars = Bar.objects.filter(instrument=instrument, resolution=resolution)
+    if start is not None: bars = bars.filter(timestamp__gte=start)
+    if end is not None: bars = bars.filter(timestamp__lt=end)
+    bars = bars.annotate(previous=Window(
+        Lag("timestamp"), order_by=F("timestamp").asc()
+    )).order_by().values_list("previous", "timestamp")
+    sql, params = bars.query.sql_with_params()
+    q = connection.ops.quote_name
+    length = resolution_seconds(resolution) or resolution_months(resolution) * 28 * 86400
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {q('previous')}, {q('timestamp')} FROM ({sql}) {q('pairs')} "
+            f"WHERE {q('timestamp')} - {q('previous')} > %s ORDER BY {q('timestamp')}",
+            [*params, length]
+        )
+        return cursor.fetchall()
+
+
+def weekdays_between(previous, timestamps, timezone, resolution):
+    """Whether there is a whole weekday between each of two arrays of bar
+    timestamps, in a timezone - or for intraday bars, whether they are on the
+    same day there, in which case any gap between them is within the day's
+    trading."""
+
+    first, last = [local_dates(t, timezone, resolution) for t in [previous, timestamps]]
+    return (first == last) | (
+        np.busday_count(first + 1, np.maximum(first + 1, last)) > 0
+    )
+
+
+def local_dates(timestamps, timezone, resolution):
+    """Gets the dates of an array of bar timestamps in a timezone - bars of D
+    and above are already timestamped with their date's UTC midnight."""
+
+    if resolution[-1] in "DWMY":
+        return timestamps.astype("datetime64[s]").astype("datetime64[D]")
+    index = pd.to_datetime(timestamps, unit="s", utc=True).tz_convert(timezone)
+    return index.tz_localize(None).values.astype("datetime64[D]")
+
+
+def merge_gaps(gaps, window):
+    """Combines gaps into ranges to be requested, joining gaps together where
+    the range covering them would be no longer than the window, and
+    splitting gaps longer than the window."""
+
+    ranges = []
+    for start, end in gaps:
+        if ranges and end - ranges[-1][0] <= window:
+            ranges[-1] = (ranges[-1][0], end)
+            continue
+        while end - start > window:
+            ranges.append((start, start + window))
+            start += window
+        ranges.append((start, end))
+    return ranges
+
+
+def repair_gaps(instrument, resolution, gaps=None, window=None, callback=None):
+    """Requests the prices missing from an instrument's bars of a resolution
+    and upserts them, rather than refetching everything. Gaps are found with
+    find_gaps if they aren't given, and requested together where they are
+    close enough to fit in one window of days - which defaults to the
+    backfill window for the resolution.
+
+    After each request the callback, if there is one, is called with the
+    range requested and the counts of bars saved. The summed counts are
+    returned. Yahoo may not have prices for a gap, if it is older than it
+    keeps for the resolution or was a holiday, in which case nothing is
+    saved."""
+
+    if gaps is None: gaps = find_gaps(instrument, resolution)
+    window = (window or get_window(resolution)) * 86400
+    totals = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for start, end in merge_gaps(gaps, window):
+        counts = save_range(instrument, resolution, start, end)
+        for key in totals: totals[key] += counts[key]
+        if callback: callback((start, end), counts)
+    return totals
+
+
+def save_range(instrument, resolution, start, end):
+    """Requests the prices between two timestamps and upserts the bars which
+    start in that range."""
+
+    history = get_history_between(instrument, resolution, start, end)
+    if history is None or not len(history):
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+    timestamps = index_to_timestamps(history.index, resolution)
+    with transaction.atomic():
+        return upsert_bars(history[
+            (timestamps >= start) & (timestamps < end)
+        ], instrument, resolution)
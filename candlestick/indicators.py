@@ -0,0 +1,230 @@
+import json
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from candlestick.resample import period_starts
+
+DEFAULT_PERIODS = {"sma": 20, "ema": 20, "rsi": 14, "atr": 14}
+BATCH_SIZE = 1000
+
+def sma(arrays, period=20, state=None):
+    """The simple moving average of close prices - the mean of each close and
+    the period - 1 before it. Rolling sums are taken from one cumulative sum,
+    so this is O(n) whatever the period."""
+
+    state = state or {"tail": []}
+    values = np.concatenate([state["tail"], arrays["close"]])
+    sums = np.concatenate([[0], np.cumsum(values)])
+    means = np.full(len(values), np.nan)
+    means[period - 1:] = (sums[period:] - sums[:-period]) / period
+    tail = values[max(len(values) - period + 1, 0):] if period > 1 else []
+    return means[len(state["tail"]):], {"tail": list(tail)}
+
+
+def ema(arrays, period=20, state=None):
+    """The exponential moving average of close prices, with a smoothing factor
+    of 2 / (period + 1). It starts at the period's bar, from the simple
+    average of the first period closes."""
+
+    return seeded_average(arrays["close"], period, 2 / (period + 1), state)
+
+
+def rsi(arrays, period=14, state=None):
+    """The relative strength index of close prices, from Wilder's smoothed
+    averages of gains and losses between closes. It starts one bar after the
+    period's bar, as the first bar has no change."""
+
+    state = state or {"close": None, "gain": None, "loss": None}
+    closes = np.asarray(arrays["close"], dtype="float64")
+    if not len(closes): return np.empty(0), state
+    previous = closes[:1] if state["close"] is None else [state["close"]]
+    changes = np.diff(np.concatenate([previous, closes]))
+    if state["close"] is None: changes = changes[1:]
+    gains, gain = seeded_average(
+        np.maximum(changes, 0), period, 1 / period, state["gain"]
+    )
+    losses, loss = seeded_average(
+        np.maximum(-changes, 0), period, 1 / period, state["loss"]
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(losses == 0, 100.0, 100 - 100 / (1 + gains / losses))
+    values[np.isnan(gains)] = np.nan
+    if state["close"] is None: values = np.concatenate([[np.nan], values])
+    return values, {"close": float(closes[-1]), "gain": gain, "loss": loss}
+
+
+def atr(arrays, period=14, state=None):
+    """The average true range, from Wilder's smoothed average of each bar's
+    true range - its high to low, extended to the previous close if that was
+    outside it."""
+
+    state = state or {"close": None, "average": None}
+    highs = np.asarray(arrays["high"], dtype="float64")
+    lows = np.asarray(arrays["low"], dtype="float64")
+    if not len(highs): return np.empty(0), state
+    closes = np.asarray(arrays["close"], dtype="float64")
+    previous = np.concatenate([
+        [np.nan if state["close"] is None else state["close"]], closes[:-1]
+    ])
+    ranges = np.fmax(highs, previous) - np.fmin(lows, previous)
+    values, average = seeded_average(ranges, period, 1 / period, state["average"])
+    return values, {"close": float(closes[-1]), "average": average}
+
+
+def vwap(arrays, period=None, state=None, anchor="D"):
+    """The volume weighted average price - the typical price of bars, (high +
+    low + close) / 3, weighted by volume, since the start of the anchor
+    resolution's period. Periods start at UTC midnight by default, and
+    passing None as the anchor accumulates over the whole series."""
+
+    state = state or {"start": None, "price_volume": 0, "volume": 0}
+    timestamps = np.asarray(arrays["timestamp"], dtype="int64")
+    if not len(timestamps): return np.empty(0), state
+    typical = (np.asarray(arrays["high"], dtype="float64") + arrays["low"] + arrays["close"]) / 3
+    volumes = np.array(arrays["volume"], dtype="float64")
+    starts = np.zeros(len(timestamps), dtype="int64") if anchor is None else (
+        period_starts(timestamps, anchor)
+    )
+    resets = np.concatenate([[starts[0] != state["start"]], starts[1:] != starts[:-1]])
+    price_volumes = typical * volumes
+    if not resets[0]:
+        price_volumes[0] += state["price_volume"]
+        volumes[0] += state["volume"]
+    price_volume_sums, volume_sums = np.cumsum(price_volumes), np.cumsum(volumes)
+    first = np.maximum.accumulate(np.where(resets, np.arange(len(resets)), 0))
+    price_volume_sums -= (price_volume_sums - price_volumes)[first]
+    volume_sums -= (volume_sums - volumes)[first]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = price_volume_sums / volume_sums
+    return values, {
+        "start": int(starts[-1]), "price_volume": float(price_volume_sums[-1]),
+        "volume": float(volume_sums[-1])
+    }
+
+
+INDICATORS = {"sma": sma, "ema": ema, "rsi": rsi, "atr": atr, "vwap": vwap}
+
+def seeded_average(values, period, alpha, state=None):
+    """An exponentially smoothed average, which starts at the period's value
+    from the simple average of the first period values - the shared basis of
+    EMA, RSI and ATR. The smoothing itself is done by Pandas in one O(n) pass.
+
+    Until the average has started, the state keeps every value so far, so
+    that the first average can be made when there are enough."""
+
+    state = state or {"tail": [], "last": None}
+    values = np.asarray(values, dtype="float64")
+    if state["last"] is not None:
+        averages = smooth(values, alpha, state["last"])
+        last = float(averages[-1]) if len(averages) else state["last"]
+        return averages, {"tail": [], "last": last}
+    values = np.concatenate([state["tail"], values])
+    averages = np.full(len(values), np.nan)
+    if len(values) < period:
+        return averages[len(state["tail"]):], {"tail": list(values), "last": None}
+    averages[period - 1] = values[:period].mean()
+    averages[period:] = smooth(values[period:], alpha, averages[period - 1])
+    return averages[len(state["tail"]):], {"tail": [], "last": float(averages[-1])}
+
+
+def smooth(values, alpha, initial):
+    """Exponentially smooths values, carrying on from an initial average."""
+
+    if not len(values): return np.empty(0)
+    return pd.Series(np.concatenate([[initial], values])).ewm(
+        alpha=alpha, adjust=False
+    ).mean().to_numpy()[1:]
+
+
+def parse_name(name):
+    """Splits an indicator name like rsi_14 into its function and period. The
+    default period is used if none is given."""
+
+    kind, separator, period = name.partition("_")
+    default = DEFAULT_PERIODS.get(kind)
+    if kind not in INDICATORS or separator and not (
+        default and period.isdigit() and int(period) > 0
+    ):
+        raise ValueError(
+            f"Indicator {name} is not valid - must be one of {', '.join(INDICATORS)}, "
+            "optionally with a period, like rsi_14"
+        )
+    return INDICATORS[kind], int(period) if period else default
+
+
+def compute(arrays, name, state=None):
+    """Computes an indicator, named like sma_20, over a dictionary of bar
+    arrays, like those from BarQuerySet.to_arrays. An array of values, one
+    per bar, is returned along with the state needed to carry on from the
+    last bar - if the state is passed back in with the arrays of later bars,
+    only those bars are computed. Values are NaN where there are not yet
+    enough bars."""
+
+    func, period = parse_name(name)
+    return func(arrays, period, state)
+
+
+def load_indicator(instrument, resolution, name):
+    """Loads an indicator's values over an instrument's bars of a resolution,
+    as a dictionary of timestamp and value arrays.
+
+    Values are saved, along with the state they were computed with, so that
+    only bars saved since they were last loaded have to be computed - the
+    state is kept from before the latest bar, so that the latest bar is
+    recomputed too in case an incremental update has changed it. If any
+    earlier bars have been added or removed since, every value is
+    recomputed."""
+
+    from candlestick.models import Indicator
+    parse_name(name)
+    with transaction.atomic():
+        indicator, _ = Indicator.objects.select_for_update().get_or_create(
+            instrument=instrument, resolution=resolution, name=name,
+            defaults={"timestamp": None, "count": 0, "state": "null"}
+        )
+        update_indicator(indicator)
+    rows = list(indicator.values.values_list("timestamp", "value"))
+    return {
+        "timestamp": np.array([row[0] for row in rows], dtype="int64"),
+        "value": np.array([row[1] for row in rows], dtype="float64")
+    }
+
+
+def update_indicator(indicator):
+    """Computes and saves an indicator's values for bars from its latest
+    computed bar onwards, or for all bars if earlier bars have changed."""
+
+    from candlestick.models import Bar, IndicatorValue
+    bars = Bar.objects.filter(
+        instrument_id=indicator.instrument_id, resolution=indicator.resolution
+    )
+    state = json.loads(indicator.state)
+    if indicator.timestamp is None or bars.filter(
+        timestamp__lt=indicator.timestamp
+    ).count() != indicator.count:
+        state, indicator.timestamp, indicator.count = None, None, 0
+        indicator.values.all().delete()
+    else:
+        bars = bars.filter(timestamp__gte=indicator.timestamp)
+        indicator.values.filter(timestamp__gte=indicator.timestamp).delete()
+    arrays = bars.to_arrays()
+    if not len(arrays["timestamp"]): return indicator.save()
+    values, state = compute(
+        {field: array[:-1] for field, array in arrays.items()},
+        indicator.name, state
+    )
+    last, _ = compute(
+        {field: array[-1:] for field, array in arrays.items()},
+        indicator.name, state
+    )
+    values = np.concatenate([values, last])
+    IndicatorValue.objects.bulk_create([IndicatorValue(
+        indicator=indicator, timestamp=timestamp,
+        value=None if np.isnan(value) else value
+    ) for timestamp, value in zip(
+        arrays["timestamp"].tolist(), values.tolist()
+    )], batch_size=BATCH_SIZE)
+    indicator.count += len(values) - 1
+    indicator.timestamp = int(arrays["timestamp"][-1])
+    indicator.state = json.dumps(state)
+    indicator.save()
@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from candlestick.models import Instrument
+
+FIELDS = ["symbol", "name", "exchange", "currency", "timezone", "category"]
+UPDATE_FIELDS = ["name", "currency", "timezone", "category"]
+BATCH_SIZE = 1000
+
+def read_instruments(path):
+    """Reads instrument rows from a CSV file with a header row, or a JSON file
+    of either a list of objects or a Django fixture, as a list of
+    dictionaries."""
+
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="") as f:
+        if extension == ".csv": return list(csv.DictReader(f))
+        if extension == ".json":
+            return [row.get("fields", row) for row in json.load(f)]
+    raise ValueError(f"Cannot read instruments from {path} - must be .csv or .json")
+
+
+def import_instruments(rows, batch_size=BATCH_SIZE):
+    """Creates or updates instruments from dictionaries of their fields, with
+    existing instruments matched on symbol and exchange. Blank values are
+    saved as null, and if the same instrument appears more than once, the
+    last row for it is used.
+
+    Every row is validated first, without any queries, and if any are
+    invalid a ValidationError listing them is raised and nothing is saved.
+    Instruments are then looked up, created and updated a batch at a time. A
+    dictionary with the number of instruments created, updated and unchanged
+    is returned."""
+
+    instruments = {}
+    for instrument in clean_rows(rows):
+        instruments[(instrument.symbol, instrument.exchange)] = instrument
+    instruments = list(instruments.values())
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    with transaction.atomic():
+        for start in range(0, len(instruments), batch_size):
+            batch = instruments[start:start + batch_size]
+            existing = {(i.symbol, i.exchange): i for i in Instrument.objects.filter(
+                symbol__in={instrument.symbol for instrument in batch}
+            )}
+            new, changed = [], []
+            for instrument in batch:
+                old = existing.get((instrument.symbol, instrument.exchange))
+                if old is None:
+                    new.append(instrument)
+                elif any(
+                    str(getattr(old, f)) != str(getattr(instrument, f))
+                    for f in UPDATE_FIELDS
+                ):
+                    instrument.id = old.id
+                    changed.append(instrument)
+            Instrument.objects.bulk_create(new)
+            Instrument.objects.bulk_update(changed, UPDATE_FIELDS)
+            counts["created"] += len(new)
+            counts["updated"] += len(changed)
+            counts["unchanged"] += len(batch) - len(new) - len(changed)
+    return counts
+
+
+def clean_rows(rows):
+    """Creates unsaved instruments from dictionaries of their fields and
+    validates their fields, collecting the errors of every row rather than
+    stopping at the first. Uniqueness isn't checked here, as rows are matched
+    to existing instruments when saved."""
+
+    instruments, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        unknown = set(row) - set(FIELDS)
+        if unknown:
+            errors.append(f"Row {number}: unknown fields {', '.join(sorted(unknown))}")
+            continue
+        instrument = Instrument(**{
+            field: None if value in ["", None] else value
+            for field, value in row.items()
+        })
+        try:
+            instrument.full_clean(validate_unique=False)
+        except ValidationError as e:
+            errors += [
+                f"Row {number}: {field} - {' '.join(messages)}"
+                for field, messages in e.message_dict.items()
+            ]
+        instruments.append(instrument)
+    if errors: raise ValidationError(errors)
+    return instruments
@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from candlestick.metrics import profile, format_profile
+from candlestick.models import Instrument
+from candlestick.utils import describe_saved, date_to_timestamp
+from time import time
+
+class Command(BaseCommand):
+    help = "Gets data for an instrument over a long range, a window at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbol", type=str)
+        parser.add_argument("resolution", type=str)
+        parser.add_argument(
+            "--start", type=str, default=None,
+            help="Date to start from (YYYY-MM-DD) - all available by default"
+        )
+        parser.add_argument(
+            "--end", type=str, default=None,
+            help="Date to stop at (YYYY-MM-DD) - now by default"
+        )
+        parser.add_argument(
+            "--window", type=int, default=None,
+            help="Number of days to request and save at a time"
+        )
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Start again rather than carrying on from an interrupted backfill"
+        )
+        parser.add_argument(
+            "--profile", action="store_true",
+            help="Print the time taken by each stage of getting and saving bars"
+        )
+
+
+    def handle(self, *args, **options):
+        symbol = options["symbol"]
+        try:
+            instrument = Instrument.objects.get(symbol=symbol)
+        except Instrument.DoesNotExist:
+            raise CommandError('Instrument "%s" does not exist' % symbol)
+        start = time()
+        with profile() as records:
+            counts = instrument.backfill(
+                options["resolution"], start=self.parse_date(options["start"]),
+                end=self.parse_date(options["end"]), window=options["window"],
+                restart=options["restart"], callback=self.report
+            )
+        duration = round(time() - start, 2)
+        self.stdout.write(self.style.SUCCESS(
+            f"{describe_saved(counts, options['resolution'])} for {symbol} ({duration}s)"
+        ))
+        if options["profile"]: self.stdout.write(format_profile(records))
+
+
+    def report(self, backfill, counts):
+        """Writes the progress of a backfill after each window."""
+
+        date = datetime.fromtimestamp(backfill.position, timezone.utc).date()
+        self.stdout.write(
+            f"{backfill.instrument.symbol}: {backfill.progress:.0%} "
+            f"(to {date}) - {describe_saved(counts, backfill.resolution)}"
+        )
+
+
+    def parse_date(self, date):
+        """Converts a YYYY-MM-DD date to a UNIX timestamp."""
+
+        if date is None: return None
+        try:
+            return date_to_timestamp(date)
+        except ValueError:
+            raise CommandError(f'"{date}" is not a valid date (YYYY-MM-DD)')
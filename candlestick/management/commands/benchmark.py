@@ -0,0 +1,31 @@
+import json
+from django.core.management.base import BaseCommand
+from candlestick.benchmark import run_benchmarks
+
+class Command(BaseCommand):
+    help = "Measures ingestion and query speed using made up prices"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=str, default="10000",
+            help="Comma separated numbers of bars to benchmark with"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20,
+            help="Number of times to repeat each query"
+        )
+        parser.add_argument(
+            "--output", type=str, default=None,
+            help="File to write the JSON results to, rather than stdout"
+        )
+
+
+    def handle(self, *args, **options):
+        sizes = [int(float(size)) for size in options["sizes"].split(",")]
+        results = json.dumps(
+            run_benchmarks(sizes, repeat=options["repeat"]), indent=4
+        )
+        if options["output"]:
+            with open(options["output"], "w") as f: f.write(results)
+        else:
+            self.stdout.write(results)
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from candlestick.scheduler import Scheduler, acquire_lock, DELAY, SPREAD, REFRESH
+from candlestick.utils import describe_saved
+
+class Command(BaseCommand):
+    help = "Keeps instruments up to date, updating each just after its bars close"
+
+    def add_arguments(self, parser):
+        parser.add_argument("resolutions", type=str)
+        parser.add_argument(
+            "--symbols", type=str, default=None,
+            help="Comma separated symbols to update - all instruments by default"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="Number of threads to request prices with concurrently"
+        )
+        parser.add_argument(
+            "--spread", type=float, default=SPREAD,
+            help="Seconds to stagger requests for instruments due together over"
+        )
+        parser.add_argument(
+            "--delay", type=float, default=DELAY,
+            help="Seconds to wait after a bar closes before requesting it"
+        )
+        parser.add_argument(
+            "--refresh", type=float, default=REFRESH,
+            help="Seconds between reloading the list of instruments"
+        )
+        parser.add_argument(
+            "--lock", type=str, default=None,
+            help="Lock file which stops more than one scheduler running at once"
+        )
+
+
+    def handle(self, *args, **options):
+        lock = acquire_lock(options["lock"])
+        if lock is None:
+            raise CommandError("Another scheduler is already running")
+
+        def callback(resolution, symbol, result, duration):
+            if isinstance(result, Exception):
+                self.stdout.write(self.style.ERROR(f"{symbol}: {str(result)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{describe_saved(result, resolution)} for {symbol} ({round(duration, 2)}s)"
+                ))
+
+        scheduler = Scheduler(
+            options["resolutions"].split(","),
+            symbols=options["symbols"].split(",") if options["symbols"] else None,
+            workers=options["workers"], spread=options["spread"],
+            delay=options["delay"], refresh=options["refresh"], callback=callback
+        )
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            self.stdout.write("Scheduler stopped")
+        finally:
+            lock.close()
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from candlestick.partitioning import is_partitioned, create_partitions
+from candlestick.partitioning import drop_partitions, get_resolutions
+from candlestick.utils import date_to_timestamp
+
+class Command(BaseCommand):
+    help = "Creates monthly bar partitions ahead of time on PostgreSQL"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=3,
+            help="Number of months ahead to create partitions for"
+        )
+        parser.add_argument(
+            "--drop-before", type=str, default=None,
+            help="Drop partitions of bars from before this date (YYYY-MM-DD)"
+        )
+
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError(
+                "Bars are not partitioned - set CANDLESTICK_PARTITION_BARS "
+                "and migrate on PostgreSQL first"
+            )
+        for name in create_partitions(months=options["months"]):
+            self.stdout.write(f"Created {name}")
+        if options["drop_before"]:
+            try:
+                before = date_to_timestamp(options["drop_before"])
+            except ValueError:
+                raise CommandError(
+                    f'"{options["drop_before"]}" is not a valid date (YYYY-MM-DD)'
+                )
+            for resolution in get_resolutions():
+                for name in drop_partitions(resolution, before):
+                    self.stdout.write(f"Dropped {name}")
+        self.stdout.write(self.style.SUCCESS("Partitions are up to date"))
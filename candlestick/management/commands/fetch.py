@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand, CommandError
+from candlestick.metrics import profile, format_profile
 from candlestick.models import Instrument
+from candlestick.utils import describe_saved
 from time import time
 
 class Command(BaseCommand):
@@ -9,6 +11,14 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("symbol", type=str)
         parser.add_argument("resolution", type=str)
+        parser.add_argument(
+            "--upsert", action="store_true",
+            help="Update existing bars in place instead of replacing them"
+        )
+        parser.add_argument(
+            "--profile", action="store_true",
+            help="Print the time taken by each stage of getting and saving bars"
+        )
 
 
     def handle(self, *args, **options):
@@ -19,10 +29,14 @@ class Command(BaseCommand):
             raise CommandError('Instrument "%s" does not exist' % symbol)
         try:
             start = time()
-            bars = instrument.fetch(options["resolution"])
+            with profile() as records:
+                bars = instrument.fetch(
+                    options["resolution"], upsert=options["upsert"]
+                )
             duration = round(time() - start, 2)
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"{symbol}: {str(e)}"))
         self.stdout.write(self.style.SUCCESS(
-            f"{len(bars)} {options['resolution']} bar{'' if len(bars) == 1 else 's'} saved for {symbol} ({duration}s)"
-        ))
\ No newline at end of file
+            f"{describe_saved(bars, options['resolution'])} for {symbol} ({duration}s)"
+        ))
+        if options["profile"]: self.stdout.write(format_profile(records))
\ No newline at end of file
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from candlestick.models import Instrument
+from candlestick.utils import describe_saved, date_to_timestamp
+from time import time
+
+class Command(BaseCommand):
+    help = "Finds, and optionally repairs, missing bars of instruments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", type=str)
+        parser.add_argument("resolution", type=str)
+        parser.add_argument(
+            "--start", type=str, default=None,
+            help="Only look for gaps from this date (YYYY-MM-DD)"
+        )
+        parser.add_argument(
+            "--end", type=str, default=None,
+            help="Only look for gaps before this date (YYYY-MM-DD)"
+        )
+        parser.add_argument(
+            "--repair", action="store_true",
+            help="Request the missing prices and save them"
+        )
+        parser.add_argument(
+            "--window", type=int, default=None,
+            help="Number of days to request at a time when repairing"
+        )
+
+
+    def handle(self, *args, **options):
+        if options["symbols"] == "all":
+            instruments = Instrument.objects.all()
+        else:
+            symbols = options["symbols"].split(",")
+            instruments = Instrument.objects.filter(symbol__in=symbols)
+            missing = set(symbols) - {i.symbol for i in instruments}
+            if missing:
+                raise CommandError('Instrument "%s" does not exist' % sorted(missing)[0])
+        resolution = options["resolution"]
+        for instrument in instruments:
+            start = time()
+            gaps = instrument.find_gaps(
+                resolution, start=self.parse_date(options["start"]),
+                end=self.parse_date(options["end"])
+            )
+            for gap in gaps:
+                self.stdout.write(f"{instrument.symbol}: {self.describe_range(gap)}")
+            message = f"{len(gaps)} gap{'' if len(gaps) == 1 else 's'} in {resolution} bars for {instrument.symbol}"
+            if options["repair"] and gaps:
+                counts = instrument.repair_gaps(
+                    resolution, gaps=gaps, window=options["window"]
+                )
+                message += f" - {describe_saved(counts, resolution)}"
+            duration = round(time() - start, 2)
+            self.stdout.write(self.style.SUCCESS(f"{message} ({duration}s)"))
+
+
+    def describe_range(self, gap):
+        """Describes a gap as the UTC datetimes it is between."""
+
+        return " to ".join(str(
+            datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+        ) for timestamp in gap)
+
+
+    def parse_date(self, date):
+        """Converts a YYYY-MM-DD date to a UNIX timestamp."""
+
+        if date is None: return None
+        try:
+            return date_to_timestamp(date)
+        except ValueError:
+            raise CommandError(f'"{date}" is not a valid date (YYYY-MM-DD)')
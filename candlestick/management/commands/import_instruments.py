@@ -0,0 +1,29 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from candlestick.instruments import read_instruments, import_instruments
+from time import time
+
+class Command(BaseCommand):
+    help = "Creates or updates instruments from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=str)
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of instruments to look up and save at a time"
+        )
+
+
+    def handle(self, *args, **options):
+        start = time()
+        try:
+            rows = read_instruments(options["path"])
+            counts = import_instruments(rows, batch_size=options["batch_size"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError("\n".join(e.messages))
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['created']} instruments created, {counts['updated']} updated, "
+            f"{counts['unchanged']} unchanged ({round(time() - start, 2)}s)"
+        ))
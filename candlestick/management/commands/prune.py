@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from candlestick.retention import prune_all
+from candlestick.yahoo import BATCH_SIZE
+from time import time
+
+class Command(BaseCommand):
+    help = "Resamples and deletes old bars according to retention settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=BATCH_SIZE,
+            help="Number of bars to delete per transaction"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Count the bars which would be deleted without changing anything"
+        )
+
+
+    def handle(self, *args, **options):
+        start = time()
+        verb = "would be deleted" if options["dry_run"] else "deleted"
+        counts = prune_all(
+            batch_size=options["batch_size"], dry_run=options["dry_run"],
+            callback=lambda resolution, count: self.stdout.write(
+                f"{count} {resolution} bar{'' if count == 1 else 's'} {verb}"
+            )
+        )
+        duration = round(time() - start, 2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {len(counts)} resolution{'' if len(counts) == 1 else 's'} ({duration}s)"
+        ))
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand, CommandError
+from candlestick.metrics import profile, format_profile
 from candlestick.models import Instrument
+from candlestick.utils import describe_saved
 from time import time
 
 class Command(BaseCommand):
@@ -8,23 +10,125 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("symbols", type=str)
         parser.add_argument("resolution", type=str)
+        parser.add_argument(
+            "--upsert", action="store_true",
+            help="Update existing bars in place instead of replacing them"
+        )
+        parser.add_argument(
+            "--incremental", action="store_true",
+            help="Only request prices from the most recent bar onwards"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=0,
+            help="Number of threads to request prices with concurrently"
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=None,
+            help="Seconds to wait for each symbol's prices (with --workers) - not an overall deadline"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=50,
+            help="Symbols to save per transaction (with --workers)"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=0,
+            help="Request prices for this many symbols at a time"
+        )
+        parser.add_argument(
+            "--profile", action="store_true",
+            help="Print the time taken by each stage of getting and saving bars"
+        )
 
 
     def handle(self, *args, **options):
-        symbols = options["symbols"].split(",")
+        with profile() as records:
+            self.update(options)
+        if options["profile"]: self.stdout.write(format_profile(records))
+
+
+    def update(self, options):
         if options["symbols"] == "all":
-            symbols = Instrument.objects.all().values_list("symbol", flat=True)
-        for symbol in symbols:
-            try:
-                instrument = Instrument.objects.get(symbol=symbol)
-            except Instrument.DoesNotExist:
-                raise CommandError('Instrument "%s" does not exist' % symbol)
+            instruments = list(Instrument.objects.all())
+        else:
+            instruments = self.get_instruments(options["symbols"].split(","))
+        if options["workers"] > 0: return self.handle_concurrently(
+            instruments, options
+        )
+        if options["chunk_size"] > 0: return self.handle_chunks(
+            instruments, options
+        )
+        for instrument in instruments:
+            symbol = instrument.symbol
             try:
                 start = time()
-                bars = instrument.update(options["resolution"])
+                bars = instrument.update(
+                    options["resolution"], upsert=options["upsert"],
+                    incremental=options["incremental"]
+                )
                 duration = round(time() - start, 2)
                 self.stdout.write(self.style.SUCCESS(
-                    f"{len(bars)} {options['resolution']} bar{'' if len(bars) == 1 else 's'} saved for {symbol} ({duration}s)"
+                    f"{describe_saved(bars, options['resolution'])} for {symbol} ({duration}s)"
                 ))
             except Exception as e:
-                self.stdout.write(self.style.ERROR(f"{symbol}: {str(e)}"))
\ No newline at end of file
+                self.stdout.write(self.style.ERROR(f"{symbol}: {str(e)}"))
+
+
+    def get_instruments(self, symbols):
+        """Looks up the instruments for several symbols in one query, in the
+        order the symbols were given."""
+
+        instruments = {}
+        for instrument in Instrument.objects.filter(symbol__in=symbols):
+            instruments.setdefault(instrument.symbol, []).append(instrument)
+        for symbol in symbols:
+            if symbol not in instruments:
+                raise CommandError('Instrument "%s" does not exist' % symbol)
+        return [i for symbol in dict.fromkeys(symbols) for i in instruments[symbol]]
+
+
+    def handle_chunks(self, instruments, options):
+        from candlestick.yahoo import update_many
+        start = time()
+        saved = update_many(
+            instruments, options["resolution"],
+            chunk_size=options["chunk_size"], upsert=options["upsert"],
+            incremental=options["incremental"]
+        )
+        errors = 0
+        for symbol, bars in saved.items():
+            if isinstance(bars, Exception):
+                errors += 1
+                self.stdout.write(self.style.ERROR(f"{symbol}: {str(bars)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{describe_saved(bars, options['resolution'])} for {symbol}"
+                ))
+        self.stdout.write(
+            f"{len(saved) - errors} symbols updated, {errors} failed, "
+            f"in {round(time() - start, 2)}s"
+        )
+
+
+    def handle_concurrently(self, instruments, options):
+        from candlestick.engine import update_concurrently
+
+        def callback(symbol, result, duration):
+            if isinstance(result, Exception):
+                self.stdout.write(self.style.ERROR(f"{symbol}: {str(result)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{describe_saved(result, options['resolution'])} for {symbol} ({round(duration, 2)}s)"
+                ))
+
+        summary = update_concurrently(
+            instruments, options["resolution"], workers=options["workers"],
+            timeout=options["timeout"], batch_size=options["batch_size"],
+            upsert=options["upsert"], incremental=options["incremental"],
+            callback=callback
+        )
+        self.stdout.write(
+            f"{summary['symbols']} symbols updated, {summary['errors']} failed, "
+            f"{summary['bars']} bars saved in {round(summary['seconds'], 2)}s "
+            f"({round(summary['symbols_per_second'], 2)} symbols/s, "
+            f"{round(summary['bars_per_second'], 2)} bars/s)"
+        )
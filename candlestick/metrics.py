@@ -0,0 +1,213 @@
+import os
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+import pandas as pd
+from django.conf import settings
+from django.db import connection
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+stage_measured = Signal()
+
+_sinks = {}
+_collectors = []
+_lock = threading.Lock()
+
+def get_sinks():
+    """Gets the metrics sinks named by the CANDLESTICK_METRICS setting - a
+    dictionary of sink classes' paths to the keyword arguments to create them
+    with. There are none by default. The same sinks are reused for as long as
+    the setting is unchanged."""
+
+    config = getattr(settings, "CANDLESTICK_METRICS", {})
+    key = repr(sorted(config.items()))
+    if key not in _sinks:
+        _sinks[key] = [import_string(path)(**options) for path, options in config.items()]
+    return _sinks[key]
+
+
+@contextmanager
+def measure(stage, **tags):
+    """Times a stage of getting and saving bars, such as a request or an
+    insert, and counts the database queries made during it on this thread.
+    The dictionary yielded can be given the number of rows and bytes the
+    stage handled.
+
+    When the stage finishes, its measurements are sent with the
+    stage_measured signal, recorded by each metrics sink and collected by any
+    profile in progress. Stages which raise an exception aren't recorded."""
+
+    record = {"stage": stage, "seconds": 0, "rows": None, "bytes": None, "queries": 0}
+
+    def count(execute, sql, params, many, context):
+        record["queries"] += 1
+        return execute(sql, params, many, context)
+
+    start = perf_counter()
+    with connection.execute_wrapper(count):
+        yield record
+    record["seconds"] = perf_counter() - start
+    record["tags"] = tags
+    stage_measured.send(sender=None, **record)
+    for sink in get_sinks(): sink.record(**record)
+    if _collectors:
+        with _lock:
+            for collector in _collectors: collector.append(record)
+
+
+def count_frames(record, frames):
+    """Adds the rows of some Pandas dataframes, and the bytes they take up in
+    memory, to a stage's measurements."""
+
+    record["rows"], record["bytes"] = record["rows"] or 0, record["bytes"] or 0
+    for df in frames:
+        if not isinstance(df, pd.DataFrame): continue
+        record["rows"] += len(df)
+        record["bytes"] += int(df.memory_usage(deep=True).sum())
+
+
+def array_bytes(arrays):
+    """Gets the number of bytes a dictionary of NumPy arrays takes up."""
+
+    return sum(int(array.nbytes) for array in arrays.values())
+
+
+@contextmanager
+def profile():
+    """Collects the measurements of every stage which finishes, on any
+    thread, while the context is open, into the list yielded."""
+
+    records = []
+    with _lock: _collectors.append(records)
+    try:
+        yield records
+    finally:
+        with _lock: _collectors.remove(records)
+
+
+def summarise(records):
+    """Totals measurements by stage, in the order stages first finished, as a
+    dictionary of stages to their number of calls, seconds, rows, bytes and
+    queries."""
+
+    stages = {}
+    for record in records:
+        totals = stages.setdefault(record["stage"], {
+            "calls": 0, "seconds": 0, "rows": 0, "bytes": 0, "queries": 0
+        })
+        totals["calls"] += 1
+        for field in ["seconds", "rows", "bytes", "queries"]:
+            totals[field] += record[field] or 0
+    return stages
+
+
+def format_profile(records):
+    """Describes the time taken by each stage, as a table."""
+
+    stages = summarise(records)
+    lines = [f"{'Stage':<10}{'Calls':>8}{'Seconds':>10}{'Rows':>10}{'Bytes':>12}{'Queries':>9}"]
+    for stage, totals in stages.items():
+        lines.append(
+            f"{stage:<10}{totals['calls']:>8}{totals['seconds']:>10.3f}"
+            f"{totals['rows']:>10}{totals['bytes']:>12}{totals['queries']:>9}"
+        )
+    return "\n".join(lines)
+
+
+
+class Sink:
+    """A destination for measurements of stages. Subclasses must implement
+    record."""
+
+    def record(self, stage, seconds, rows, bytes, queries, tags):
+        """Records the measurements of a stage which has finished."""
+
+        raise NotImplementedError
+
+
+
+class LoggingSink(Sink):
+    """Logs each stage's measurements as a line of key=value pairs."""
+
+    def __init__(self, logger="candlestick.metrics", level="INFO"):
+        self.logger = logging.getLogger(logger)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+
+    def record(self, stage, seconds, rows, bytes, queries, tags):
+        values = {"seconds": f"{seconds:.4f}", "rows": rows, "bytes": bytes,
+            "queries": queries, **tags}
+        self.logger.log(self.level, f"stage={stage} " + " ".join(
+            f"{key}={value}" for key, value in values.items() if value is not None
+        ))
+
+
+
+class StatsdSink(Sink):
+    """Sends each stage's measurements to statsd over UDP - a timer of
+    milliseconds, and counters of calls, rows, bytes and queries. If tags is
+    True, tags are added in the DogStatsD format."""
+
+    def __init__(self, host="localhost", port=8125, prefix="candlestick",
+                 tags=False):
+        self.address, self.prefix, self.tags = (host, port), prefix, tags
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+
+    def record(self, stage, seconds, rows, bytes, queries, tags):
+        suffix = "|#" + ",".join(
+            f"{key}:{value}" for key, value in tags.items()
+        ) if self.tags and tags else ""
+        name = f"{self.prefix}.{stage}"
+        lines = [f"{name}.time:{seconds * 1000:.3f}|ms", f"{name}.calls:1|c"]
+        for field, value in [("rows", rows), ("bytes", bytes), ("queries", queries)]:
+            if value is not None: lines.append(f"{name}.{field}:{value}|c")
+        try:
+            self.socket.sendto("\n".join(
+                line + suffix for line in lines
+            ).encode(), self.address)
+        except OSError:
+            pass
+
+
+
+class PrometheusSink(Sink):
+    """Keeps running totals for each stage and resolution, and writes them to
+    a file in the Prometheus text format after every stage, for the node
+    exporter's textfile collector to read. The file is replaced rather than
+    overwritten, so it is never read half written."""
+
+    FIELDS = ["seconds", "calls", "rows", "bytes", "queries"]
+
+    def __init__(self, path, prefix="candlestick"):
+        self.path, self.prefix, self.totals = path, prefix, {}
+        self.lock = threading.Lock()
+
+
+    def record(self, stage, seconds, rows, bytes, queries, tags):
+        key = (stage, tags.get("resolution", ""))
+        with self.lock:
+            totals = self.totals.setdefault(key, dict.fromkeys(self.FIELDS, 0))
+            values = [seconds, 1, rows, bytes, queries]
+            for field, value in zip(self.FIELDS, values):
+                totals[field] += value or 0
+            self.write()
+
+
+    def write(self):
+        """Writes every total to the file."""
+
+        lines = []
+        for field in self.FIELDS:
+            name = f"{self.prefix}_stage_{field}_total"
+            lines.append(f"# TYPE {name} counter")
+            for (stage, resolution), totals in sorted(self.totals.items()):
+                lines.append(
+                    f'{name}{{stage="{stage}",resolution="{resolution}"}} {totals[field]}'
+                )
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f: f.write("\n".join(lines) + "\n")
+        os.replace(temp, self.path)
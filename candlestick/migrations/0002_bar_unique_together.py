@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:55
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+BATCH_SIZE = 1000
+
+def remove_duplicate_bars(apps, schema_editor):
+    """Deletes all but the most recently saved bar for each instrument,
+    resolution and timestamp, so that the unique index can be created."""
+
+    Bar = apps.get_model("candlestick", "Bar")
+    duplicates = Bar.objects.values(
+        "instrument", "resolution", "timestamp"
+    ).annotate(count=Count("id"), keep=Max("id")).filter(count__gt=1).order_by()
+    ids = []
+    for dup in list(duplicates):
+        ids += Bar.objects.filter(
+            instrument=dup["instrument"], resolution=dup["resolution"],
+            timestamp=dup["timestamp"]
+        ).exclude(id=dup["keep"]).values_list("id", flat=True)
+        while len(ids) >= BATCH_SIZE:
+            Bar.objects.filter(id__in=ids[:BATCH_SIZE]).delete()
+            ids = ids[BATCH_SIZE:]
+    if ids: Bar.objects.filter(id__in=ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candlestick', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bars, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='bar',
+            unique_together={('instrument', 'resolution', 'timestamp')},
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+def create_latest_bars(apps, schema_editor):
+    """Records the most recent bar of each instrument and resolution."""
+
+    Bar = apps.get_model("candlestick", "Bar")
+    LatestBar = apps.get_model("candlestick", "LatestBar")
+    latest_bars = []
+    for group in Bar.objects.values("instrument", "resolution").annotate(
+        last=models.Max("timestamp")
+    ).order_by():
+        bar = Bar.objects.get(
+            instrument=group["instrument"], resolution=group["resolution"],
+            timestamp=group["last"]
+        )
+        latest_bars.append(LatestBar(
+            instrument_id=bar.instrument_id, resolution=bar.resolution,
+            timestamp=bar.timestamp, close=bar.close
+        ))
+    LatestBar.objects.bulk_create(latest_bars, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candlestick', '0002_bar_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestBar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(max_length=3)),
+                ('timestamp', models.IntegerField()),
+                ('close', models.FloatField()),
+                ('instrument', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_bars', to='candlestick.instrument')),
+            ],
+            options={
+                'unique_together': {('instrument', 'resolution')},
+            },
+        ),
+        migrations.RunPython(create_latest_bars, migrations.RunPython.noop),
+    ]
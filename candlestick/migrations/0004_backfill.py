@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candlestick', '0003_latestbar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Backfill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(max_length=3)),
+                ('start', models.IntegerField()),
+                ('end', models.IntegerField()),
+                ('position', models.IntegerField()),
+                ('instrument', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backfills', to='candlestick.instrument')),
+            ],
+            options={
+                'unique_together': {('instrument', 'resolution')},
+            },
+        ),
+    ]
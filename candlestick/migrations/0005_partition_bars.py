@@ -0,0 +1,13 @@
+from django.db import migrations
+from candlestick.partitioning import PartitionBars
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candlestick', '0004_backfill'),
+    ]
+
+    operations = [
+        PartitionBars(),
+    ]
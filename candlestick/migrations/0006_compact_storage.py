@@ -0,0 +1,122 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:19
+
+import candlestick.fields
+import django.core.validators
+from django.db import migrations, models
+from candlestick.fields import compact_storage, encode_resolution, decode_resolution
+from candlestick.fields import PRICE_SCALE
+from candlestick.partitioning import PartitionBars, UnpartitionBars
+
+PRICES = ["open", "high", "low", "close"]
+
+def encode_bars(apps, schema_editor):
+    """Scales prices to integer thousandths and replaces resolutions with
+    their codes, ready for the columns to be converted to compact types.
+    PostgreSQL won't convert text to integers without being told how, so the
+    resolution column is converted here - after the foreign key checks the
+    updates queued, which would otherwise stop the table being altered."""
+
+    if not compact_storage(): return
+    q = schema_editor.connection.ops.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {q('candlestick_bar')} SET " + ", ".join(
+            f"{q(price)} = ROUND({q(price)} * {PRICE_SCALE})" for price in PRICES
+        ))
+        cursor.execute(f"SELECT DISTINCT resolution FROM {q('candlestick_bar')}")
+        for row in cursor.fetchall():
+            cursor.execute(
+                f"UPDATE {q('candlestick_bar')} SET resolution = %s WHERE resolution = %s",
+                [str(encode_resolution(row[0])), row[0]]
+            )
+        if schema_editor.connection.vendor == "postgresql":
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(
+                f"ALTER TABLE {q('candlestick_bar')} ALTER COLUMN resolution "
+                f"TYPE smallint USING resolution::smallint"
+            )
+
+
+def decode_bars(apps, schema_editor):
+    """Scales prices back from thousandths and replaces resolution codes with
+    resolutions, after the columns have been converted back. On PostgreSQL,
+    the foreign key checks the updates queued are run straight away, so that
+    the table can still be partitioned again afterwards."""
+
+    if not compact_storage(): return
+    q = schema_editor.connection.ops.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {q('candlestick_bar')} SET " + ", ".join(
+            f"{q(price)} = {q(price)} / {PRICE_SCALE}.0" for price in PRICES
+        ))
+        cursor.execute(f"SELECT DISTINCT resolution FROM {q('candlestick_bar')}")
+        for row in cursor.fetchall():
+            cursor.execute(
+                f"UPDATE {q('candlestick_bar')} SET resolution = %s WHERE resolution = %s",
+                [decode_resolution(row[0]), row[0]]
+            )
+        if schema_editor.connection.vendor == "postgresql":
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candlestick', '0005_partition_bars'),
+    ]
+
+    operations = [
+        UnpartitionBars(),
+        migrations.RunPython(encode_bars, decode_bars),
+        migrations.AlterField(
+            model_name='backfill',
+            name='end',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='backfill',
+            name='position',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='backfill',
+            name='start',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='bar',
+            name='close',
+            field=candlestick.fields.PriceField(),
+        ),
+        migrations.AlterField(
+            model_name='bar',
+            name='high',
+            field=candlestick.fields.PriceField(),
+        ),
+        migrations.AlterField(
+            model_name='bar',
+            name='low',
+            field=candlestick.fields.PriceField(),
+        ),
+        migrations.AlterField(
+            model_name='bar',
+            name='open',
+            field=candlestick.fields.PriceField(),
+        ),
+        migrations.AlterField(
+            model_name='bar',
+            name='resolution',
+            field=candlestick.fields.ResolutionField(max_length=3, validators=[django.core.validators.RegexValidator('^\\d{0,2}[smHDWMY]$')]),
+        ),
+        migrations.AlterField(
+            model_name='bar',
+            name='timestamp',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='latestbar',
+            name='timestamp',
+            field=models.BigIntegerField(),
+        ),
+        PartitionBars(),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candlestick', '0006_compact_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Indicator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(max_length=3)),
+                ('name', models.CharField(max_length=20)),
+                ('timestamp', models.BigIntegerField(blank=True, null=True)),
+                ('count', models.BigIntegerField()),
+                ('state', models.TextField()),
+                ('instrument', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indicators', to='candlestick.instrument')),
+            ],
+            options={
+                'unique_together': {('instrument', 'resolution', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='IndicatorValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.BigIntegerField()),
+                ('value', models.FloatField(blank=True, null=True)),
+                ('indicator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='values', to='candlestick.indicator')),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'unique_together': {('indicator', 'timestamp')},
+            },
+        ),
+    ]
@@ -1,13 +1,35 @@
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
-import calendar
+from itertools import islice
+import numpy as np
+import pandas as pd
 from timezone_field import TimeZoneField
 from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.dispatch import receiver
-from django.db.models.signals import pre_save
-from candlestick.utils import timestamp_to_datetime
+from django.db.models.signals import pre_save, post_save
+from django.conf import settings
+from django.core.cache import caches
+from asgiref.sync import sync_to_async
+from candlestick.fields import PriceField, ResolutionField, compact_storage, MAX_PRICE
+from candlestick.utils import timestamp_to_datetime, end_timestamp
+
+class InstrumentQuerySet(models.QuerySet):
+    """Instruments, with a method for getting all their latest prices in one
+    query."""
+
+    def with_latest_price(self, resolution=None):
+        """Annotates each instrument with the close price of its most recent
+        bar (of a given resolution, if one is given), which latest_price will
+        then use rather than making its own query."""
+
+        latest = LatestBar.objects.filter(instrument=models.OuterRef("pk"))
+        if resolution: latest = latest.filter(resolution=resolution)
+        return self.annotate(latest_close=models.Subquery(
+            latest.order_by("-timestamp").values("close")[:1]
+        ))
+
+
 
 class Instrument(models.Model):
     """A tradeable entity."""
@@ -23,10 +45,12 @@ class Instrument(models.Model):
     timezone = TimeZoneField(blank=True, null=True)
     category = models.CharField(max_length=100, blank=True, null=True)
 
+    objects = InstrumentQuerySet.as_manager()
+
     def __str__(self):
         return self.symbol
     
-    @receiver(pre_save)
+    @receiver(pre_save, sender="candlestick.Instrument")
     def pre_save_handler(sender, instance, *args, **kwargs):
         instance.full_clean()
 
@@ -35,23 +59,190 @@ class Instrument(models.Model):
     def latest_price(self):
         """The close price of the most recent bar."""
 
-        bar = self.bars.last()
+        if hasattr(self, "latest_close"): return self.latest_close
+        bar = self.latest_bar()
+        if bar: return bar.close
+    
+
+    def latest_bar(self, resolution=None):
+        """The most recent bar of a given resolution, or of any resolution if
+        none is given, as a LatestBar. If a cache is configured, it is looked
+        for there first."""
+
+        cache, key = get_cache(), LatestBar.cache_key(self.id, resolution)
+        bar = cache.get(key) if cache else None
+        if bar is None:
+            bars = self.latest_bars.order_by("-timestamp")
+            if resolution: bars = bars.filter(resolution=resolution)
+            bar = bars.first()
+            if cache and bar: cache.set(key, bar)
+        return bar
+    
+
+    async def alatest_price(self):
+        """The async equivalent of latest_price."""
+
+        if hasattr(self, "latest_close"): return self.latest_close
+        bar = await self.alatest_bar()
         if bar: return bar.close
     
 
-    def fetch(self, resolution):
+    async def alatest_bar(self, resolution=None):
+        """The async equivalent of latest_bar."""
+
+        return await sync_to_async(self.latest_bar)(resolution)
+    
+
+    def fetch(self, resolution, **kwargs):
         """Fetches all available data for this instrument for a given
-        resolution."""
+        resolution. Any keyword arguments are passed to the fetching
+        function."""
 
         import candlestick.yahoo as yahoo
-        return yahoo.fetch(self, resolution)
+        return yahoo.fetch(self, resolution, **kwargs)
     
 
-    def update(self, resolution):
-        """Gets new data for this instrument for a given resolution."""
+    async def afetch(self, resolution, **kwargs):
+        """The async equivalent of fetch, which requests prices without
+        blocking the event loop."""
+
+        from candlestick.aio import afetch
+        return await afetch(self, resolution, **kwargs)
+    
+
+    def update(self, resolution, **kwargs):
+        """Gets new data for this instrument for a given resolution. Any
+        keyword arguments are passed to the updating function."""
 
         import candlestick.yahoo as yahoo
-        return yahoo.update(self, resolution)
+        return yahoo.update(self, resolution, **kwargs)
+    
+
+    async def aupdate(self, resolution, **kwargs):
+        """The async equivalent of update, which requests prices without
+        blocking the event loop."""
+
+        from candlestick.aio import aupdate
+        return await aupdate(self, resolution, **kwargs)
+    
+
+    def load_arrays(self, resolution):
+        """Loads this instrument's bars of a resolution into NumPy arrays -
+        memory-mapped from the array cache, if one is configured."""
+
+        from candlestick.arrays import load_arrays
+        return load_arrays(self, resolution)
+    
+
+    def backfill(self, resolution, **kwargs):
+        """Gets this instrument's bars for a long range of time one window at
+        a time, carrying on from where any interrupted backfill stopped. Any
+        keyword arguments are passed to the backfilling function."""
+
+        from candlestick.backfill import backfill
+        return backfill(self, resolution, **kwargs)
+    
+
+    def find_gaps(self, resolution, **kwargs):
+        """Finds the ranges of time missing between this instrument's bars of
+        a resolution, allowing for nights and weekends if it has a timezone.
+        Any keyword arguments are passed to the gap finding function."""
+
+        from candlestick.gaps import find_gaps
+        return find_gaps(self, resolution, **kwargs)
+    
+
+    def repair_gaps(self, resolution, **kwargs):
+        """Requests just the prices missing between this instrument's bars of
+        a resolution, and saves them. Any keyword arguments are passed to the
+        repairing function."""
+
+        from candlestick.gaps import repair_gaps
+        return repair_gaps(self, resolution, **kwargs)
+    
+
+    def indicator(self, resolution, name):
+        """Loads the values of an indicator, named like rsi_14, over this
+        instrument's bars of a resolution - computing only those for bars
+        saved since they were last loaded."""
+
+        from candlestick.indicators import load_indicator
+        return load_indicator(self, resolution, name)
+    
+
+    def resample(self, source, target, save=False, start=None, end=None):
+        """Creates bars of a coarser resolution from this instrument's bars of
+        a finer one, optionally between two timestamps, without requesting
+        anything from Yahoo. If save is True they replace any existing bars of
+        that resolution in the range."""
+
+        from candlestick.resample import resample
+        return resample(self, source, target, save=save, start=start, end=end)
+
+
+
+class BarQuerySet(models.QuerySet):
+    """Bars, with methods for exporting them in bulk without creating bar
+    objects."""
+
+    FIELDS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+    def to_arrays(self, chunk_size=10000):
+        """Loads the bars' timestamps, prices and volumes into a dictionary of
+        NumPy arrays. Rows are read from the database a chunk at a time into
+        arrays allocated up front, so no more than one chunk of rows is ever
+        held as Python objects."""
+
+        size = self.count()
+        arrays = {field: np.empty(size, dtype="int64" if field in [
+            "timestamp", "volume"
+        ] else "float64") for field in self.FIELDS}
+        rows = self.values_list(*self.FIELDS).iterator(chunk_size=chunk_size)
+        position = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk: break
+            if position + len(chunk) > size:
+                size = position + len(chunk)
+                for field in self.FIELDS:
+                    arrays[field] = np.resize(arrays[field], size)
+            for field, column in zip(self.FIELDS, zip(*chunk)):
+                arrays[field][position:position + len(chunk)] = column
+            position += len(chunk)
+        return {field: array[:position] for field, array in arrays.items()}
+    
+
+    def to_frame(self, timezone=None, chunk_size=10000):
+        """Loads the bars into a Pandas dataframe with the same columns Yahoo
+        uses, indexed by aware datetimes. If no timezone is given and the bars
+        come from an instrument's bars, the instrument's timezone is used -
+        otherwise the datetimes are UTC."""
+
+        arrays = self.to_arrays(chunk_size=chunk_size)
+        index = pd.to_datetime(arrays.pop("timestamp"), unit="s", utc=True)
+        instrument = self._hints.get("instance")
+        if timezone is None and isinstance(instrument, Instrument):
+            timezone = instrument.timezone
+        if timezone: index = index.tz_convert(timezone)
+        index.name = "Datetime"
+        return pd.DataFrame(
+            {field.title(): array for field, array in arrays.items()},
+            index=index
+        )
+    
+
+    async def ato_arrays(self, chunk_size=10000):
+        """The async equivalent of to_arrays."""
+
+        return await sync_to_async(self.to_arrays)(chunk_size=chunk_size)
+    
+
+    async def ato_frame(self, timezone=None, chunk_size=10000):
+        """The async equivalent of to_frame."""
+
+        return await sync_to_async(self.to_frame)(
+            timezone=timezone, chunk_size=chunk_size
+        )
 
 
 
@@ -63,20 +254,23 @@ class Bar(models.Model):
 
     class Meta:
         ordering = ["timestamp"]
+        unique_together = [["instrument", "resolution", "timestamp"]]
 
-    timestamp = models.IntegerField()
-    resolution = models.CharField(validators=[RegexValidator("^\d{0,2}[smHDWMY]$")], max_length=3)
-    open = models.FloatField()
-    low = models.FloatField()
-    high = models.FloatField()
-    close = models.FloatField()
+    timestamp = models.BigIntegerField()
+    resolution = ResolutionField(validators=[RegexValidator("^\d{0,2}[smHDWMY]$")], max_length=3)
+    open = PriceField()
+    low = PriceField()
+    high = PriceField()
+    close = PriceField()
     volume = models.BigIntegerField()
     instrument = models.ForeignKey(Instrument, on_delete=models.CASCADE, related_name="bars")
 
+    objects = BarQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.timestamp} ({float(self.close):g})"
 
-    @receiver(pre_save)
+    @receiver(pre_save, sender="candlestick.Bar")
     def pre_save_handler(sender, instance, *args, **kwargs):
         instance.full_clean()
     
@@ -93,14 +287,7 @@ class Bar(models.Model):
         """What is the timestamp at the end of the period represented by this
         bar?"""
 
-        count, res = int(self.resolution[:-1] or 1), self.resolution[-1]
-        if res in "MY":
-            if res == "Y": count *= 12
-            dt = datetime.utcfromtimestamp(self.timestamp)
-            dt += relativedelta(months=count)
-            return calendar.timegm(dt.utctimetuple())
-        secs = count * {"s": 1, "m": 60, "H": 3600, "D": 86400, "W": 604800}[res]
-        return self.timestamp + secs
+        return end_timestamp(self.timestamp, self.resolution)
     
 
     @property
@@ -121,3 +308,193 @@ class Bar(models.Model):
         return timestamp_to_datetime(
             self.end_timestamp, self.instrument.timezone, self.resolution
         )
+
+
+
+def validate_bar_arrays(arrays, resolution):
+    """Validates many bars of one resolution at once, given as a dictionary of
+    NumPy arrays - the bulk equivalent of cleaning each bar. The resolution is
+    checked once, timestamps must be UNIX midnights if the resolution is D or
+    above, and prices and volumes must be finite and not negative - and with
+    compact storage, prices must be small enough to be stored."""
+
+    Bar._meta.get_field("resolution").clean(resolution, None)
+    timestamps = np.asarray(arrays["timestamp"])
+    if resolution[-1] in "DWMY":
+        invalid = timestamps[timestamps % 86400 != 0]
+        if len(invalid):
+            raise ValidationError(
+                f"Timestamp {invalid[0]} is invalid for resolution {resolution}"
+            )
+    for field in ["open", "high", "low", "close", "volume"]:
+        values = np.asarray(arrays[field], dtype="float64")
+        if not np.isfinite(values).all():
+            raise ValidationError(f"{field.title()} values must be finite")
+        if (values < 0).any():
+            raise ValidationError(f"{field.title()} values cannot be negative")
+        if field != "volume" and compact_storage() and (values > MAX_PRICE).any():
+            raise ValidationError(
+                f"{field.title()} values are too large for compact storage"
+            )
+
+
+
+class LatestBar(models.Model):
+    """The timestamp and close price of an instrument's most recent bar of a
+    resolution. These are kept up to date as bars are saved, so that latest
+    prices can be looked up without searching through every bar.
+
+    Bars saved individually or by candlestick's own functions update these
+    automatically - if bars are deleted or bulk created some other way, call
+    refresh afterwards."""
+
+    class Meta:
+        unique_together = [["instrument", "resolution"]]
+
+    instrument = models.ForeignKey(Instrument, on_delete=models.CASCADE, related_name="latest_bars")
+    resolution = models.CharField(max_length=3)
+    timestamp = models.BigIntegerField()
+    close = models.FloatField()
+
+    def __str__(self):
+        return f"{self.instrument_id} {self.resolution}: {self.timestamp} ({float(self.close):g})"
+    
+
+    @staticmethod
+    def cache_key(instrument_id, resolution=None):
+        """The key a latest bar is cached under."""
+
+        return f"candlestick:latest:{instrument_id}:{resolution or ''}"
+
+
+    @classmethod
+    def refresh(cls, instrument_id, resolution):
+        """Looks up the most recent bar of an instrument and resolution, and
+        updates the stored latest bar to match it.
+
+        Any cached latest bar is deleted straight away, and again once the
+        transaction this is in commits - a reader on another connection in
+        between would otherwise cache the old latest bar again."""
+
+        bar = Bar.objects.filter(
+            instrument_id=instrument_id, resolution=resolution
+        ).order_by("-timestamp").values_list("timestamp", "close").first()
+        latest = cls.objects.filter(
+            instrument_id=instrument_id, resolution=resolution
+        )
+        if not bar:
+            latest.delete()
+        elif not latest.update(timestamp=bar[0], close=bar[1]):
+            cls.objects.create(
+                instrument_id=instrument_id, resolution=resolution,
+                timestamp=bar[0], close=bar[1]
+            )
+        cache = get_cache()
+        if cache:
+            keys = [cls.cache_key(instrument_id, resolution), cls.cache_key(instrument_id)]
+            cache.delete_many(keys)
+            transaction.on_commit(lambda: cache.delete_many(keys))
+    
+
+    @receiver(post_save, sender="candlestick.Bar")
+    def post_save_handler(sender, instance, *args, **kwargs):
+        from candlestick.arrays import invalidate
+        invalidate(instance.instrument_id, instance.resolution)
+        Indicator.invalidate(instance.instrument_id, instance.resolution, instance.timestamp)
+        LatestBar.refresh(instance.instrument_id, instance.resolution)
+
+
+
+class Backfill(models.Model):
+    """The progress of a backfill of an instrument's bars of a resolution,
+    which requests prices one window at a time from start to end. Position is
+    the timestamp up to which windows have been saved, so an interrupted
+    backfill can carry on from there."""
+
+    class Meta:
+        unique_together = [["instrument", "resolution"]]
+
+    instrument = models.ForeignKey(Instrument, on_delete=models.CASCADE, related_name="backfills")
+    resolution = models.CharField(max_length=3)
+    start = models.BigIntegerField()
+    end = models.BigIntegerField()
+    position = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.instrument_id} {self.resolution}: {self.position} ({self.progress:.0%})"
+    
+
+    @property
+    def finished(self):
+        """Whether every window has been saved."""
+
+        return self.position >= self.end
+    
+
+    @property
+    def progress(self):
+        """The fraction of the range which has been saved."""
+
+        if self.end <= self.start: return 1.0
+        return min((self.position - self.start) / (self.end - self.start), 1.0)
+
+
+
+class Indicator(models.Model):
+    """An indicator computed over an instrument's bars of a resolution, such
+    as rsi_14. Timestamp is the latest bar it has been computed for, count is
+    the number of bars before that, and state is the JSON state of the
+    computation just before that bar - which is where the next update carries
+    on from."""
+
+    class Meta:
+        unique_together = [["instrument", "resolution", "name"]]
+
+    instrument = models.ForeignKey(Instrument, on_delete=models.CASCADE, related_name="indicators")
+    resolution = models.CharField(max_length=3)
+    name = models.CharField(max_length=20)
+    timestamp = models.BigIntegerField(blank=True, null=True)
+    count = models.BigIntegerField()
+    state = models.TextField()
+
+    def __str__(self):
+        return f"{self.instrument_id} {self.resolution}: {self.name}"
+
+
+    @classmethod
+    def invalidate(cls, instrument_id, resolution, start):
+        """Marks an instrument's indicators of a resolution to be recomputed
+        in full, if bars from a timestamp onwards have been rewritten before
+        the latest bar they were computed for. Changes to that bar itself, and
+        bars added or removed before it, are picked up when they're loaded."""
+
+        cls.objects.filter(
+            instrument_id=instrument_id, resolution=resolution,
+            timestamp__gt=start
+        ).update(timestamp=None)
+
+
+
+class IndicatorValue(models.Model):
+    """The value of an indicator at one of its bars' timestamps, or null if
+    there were not yet enough bars for one."""
+
+    class Meta:
+        ordering = ["timestamp"]
+        unique_together = [["indicator", "timestamp"]]
+
+    indicator = models.ForeignKey(Indicator, on_delete=models.CASCADE, related_name="values")
+    timestamp = models.BigIntegerField()
+    value = models.FloatField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.timestamp} ({self.value})"
+
+
+
+def get_cache():
+    """Gets the Django cache that latest bars are cached in, if the
+    CANDLESTICK_CACHE setting names one."""
+
+    alias = getattr(settings, "CANDLESTICK_CACHE", None)
+    return caches[alias] if alias else None
@@ -0,0 +1,288 @@
+from time import time
+import numpy as np
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+from django.db.migrations.operations.base import Operation
+from candlestick.fields import encode_resolution
+
+TABLE = "candlestick_bar"
+RESOLUTIONS = ["m", "2m", "5m", "15m", "30m", "H"]
+UNITS = {"s": "s", "m": "min", "H": "h", "D": "d", "W": "w", "M": "mo", "Y": "y"}
+MONTHS_AHEAD = 3
+
+def partitioning_enabled():
+    """Whether bars should be partitioned, according to the
+    CANDLESTICK_PARTITION_BARS setting."""
+
+    return getattr(settings, "CANDLESTICK_PARTITION_BARS", False)
+
+
+def get_resolutions():
+    """Gets the resolutions which have their own partition, each divided into
+    monthly partitions - by default the intraday ones. Bars of any other
+    resolution share one partition."""
+
+    return getattr(settings, "CANDLESTICK_PARTITION_RESOLUTIONS", RESOLUTIONS)
+
+
+def partition_name(resolution=None, month=None):
+    """Gets the name of a resolution's partition, or one of its monthly
+    partitions, or the partition shared by all other resolutions. Table names
+    are case insensitive, so resolution units are spelled out."""
+
+    if resolution is None: return f"{TABLE}_other"
+    digits = resolution[:-1]
+    name = f"{TABLE}_{digits}{UNITS[resolution[-1]]}"
+    if month is not None:
+        name += "_" + str(np.datetime64(month, "M")).replace("-", "")
+    return name
+
+
+def month_range(month):
+    """Gets the first timestamp of a month and the first of the next."""
+
+    month = np.datetime64(month, "M")
+    return tuple(int(m.astype("datetime64[s]").astype("int64")) for m in [
+        month, month + 1
+    ])
+
+
+def get_months(start, months_ahead=MONTHS_AHEAD):
+    """Gets every month from the one containing a timestamp to some number of
+    months after the current one."""
+
+    now = np.datetime64(int(time()), "s").astype("datetime64[M]")
+    start = np.datetime64(int(start), "s").astype("datetime64[M]")
+    return np.arange(min(start, now), now + months_ahead + 1)
+
+
+def prep_resolution(resolution, connection):
+    """Gets the value a resolution is stored as in the bar table. This goes by
+    the column's type rather than the compact storage setting, as migrations
+    partition the table before its columns are converted."""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT data_type FROM information_schema.columns WHERE "
+            "table_name = %s AND column_name = 'resolution'", [TABLE]
+        )
+        row = cursor.fetchone()
+    if row and row[0] == "smallint": return encode_resolution(resolution)
+    return resolution
+
+
+def is_partitioned(connection=default_connection):
+    """Whether the bar table is a partitioned PostgreSQL table."""
+
+    if connection.vendor != "postgresql": return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE relname = %s", [TABLE]
+        )
+        row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def partition_table(connection=default_connection):
+    """Replaces the bar table with one partitioned by resolution, with each of
+    the partitioned resolutions further partitioned by month, and copies the
+    bars into it. Monthly partitions are created for every month with bars,
+    and a few months ahead - bars outside those go in a default partition."""
+
+    q = connection.ops.quote_name
+    old = f"{TABLE}_unpartitioned"
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {q(TABLE)} RENAME TO {q(old)}")
+        cursor.execute(f"ALTER INDEX {q(TABLE + '_pkey')} RENAME TO {q(old + '_pkey')}")
+        create_table_like(cursor, q, old, "PARTITION BY LIST (resolution)")
+        cursor.execute(f"CREATE TABLE {q(partition_name())} PARTITION OF {q(TABLE)} DEFAULT")
+        for resolution in get_resolutions():
+            parent = partition_name(resolution)
+            value = prep_resolution(resolution, connection)
+            cursor.execute(
+                f"CREATE TABLE {q(parent)} PARTITION OF {q(TABLE)} FOR VALUES "
+                f'IN (%s) PARTITION BY RANGE ("timestamp")', [value]
+            )
+            cursor.execute(
+                f"CREATE TABLE {q(parent + '_default')} PARTITION OF {q(parent)} DEFAULT"
+            )
+            cursor.execute(
+                f'SELECT MIN("timestamp") FROM {q(old)} WHERE resolution = %s',
+                [value]
+            )
+            first = cursor.fetchone()[0]
+            for month in get_months(time() if first is None else first):
+                create_partition(cursor, q, resolution, month)
+        cursor.execute(f"INSERT INTO {q(TABLE)} SELECT * FROM {q(old)}")
+        cursor.execute(f"DROP TABLE {q(old)}")
+        add_foreign_key(cursor, q)
+
+
+def unpartition_table(connection=default_connection):
+    """Replaces the partitioned bar table with an ordinary one, and copies the
+    bars into it."""
+
+    q = connection.ops.quote_name
+    old = f"{TABLE}_partitioned"
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {q(TABLE)} RENAME TO {q(old)}")
+        cursor.execute(f"ALTER INDEX {q(TABLE + '_pkey')} RENAME TO {q(old + '_pkey')}")
+        create_table_like(cursor, q, old)
+        cursor.execute(f"INSERT INTO {q(TABLE)} SELECT * FROM {q(old)}")
+        cursor.execute(f"DROP TABLE {q(old)} CASCADE")
+        add_foreign_key(cursor, q)
+
+
+def create_table_like(cursor, q, old, partition_by=""):
+    """Creates a new bar table with the same columns as an existing one, with
+    its primary key and unique constraint, and takes over the existing table's
+    ID sequence. A partitioned table's primary key must include the columns it
+    is partitioned by."""
+
+    pk = "id, resolution, \"timestamp\"" if partition_by else "id"
+    cursor.execute(
+        f"CREATE TABLE {q(TABLE)} (LIKE {q(old)} INCLUDING DEFAULTS) {partition_by}"
+    )
+    cursor.execute(f"ALTER TABLE {q(TABLE)} ADD PRIMARY KEY ({pk})")
+    cursor.execute(
+        f"ALTER TABLE {q(old)} DROP CONSTRAINT IF EXISTS "
+        f"{q(TABLE + '_instrument_resolution_timestamp_uniq')}"
+    )
+    cursor.execute(
+        f"ALTER TABLE {q(TABLE)} ADD CONSTRAINT "
+        f"{q(TABLE + '_instrument_resolution_timestamp_uniq')} "
+        f'UNIQUE (instrument_id, resolution, "timestamp")'
+    )
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [q(old)])
+    sequence = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {q(TABLE)}.id")
+
+
+def add_foreign_key(cursor, q):
+    """Adds the bar table's foreign key to instruments once bars have been
+    copied into it, so that they are checked all at once. Checks deferred
+    until the end of the migration would otherwise stop the table being
+    altered again within it."""
+
+    cursor.execute(
+        f"ALTER TABLE {q(TABLE)} ADD CONSTRAINT {q(TABLE + '_instrument_id_fk')} "
+        f"FOREIGN KEY (instrument_id) REFERENCES {q('candlestick_instrument')} (id) "
+        f"DEFERRABLE INITIALLY DEFERRED"
+    )
+
+
+def create_partition(cursor, q, resolution, month):
+    """Creates the partition for a month of a resolution's bars, if it doesn't
+    exist, moving any of that month's bars out of the default partition first.
+    Returns whether it was created."""
+
+    name, parent = partition_name(resolution, month), partition_name(resolution)
+    cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s", [name])
+    if cursor.fetchone(): return False
+    start, end = month_range(month)
+    cursor.execute(f"CREATE TABLE {q(name)} (LIKE {q(parent)} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {q(parent + '_default')} WHERE "
+        f'"timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+        f"INSERT INTO {q(name)} SELECT * FROM moved", [start, end]
+    )
+    cursor.execute(
+        f"ALTER TABLE {q(parent)} ATTACH PARTITION {q(name)} "
+        f"FOR VALUES FROM ({start}) TO ({end})"
+    )
+    return True
+
+
+def create_partitions(months=MONTHS_AHEAD, connection=default_connection):
+    """Creates the monthly partitions of every partitioned resolution from the
+    current month to some number of months ahead, returning the names of those
+    which didn't already exist."""
+
+    q, created = connection.ops.quote_name, []
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            for resolution in get_resolutions():
+                for month in get_months(time(), months):
+                    if create_partition(cursor, q, resolution, month):
+                        created.append(partition_name(resolution, month))
+    return created
+
+
+def drop_partitions(resolution, before, connection=default_connection):
+    """Drops the monthly partitions of a resolution which end on or before a
+    timestamp - deleting all their bars at once - and refreshes any latest bars
+    which were in them. Returns the names of the dropped partitions."""
+
+    from candlestick.arrays import invalidate_resolution
+    from candlestick.models import LatestBar
+    q, parent, dropped = connection.ops.quote_name, partition_name(resolution), []
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits JOIN pg_class parent ON "
+                "inhparent = parent.oid JOIN pg_class child ON inhrelid = child.oid "
+                "WHERE parent.relname = %s", [parent]
+            )
+            for row in cursor.fetchall():
+                name = row[0]
+                suffix = name[len(parent) + 1:]
+                if not suffix.isdigit(): continue
+                month = np.datetime64(f"{suffix[:4]}-{suffix[4:]}", "M")
+                if month_range(month)[1] > before: continue
+                cursor.execute(f"DROP TABLE {q(name)}")
+                dropped.append(name)
+        if dropped:
+            invalidate_resolution(resolution)
+            for latest in LatestBar.objects.filter(
+                resolution=resolution, timestamp__lt=before
+            ):
+                LatestBar.refresh(latest.instrument_id, resolution)
+    return dropped
+
+
+
+class PartitionBars(Operation):
+    """A migration operation which partitions the bar table on PostgreSQL, if
+    the CANDLESTICK_PARTITION_BARS setting is True. On other databases, or if
+    the setting is False, it does nothing. Reversing it turns the table back
+    into an ordinary one."""
+
+    reversible = True
+
+    def state_forwards(self, app_label, state):
+        pass
+
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        connection = schema_editor.connection
+        if partitioning_enabled() and connection.vendor == "postgresql":
+            if not is_partitioned(connection): partition_table(connection)
+
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if is_partitioned(schema_editor.connection):
+            unpartition_table(schema_editor.connection)
+
+
+    def describe(self):
+        return "Partition bars by resolution and month on PostgreSQL"
+
+
+
+class UnpartitionBars(PartitionBars):
+    """A migration operation which turns a partitioned bar table back into an
+    ordinary one, for operations which can't be applied to a partitioned table
+    - such as changing the type of a column it is partitioned by. Reversing it
+    partitions the table again if partitioning is enabled."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+    def describe(self):
+        return "Turn partitioned bars back into an ordinary table on PostgreSQL"
@@ -0,0 +1,378 @@
+import os
+import random
+import logging
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import time, monotonic, sleep
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+INTERVAL_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "wk": 604800}
+PERIOD_SECONDS = {"d": 86400, "wk": 604800, "mo": 2629746, "y": 31556952}
+RETRYABLE_ERRORS = {
+    "YFRateLimitError", "YFDataException", "ConnectionError", "Timeout",
+    "ConnectTimeout", "ReadTimeout", "CurlError", "JSONDecodeError"
+}
+MISSING_ERRORS = {"YFTickerMissingError"}
+
+logger = logging.getLogger(__name__)
+
+_providers = {}
+
+def get_provider():
+    """Gets the data provider named by the CANDLESTICK_PROVIDER setting (Yahoo
+    by default), created with the keyword arguments in the
+    CANDLESTICK_PROVIDER_OPTIONS setting. The same provider object is reused
+    for as long as the settings are unchanged."""
+
+    path = getattr(
+        settings, "CANDLESTICK_PROVIDER", "candlestick.providers.YahooProvider"
+    )
+    options = getattr(settings, "CANDLESTICK_PROVIDER_OPTIONS", {})
+    key = (path, repr(sorted(options.items())))
+    if key not in _providers:
+        _providers[key] = import_string(path)(**options)
+    return _providers[key]
+
+
+def split_interval(interval):
+    """Splits a Yahoo interval or period like 15m or 1wk into its number and
+    unit."""
+
+    digits = "".join(char for char in interval if char.isdigit())
+    return int(digits or 1), interval[len(digits):]
+
+
+def period_seconds(period):
+    """Gets the length of a Yahoo period like 60d or 100y in seconds - max is
+    taken to be a hundred years."""
+
+    if period in [None, "max"]: return 100 * PERIOD_SECONDS["y"]
+    count, unit = split_interval(period)
+    return count * PERIOD_SECONDS[unit]
+
+
+
+class Provider:
+    """A source of price data. Subclasses must implement history.
+
+    Intervals and periods are given the way Yahoo expects them (1m, 60m, 1d,
+    1wk, 1mo, 7d, 100y and so on) and start and end are UNIX timestamps -
+    prices from the start onwards are wanted, up to but not including the
+    end. If there is no start, the period says how far back to go. Providers
+    may return prices from a little before the start."""
+
+    def history(self, symbols, interval, start=None, end=None, period=None,
+                timeout=None):
+        """Gets prices for several symbols, as a dictionary of symbols to
+        dataframes with Open, High, Low, Close and Volume columns and a
+        datetime index. Symbols with no prices can be left out, and symbols
+        whose prices couldn't be got can have the exception in place of a
+        dataframe."""
+
+        raise NotImplementedError
+
+
+
+class TokenBucket:
+    """Limits how often something happens, across threads - on average no
+    more than rate times a second, but up to burst times at once after a
+    quiet spell."""
+
+    def __init__(self, rate, burst=1):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = burst, monotonic()
+        self.lock = threading.Lock()
+
+
+    def acquire(self):
+        """Takes a token, first waiting for one to become available if there
+        are none left."""
+
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+
+
+class YahooProvider(Provider):
+    """Gets prices from Yahoo Finance. Yahoo has no way of requesting several
+    symbols together, so each symbol is requested on its own, several at once
+    in up to max_concurrency threads. Midnight start and end timestamps are
+    sent as dates, and others as exact timestamps.
+
+    All requests share one HTTP session, so connections and cookies are
+    reused. No more than max_concurrency requests are made at once - however
+    many threads are making them - and if a rate is given, no more than rate
+    a second on average (with bursts of up to burst).
+
+    yfinance is set to raise errors rather than log them and return no
+    prices, for every user of it in the process. Requests which are rate
+    limited, fail with a connection error, or get an unreadable response from
+    Yahoo are retried up to retries times, waiting exponentially longer each
+    time from backoff seconds up to max_backoff seconds - or as long as Yahoo
+    asks. Symbols Yahoo has no prices for get an empty dataframe, and any
+    other error is raised - or returned in place of the symbol's dataframe if
+    several were requested. These can all be set in the
+    CANDLESTICK_PROVIDER_OPTIONS setting."""
+
+    def __init__(self, max_concurrency=4, rate=None, burst=5, retries=5,
+                 backoff=1, max_backoff=60):
+        self.max_concurrency = max_concurrency
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.retries, self.backoff = retries, backoff
+        self.max_backoff = max_backoff
+        self.session_lock, self._session = threading.Lock(), None
+
+
+    @property
+    def session(self):
+        """The HTTP session shared by all requests, created when first
+        needed. Recent versions of yfinance need a curl_cffi session."""
+
+        with self.session_lock:
+            if self._session is None:
+                try:
+                    from curl_cffi import requests
+                    self._session = requests.Session(impersonate="chrome")
+                except ImportError:
+                    import requests
+                    self._session = requests.Session()
+            return self._session
+
+
+    def history(self, symbols, interval, start=None, end=None, period=None,
+                timeout=None):
+        kwargs = {"interval": interval}
+        if start is None: kwargs["period"] = period
+        for name, timestamp in [("start", start), ("end", end)]:
+            if timestamp is None: continue
+            kwargs[name] = timestamp if timestamp % 86400 else str(
+                datetime.utcfromtimestamp(timestamp).date()
+            )
+        if timeout: kwargs["timeout"] = timeout
+        if len(symbols) == 1:
+            return {symbols[0]: self.request_history(symbols[0], **kwargs)}
+        return self.download(symbols, **kwargs)
+
+
+    def request_history(self, symbol, **kwargs):
+        """Requests one symbol's prices, giving an empty dataframe if Yahoo
+        has none. yfinance would otherwise hide failed requests the same way,
+        so it is made to raise them."""
+
+        import yfinance as yf
+        if hasattr(yf, "config"): yf.config.debug.hide_exceptions = False
+        ticker = yf.Ticker(symbol, session=self.session)
+        try:
+            return self.request(ticker.history, **kwargs)
+        except Exception as e:
+            if not is_missing(e): raise
+            return pd.DataFrame(columns=COLUMNS)
+
+
+    def request(self, func, *args, **kwargs):
+        """Calls a function which makes a request to Yahoo, within the
+        concurrency and rate limits, and retries it if it fails in a way that
+        might not happen next time."""
+
+        for attempt in range(self.retries + 1):
+            with self.semaphore:
+                if self.bucket: self.bucket.acquire()
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if attempt == self.retries or not is_retryable(e): raise
+                    delay = self.retry_delay(e, attempt)
+                    logger.warning(
+                        f"Yahoo request failed ({e!r}) - retrying in {delay:.1f}s"
+                    )
+            sleep(delay)
+
+
+    def retry_delay(self, exception, attempt):
+        """Works out how long to wait before retrying a request - the time
+        given in a Retry-After header if there is one, or otherwise an
+        exponentially growing time with some random jitter."""
+
+        response = getattr(exception, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return min(float(headers["Retry-After"]), self.max_backoff)
+        except (KeyError, TypeError, ValueError):
+            delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+            return delay * random.uniform(0.5, 1)
+
+
+    def download(self, symbols, **kwargs):
+        """Requests several symbols at once, in up to max_concurrency threads.
+        A symbol whose request fails has the exception in place of its
+        dataframe, so that it doesn't affect the others."""
+
+        with ThreadPoolExecutor(self.max_concurrency) as executor:
+            futures = {symbol: executor.submit(
+                self.request_history, symbol, **kwargs
+            ) for symbol in symbols}
+        histories = {}
+        for symbol, future in futures.items():
+            try:
+                histories[symbol] = future.result()
+            except Exception as e:
+                histories[symbol] = e
+        return histories
+
+
+
+def is_retryable(exception):
+    """Whether a failed request is worth retrying - if it was rate limited,
+    failed with a server error, couldn't connect or timed out, or got a
+    response which wasn't the JSON expected (such as a server's error page).
+    Exceptions are recognised by name, as they come from several optional
+    libraries."""
+
+    status = getattr(getattr(exception, "response", None), "status_code", None)
+    if isinstance(status, int): return status == 429 or status >= 500
+    return isinstance(exception, (ConnectionError, TimeoutError)) or any(
+        cls.__name__ in RETRYABLE_ERRORS for cls in type(exception).__mro__
+    )
+
+
+
+def is_missing(exception):
+    """Whether a failed request failed because Yahoo has no prices for the
+    symbol, in the range requested or at all."""
+
+    return any(cls.__name__ in MISSING_ERRORS for cls in type(exception).__mro__)
+
+
+
+class SyntheticProvider(Provider):
+    """Makes up prices, without any network access. Every symbol has its own
+    deterministic series, and the price at a given time is always the same
+    however the series is requested - so fetches, updates and backfills of the
+    same symbol agree with each other.
+
+    There is one bar per interval, around the clock, up to the current time
+    (or the time given as now), so long periods of short intervals can produce
+    millions of bars."""
+
+    def __init__(self, now=None, max_bars=10 ** 7):
+        self.now, self.max_bars = now, max_bars
+
+
+    def history(self, symbols, interval, start=None, end=None, period=None,
+                timeout=None):
+        now = self.now or int(time())
+        end = now if end is None else min(end, now)
+        if start is None: start = end - period_seconds(period)
+        return {
+            symbol: self.series(symbol, interval, start, end)
+            for symbol in symbols
+        }
+
+
+    def timestamps(self, interval, start, end):
+        """Gets the timestamps of all the bars between two timestamps."""
+
+        count, unit = split_interval(interval)
+        if unit == "mo":
+            months = np.arange(
+                np.datetime64(start, "s").astype("datetime64[M]"),
+                np.datetime64(end, "s").astype("datetime64[M]") + 1, count
+            )
+            timestamps = months.astype("datetime64[s]").astype("int64")
+            return timestamps[(timestamps >= start) & (timestamps < end)]
+        step = count * INTERVAL_SECONDS[unit]
+        first = start + (-start % step)
+        return np.arange(first, end, step, dtype="int64")[:self.max_bars]
+
+
+    def series(self, symbol, interval, start, end):
+        """Makes up a dataframe of prices for one symbol."""
+
+        timestamps = self.timestamps(interval, start, end)
+        seed = zlib.crc32(symbol.encode())
+        count, unit = split_interval(interval)
+        step = count * INTERVAL_SECONDS.get(unit, PERIOD_SECONDS["mo"])
+        opens = self.price(timestamps, seed)
+        closes = self.price(timestamps + step, seed)
+        spread = 1 + self.noise(timestamps, seed + 1) * 0.01
+        volume = (self.noise(timestamps, seed + 2) * 10 ** 6).astype("int64")
+        return pd.DataFrame({
+            "Open": opens, "High": np.maximum(opens, closes) * spread,
+            "Low": np.minimum(opens, closes) / spread, "Close": closes,
+            "Volume": volume
+        }, index=pd.to_datetime(timestamps, unit="s", utc=True))
+
+
+    def price(self, timestamps, seed):
+        """A smooth, deterministic price for each timestamp."""
+
+        base = 10 + seed % 500
+        days = timestamps / 86400
+        return base * np.exp(
+            0.3 * np.sin(days / 365 + seed) + 0.05 * np.sin(days / 7 + seed)
+            + 0.01 * np.sin(days * 24 + seed)
+        )
+
+
+    def noise(self, timestamps, seed):
+        """A deterministic number between 0 and 1 for each timestamp."""
+
+        hashed = (timestamps.astype("uint64") * np.uint64(2654435761)
+            + np.uint64(seed)) % np.uint64(2 ** 32)
+        return hashed / 2 ** 32
+
+
+
+class FileProvider(Provider):
+    """Reads prices from files in a directory, named by symbol and interval -
+    for example AAPL_1d.csv or AAPL_1d.parquet. Files must have a datetime
+    first column and Open, High, Low, Close and Volume columns. Reading
+    Parquet files needs pyarrow or fastparquet to be installed."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+
+    def history(self, symbols, interval, start=None, end=None, period=None,
+                timeout=None):
+        histories = {}
+        for symbol in symbols:
+            df = self.read(symbol, interval)
+            if df is None: continue
+            timestamps = df.index.values.astype("datetime64[s]").astype("int64")
+            keep = np.ones(len(df), dtype=bool)
+            if start is not None: keep &= timestamps >= start
+            if end is not None: keep &= timestamps < end
+            histories[symbol] = df[keep]
+        return histories
+
+
+    def read(self, symbol, interval):
+        """Reads a symbol's file for an interval, if there is one."""
+
+        path = os.path.join(self.directory, f"{symbol}_{interval}")
+        if os.path.exists(path + ".parquet"):
+            df = pd.read_parquet(path + ".parquet")
+        elif os.path.exists(path + ".csv"):
+            df = pd.read_csv(path + ".csv", index_col=0)
+        else:
+            return None
+        df.index = pd.to_datetime(df.index, utc=True)
+        return df[COLUMNS]
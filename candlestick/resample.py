@@ -0,0 +1,142 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Min, Max, Sum, IntegerField, ExpressionWrapper
+from candlestick.arrays import invalidate
+from candlestick.models import Bar, LatestBar, Indicator, validate_bar_arrays
+from candlestick.utils import resolution_seconds, resolution_months
+from candlestick.yahoo import create_bars, BATCH_SIZE
+
+WEEK_OFFSET = 345600
+LOOKUP_SIZE = 500
+
+def resample(instrument, source, target, save=False, start=None, end=None):
+    """Aggregates an instrument's bars of one resolution into bars of a coarser
+    one - the first open, highest high, lowest low, last close and total
+    volume of each period.
+
+    Periods are measured from the UNIX epoch, so that they start where
+    Bar.end_timestamp expects them to - weeks start on Mondays and months on
+    the first. Fixed length periods are aggregated by the database, while M
+    and Y periods are aggregated with NumPy.
+
+    The bars are returned unsaved, unless save is True, in which case they
+    replace any existing bars of the target resolution in their range. The
+    final bar may cover an incomplete period. Only source bars from the start
+    timestamp and before the end timestamp are used, if they are given."""
+
+    check_resolutions(source, target)
+    bars = instrument.bars.filter(resolution=source)
+    if start is not None: bars = bars.filter(timestamp__gte=start)
+    if end is not None: bars = bars.filter(timestamp__lt=end)
+    if resolution_seconds(target) is None:
+        arrays = resample_arrays(bars.to_arrays(), target)
+    else:
+        arrays = aggregate_bars(bars, target)
+    validate_bar_arrays(arrays, target)
+    bars = create_bars(arrays, instrument, target)
+    if save and bars:
+        with transaction.atomic():
+            instrument.bars.filter(
+                resolution=target, timestamp__gte=bars[0].timestamp,
+                timestamp__lte=bars[-1].timestamp
+            ).delete()
+            Bar.objects.bulk_create(bars, batch_size=BATCH_SIZE)
+            LatestBar.refresh(instrument.id, target)
+            Indicator.invalidate(instrument.id, target, bars[0].timestamp)
+        invalidate(instrument.id, target)
+    return bars
+
+
+def check_resolutions(source, target):
+    """Checks that bars of one resolution can be combined into bars of
+    another - the target's periods must each be made of a whole number of
+    source periods."""
+
+    source_secs, target_secs = resolution_seconds(source), resolution_seconds(target)
+    if source_secs is None and target_secs is None:
+        valid = resolution_months(target) % resolution_months(source) == 0
+    elif target_secs is None:
+        valid = 86400 % source_secs == 0
+    elif source_secs is None:
+        valid = False
+    else:
+        valid = target_secs % source_secs == 0
+    if not valid or source == target:
+        raise ValueError(f"Cannot resample {source} bars to {target}")
+
+
+def get_offset(resolution):
+    """Gets the number of seconds after the epoch that a fixed length
+    resolution's periods are counted from - weeks start on Mondays, and 1970
+    started on a Thursday."""
+
+    return WEEK_OFFSET if resolution[-1] == "W" else 0
+
+
+def period_starts(timestamps, resolution):
+    """Gets the timestamp at the start of the period of a resolution that
+    each of an array of timestamps falls in."""
+
+    timestamps = np.asarray(timestamps, dtype="int64")
+    period = resolution_seconds(resolution)
+    if period is None:
+        months = timestamps.astype("datetime64[s]").astype("datetime64[M]")
+        months = months.astype("int64")
+        months -= months % resolution_months(resolution)
+        buckets = months.astype("datetime64[M]").astype("datetime64[s]")
+        return buckets.astype("int64")
+    return timestamps - (timestamps - get_offset(resolution)) % period
+
+
+def aggregate_bars(bars, target):
+    """Aggregates a queryset of bars of one resolution into periods of a fixed
+    length resolution with a GROUP BY query, returning a dictionary of NumPy
+    arrays. Opens and closes are then looked up by the first and last
+    timestamp of each period."""
+
+    period, offset = resolution_seconds(target), get_offset(target)
+    shifted = F("timestamp") - offset
+    bucket = ExpressionWrapper(
+        shifted - ((shifted % period) + period) % period + offset,
+        output_field=IntegerField()
+    )
+    bars = bars.order_by()
+    rows = list(bars.annotate(bucket=bucket).values("bucket").annotate(
+        first=Min("timestamp"), last=Max("timestamp"), high_max=Max("high"),
+        low_min=Min("low"), volume_sum=Sum("volume")
+    ).order_by("bucket").values_list(
+        "bucket", "first", "last", "high_max", "low_min", "volume_sum"
+    ))
+    timestamps = [row[1] for row in rows] + [row[2] for row in rows]
+    prices = {}
+    for start in range(0, len(timestamps), LOOKUP_SIZE):
+        prices.update({row[0]: row[1:] for row in bars.filter(
+            timestamp__in=timestamps[start:start + LOOKUP_SIZE]
+        ).values_list("timestamp", "open", "close")})
+    return {
+        "timestamp": np.array([row[0] for row in rows], dtype="int64"),
+        "open": np.array([prices[row[1]][0] for row in rows], dtype="float64"),
+        "high": np.array([row[3] for row in rows], dtype="float64"),
+        "low": np.array([row[4] for row in rows], dtype="float64"),
+        "close": np.array([prices[row[2]][1] for row in rows], dtype="float64"),
+        "volume": np.array([row[5] for row in rows], dtype="int64"),
+    }
+
+
+def resample_arrays(arrays, target):
+    """Aggregates a dictionary of NumPy bar arrays, sorted by timestamp, into
+    periods of a coarser resolution."""
+
+    timestamps = arrays["timestamp"]
+    if not len(timestamps): return {k: v[:0] for k, v in arrays.items()}
+    buckets = period_starts(timestamps, target)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(timestamps)] - 1
+    return {
+        "timestamp": buckets[starts],
+        "open": arrays["open"][starts],
+        "high": np.maximum.reduceat(arrays["high"], starts),
+        "low": np.minimum.reduceat(arrays["low"], starts),
+        "close": arrays["close"][ends],
+        "volume": np.add.reduceat(arrays["volume"], starts),
+    }
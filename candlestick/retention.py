@@ -0,0 +1,119 @@
+from time import time
+from django.conf import settings
+from django.db import transaction
+from candlestick.arrays import invalidate_resolution
+from candlestick.models import Instrument, Bar, LatestBar
+from candlestick.partitioning import is_partitioned, get_resolutions, drop_partitions
+from candlestick.resample import check_resolutions, period_starts
+from candlestick.utils import resolution_seconds, resolution_months
+from candlestick.yahoo import BATCH_SIZE
+
+def get_policies():
+    """Gets the retention policy of each resolution from the
+    CANDLESTICK_RETENTION setting - a dictionary of resolutions to the number
+    of days their bars are kept for, and the coarser resolutions they are
+    resampled into before being deleted. For example:
+
+        {"m": {"days": 60, "resample": ["15m", "H"]}}
+
+    Resolutions without a policy are kept forever."""
+
+    policies = getattr(settings, "CANDLESTICK_RETENTION", {})
+    for resolution, policy in policies.items():
+        for target in policy.get("resample", []):
+            check_resolutions(resolution, target)
+    return policies
+
+
+def get_cutoff(resolution, days, targets=(), now=None):
+    """Gets the timestamp before which bars of a resolution are older than
+    some number of days, moved back until it is the start of a period of
+    every target resolution - so that only whole periods are resampled. Weeks
+    and months don't nest, so moving back to the start of one target's period
+    can leave it inside another's, and this is repeated until it doesn't."""
+
+    cutoff = int(now or time()) - days * 86400
+    while targets:
+        start = min(int(period_starts([cutoff], target)[0]) for target in targets)
+        if start == cutoff: break
+        cutoff = start
+    return cutoff
+
+
+def resolution_length(resolution):
+    """Gets the rough number of seconds in a resolution's periods, for sorting
+    resolutions from finest to coarsest."""
+
+    return resolution_seconds(resolution) or resolution_months(resolution) * 2629746
+
+
+def prune(resolution, days, resample_to=(), batch_size=BATCH_SIZE, now=None,
+          dry_run=False):
+    """Deletes every instrument's bars of a resolution which are older than
+    some number of days, after resampling them into bars of each of a list of
+    coarser resolutions - which replace any existing bars of those
+    resolutions in their range.
+
+    Bars are deleted an instrument at a time in batches, each in its own
+    transaction, so that no single statement or transaction has to cover all
+    of them. If the resolution has its own partitions, whole months are
+    dropped first.
+
+    If dry_run is True, nothing is saved or deleted. Returns the number of
+    bars which were (or would be) deleted."""
+
+    cutoff = get_cutoff(resolution, days, resample_to, now=now)
+    old = Bar.objects.filter(resolution=resolution, timestamp__lt=cutoff).order_by()
+    if dry_run: return old.count()
+    deleted = 0
+    instruments = list(Instrument.objects.filter(latest_bars__resolution=resolution))
+    for instrument in instruments:
+        for target in resample_to:
+            instrument.resample(resolution, target, save=True, end=cutoff)
+    if is_partitioned() and resolution in get_resolutions():
+        deleted += old.count()
+        drop_partitions(resolution, cutoff)
+        deleted -= old.count()
+    for instrument in instruments:
+        deleted += delete_in_batches(
+            old.filter(instrument=instrument), batch_size=batch_size
+        )
+    if deleted: invalidate_resolution(resolution)
+    for latest in LatestBar.objects.filter(
+        resolution=resolution, timestamp__lt=cutoff
+    ):
+        LatestBar.refresh(latest.instrument_id, resolution)
+    return deleted
+
+
+def delete_in_batches(bars, batch_size=BATCH_SIZE):
+    """Deletes the bars of a queryset a batch at a time, each batch in its own
+    transaction, returning the number deleted. The queryset should be of one
+    instrument's bars and unordered, so that each batch is found through the
+    index rather than by sorting every bar left."""
+
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(bars.values_list("id", flat=True)[:batch_size])
+            if not ids: break
+            Bar.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+    return deleted
+
+
+def prune_all(batch_size=BATCH_SIZE, now=None, dry_run=False, callback=None):
+    """Applies every resolution's retention policy, finest first, returning
+    the number of bars deleted for each resolution. The callback, if there is
+    one, is called with each resolution and its count."""
+
+    counts = {}
+    for resolution, policy in sorted(
+        get_policies().items(), key=lambda item: resolution_length(item[0])
+    ):
+        counts[resolution] = prune(
+            resolution, policy["days"], policy.get("resample", []),
+            batch_size=batch_size, now=now, dry_run=dry_run
+        )
+        if callback: callback(resolution, counts[resolution])
+    return counts
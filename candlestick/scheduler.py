@@ -0,0 +1,227 @@
+import os
+import heapq
+import logging
+import tempfile
+from datetime import timedelta
+from time import time, sleep
+import pandas as pd
+from django.conf import settings
+from django.db import close_old_connections
+from candlestick.engine import update_concurrently
+from candlestick.models import Instrument
+from candlestick.utils import end_timestamp, resolution_seconds
+from candlestick.yahoo import get_last_timestamps
+
+DELAY = 10
+SPREAD = 60
+RETRY = 300
+REFRESH = 300
+
+logger = logging.getLogger(__name__)
+
+def next_close(last, resolution, now, timezone=None):
+    """Works out when the next bar of a resolution to close will do so, given
+    the timestamp of the most recent saved bar - the end of the period now is
+    in, as counted from that bar.
+
+    If a timezone is given, the instrument is taken to trade on weekdays
+    there, so bars starting at weekends are skipped, and bars of D and above
+    close at the end of their day in the timezone rather than in UTC."""
+
+    daily = timezone and resolution[-1] in "DWMY"
+    if daily: now = local_timestamp(now, timezone)
+    start, seconds = last, resolution_seconds(resolution)
+    if seconds is not None and now >= last:
+        start = last + (now - last) // seconds * seconds
+    else:
+        while end_timestamp(start, resolution) <= now:
+            start = end_timestamp(start, resolution)
+    if timezone and resolution[-1] in "smHD":
+        start = skip_weekend(start, resolution, timezone)
+    end = end_timestamp(start, resolution)
+    return utc_timestamp(end, timezone) if daily else end
+
+
+def skip_weekend(start, resolution, timezone):
+    """Moves the start of an intraday or daily bar which falls at a weekend in
+    a timezone on to the first bar starting on the Monday after."""
+
+    if resolution[-1] == "D": local = pd.Timestamp(start, unit="s")
+    else: local = pd.Timestamp(start, unit="s", tz="UTC").tz_convert(timezone)
+    if local.weekday() < 5: return start
+    monday = local.date() + timedelta(days=7 - local.weekday())
+    if resolution[-1] == "D":
+        return int(pd.Timestamp(monday).timestamp())
+    monday = utc_timestamp(int(pd.Timestamp(monday).timestamp()), timezone)
+    seconds = resolution_seconds(resolution)
+    return start + -(-(monday - start) // seconds) * seconds
+
+
+def local_timestamp(timestamp, timezone):
+    """Converts a UNIX timestamp to the timestamp of the same wall clock time
+    in UTC as it is in a timezone."""
+
+    local = pd.Timestamp(timestamp, unit="s", tz="UTC").tz_convert(timezone)
+    return int(local.tz_localize(None).timestamp())
+
+
+def utc_timestamp(timestamp, timezone):
+    """Converts the timestamp of a wall clock time in a timezone, given as if
+    it were UTC, to a real UNIX timestamp."""
+
+    return int(pd.Timestamp(timestamp, unit="s").tz_localize(timezone).timestamp())
+
+
+def get_lock_path():
+    """Gets the path of the scheduler's lock file, from the
+    CANDLESTICK_SCHEDULER_LOCK setting or in the temporary directory."""
+
+    return getattr(settings, "CANDLESTICK_SCHEDULER_LOCK", os.path.join(
+        tempfile.gettempdir(), "candlestick_scheduler.lock"
+    ))
+
+
+def acquire_lock(path=None):
+    """Takes an exclusive lock on a file, so that only one scheduler runs at
+    once. The open file is returned, and the lock is held until it is closed
+    or the process exits - or None is returned if another process holds it."""
+
+    import fcntl
+    f = open(path or get_lock_path(), "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    return f
+
+
+
+class Scheduler:
+    """Keeps instruments up to date in one long-running process, updating
+    each instrument and resolution incrementally just after its next bar
+    closes.
+
+    Instruments are loaded once, and reloaded every refresh seconds to pick
+    up new ones. Instruments which are due at the same time are staggered
+    evenly over the spread (in seconds, but no more than half the
+    resolution), and then updated together by a pool of worker threads. Each
+    update is at least delay seconds after the bar closes, to give Yahoo time
+    to publish it.
+
+    After each instrument is updated the callback, if there is one, is called
+    with the resolution, symbol, saved bars or error, and seconds taken."""
+
+    def __init__(self, resolutions, symbols=None, workers=4, spread=SPREAD,
+                 delay=DELAY, refresh=REFRESH, clock=time, sleep=sleep,
+                 callback=None):
+        self.resolutions, self.symbols = resolutions, symbols
+        self.workers, self.spread, self.delay = workers, spread, delay
+        self.refresh, self.clock, self.sleep = refresh, clock, sleep
+        self.callback = callback
+        self.instruments, self.offsets, self.queue = {}, {}, []
+        self.loaded = None
+
+
+    def load(self):
+        """Loads the instruments to be updated, scheduling any not already
+        scheduled from their latest bars and dropping any which no longer
+        exist."""
+
+        self.loaded = self.clock()
+        instruments = Instrument.objects.all()
+        if self.symbols: instruments = instruments.filter(symbol__in=self.symbols)
+        instruments = list(instruments)
+        new = [i for i in instruments if i.id not in self.instruments]
+        self.instruments = {i.id: i for i in instruments}
+        for resolution in self.resolutions:
+            spread = self.spread
+            seconds = resolution_seconds(resolution)
+            if seconds: spread = min(spread, seconds / 2)
+            for n, instrument in enumerate(instruments):
+                self.offsets[(instrument.id, resolution)] = spread * n / len(instruments)
+            self.schedule(
+                new, resolution, get_last_timestamps(new, resolution), retry=0
+            )
+        return len(new)
+
+
+    def schedule(self, instruments, resolution, lasts, retry=RETRY):
+        """Works out when each of some instruments is next due to be updated
+        at a resolution, from the timestamps of their latest bars. Instruments
+        with no bars are retried after some number of seconds."""
+
+        now = self.clock()
+        for instrument in instruments:
+            last, offset = lasts.get(instrument.id), self.offsets[(instrument.id, resolution)]
+            if last is None:
+                due = now + retry + offset
+            else:
+                due = next_close(
+                    last, resolution, now, instrument.timezone
+                ) + self.delay + offset
+            heapq.heappush(self.queue, (due, instrument.id, resolution))
+
+
+    def run_pending(self):
+        """Updates every instrument and resolution which is now due, a
+        resolution at a time, and schedules their next updates. The number of
+        instruments updated is returned. If their latest bars can't be looked
+        up afterwards, they are retried as if they had none."""
+
+        now, due = self.clock(), {}
+        while self.queue and self.queue[0][0] <= now:
+            _, instrument_id, resolution = heapq.heappop(self.queue)
+            if instrument_id in self.instruments:
+                due.setdefault(resolution, []).append(self.instruments[instrument_id])
+        for resolution, instruments in due.items():
+            try:
+                summary = update_concurrently(
+                    instruments, resolution, workers=self.workers,
+                    incremental=True, callback=self.callback and (
+                        lambda *args: self.callback(resolution, *args)
+                    )
+                )
+                logger.info(
+                    f"Updated {summary['symbols']} instruments at {resolution}, "
+                    f"{summary['errors']} failed, in {summary['seconds']:.2f}s"
+                )
+            except Exception as e:
+                logger.exception(f"Updating instruments at {resolution} failed: {e}")
+            try:
+                lasts = get_last_timestamps(instruments, resolution)
+            except Exception as e:
+                logger.exception(f"Getting latest {resolution} bars failed: {e}")
+                lasts = {}
+            self.schedule(instruments, resolution, lasts)
+        return sum(len(instruments) for instruments in due.values())
+
+
+    def run(self, until=None):
+        """Updates instruments as they become due, sleeping in between, until
+        the clock reaches the until timestamp if there is one - otherwise
+        forever.
+
+        Database connections which have failed or outlived CONN_MAX_AGE are
+        closed before and after each cycle, as Django does around requests,
+        so that the process recovers from database restarts and timeouts
+        rather than failing every cycle on a dead connection."""
+
+        if self.loaded is None: self.load()
+        while until is None or self.clock() < until:
+            close_old_connections()
+            try:
+                if self.clock() - self.loaded >= self.refresh: self.load()
+                self.run_pending()
+            except Exception as e:
+                logger.exception(f"Scheduler cycle failed: {e}")
+            finally:
+                close_old_connections()
+            wake = self.loaded + self.refresh
+            if self.queue: wake = min(wake, self.queue[0][0])
+            if until is not None: wake = min(wake, until)
+            self.sleep(max(wake - self.clock(), 0))
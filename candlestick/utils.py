@@ -1,4 +1,8 @@
+import calendar
 from datetime import datetime
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 import pytz
 
 def timestamp_to_datetime(timestamp, timezone, resolution):
@@ -13,4 +17,99 @@ def timestamp_to_datetime(timestamp, timezone, resolution):
     else:
         naive = datetime.utcfromtimestamp(timestamp)
         utc = pytz.utc.localize(naive, is_dst=None)
-        return utc.astimezone(timezone)
\ No newline at end of file
+        return utc.astimezone(timezone)
+
+
+def timestamps_to_datetimes(timestamps, timezone, resolution):
+    """Converts an array of timestamps at once - the equivalent of
+    timestamp_to_datetime for many bars. The result is a NumPy array of dates
+    (if a resolution above D), a NumPy array of naive datetimes (if no timezone
+    is supplied) or a Pandas index of aware datetimes (if a timezone is
+    supplied)."""
+
+    timestamps = np.asarray(timestamps, dtype="int64")
+    datetimes = timestamps.astype("datetime64[s]")
+    if resolution[-1] in "DWMY": return datetimes.astype("datetime64[D]")
+    if not timezone: return datetimes
+    index = pd.to_datetime(timestamps, unit="s", utc=True)
+    return index.tz_convert(timezone)
+
+
+def end_timestamp(timestamp, resolution):
+    """Works out the timestamp at the end of the period starting at a single
+    timestamp, in the same way as end_timestamps but without the overhead of
+    arrays - which makes it much quicker for one bar at a time."""
+
+    secs = resolution_seconds(resolution)
+    if secs is not None: return timestamp + secs
+    start = datetime.utcfromtimestamp(timestamp)
+    months = start.year * 12 + start.month - 1 + resolution_months(resolution)
+    year, month = divmod(months, 12)
+    day = min(start.day, calendar.monthrange(year, month + 1)[1])
+    return calendar.timegm((
+        year, month + 1, day, start.hour, start.minute, start.second
+    ))
+
+
+def end_timestamps(timestamps, resolution):
+    """Works out the timestamps at the end of the periods starting at an array
+    of timestamps. Fixed length resolutions just add the period. M and Y
+    resolutions add whole months, moving days that don't exist in the final
+    month back to its last day, as dateutil's relativedelta does."""
+
+    timestamps = np.asarray(timestamps, dtype="int64")
+    secs = resolution_seconds(resolution)
+    if secs is not None: return timestamps + secs
+    months = timestamps.astype("datetime64[s]").astype("datetime64[M]")
+    offsets = timestamps - months.astype("datetime64[s]").astype("int64")
+    ends = months + resolution_months(resolution)
+    end_starts = ends.astype("datetime64[s]").astype("int64")
+    end_lengths = (ends + 1).astype("datetime64[s]").astype("int64") - end_starts
+    days = np.minimum(offsets // 86400, end_lengths // 86400 - 1)
+    return end_starts + days * 86400 + offsets % 86400
+
+
+def parse_resolution(resolution):
+    """Splits a resolution into its count and unit - 15m becomes (15, "m")."""
+
+    return int(resolution[:-1] or 1), resolution[-1]
+
+
+@lru_cache()
+def resolution_seconds(resolution):
+    """Gets the length of a resolution in seconds, or None for M and Y
+    resolutions, whose length varies."""
+
+    count, unit = parse_resolution(resolution)
+    if unit in "MY": return None
+    return count * {"s": 1, "m": 60, "H": 3600, "D": 86400, "W": 604800}[unit]
+
+
+@lru_cache()
+def resolution_months(resolution):
+    """Gets the length of an M or Y resolution in months."""
+
+    count, unit = parse_resolution(resolution)
+    return count * 12 if unit == "Y" else count
+
+
+def describe_saved(saved, resolution):
+    """Describes the outcome of saving bars - either the timestamps of the
+    bars saved, or a dictionary of upsert counts."""
+
+    if isinstance(saved, dict):
+        return (
+            f"{saved['inserted']} {resolution} bar"
+            f"{'' if saved['inserted'] == 1 else 's'} inserted, "
+            f"{saved['updated']} updated, {saved['unchanged']} unchanged"
+        )
+    return f"{len(saved)} {resolution} bar{'' if len(saved) == 1 else 's'} saved"
+
+
+def date_to_timestamp(date):
+    """Converts a YYYY-MM-DD date string to the UNIX timestamp of its UTC
+    midnight."""
+
+    return int(pytz.utc.localize(
+        datetime.strptime(date, "%Y-%m-%d")
+    ).timestamp())
@@ -1,49 +1,379 @@
-import yfinance as yf
 import numpy as np
-from datetime import datetime
-from candlestick.models import Bar
+import pandas as pd
+from django.db import transaction
+from candlestick.arrays import append_arrays
+from candlestick.metrics import measure, count_frames, array_bytes
+from candlestick.models import Bar, LatestBar, Indicator, validate_bar_arrays
+from candlestick.providers import get_provider
 
-def fetch(instrument, resolution):
+OHLCV = ["open", "high", "low", "close", "volume"]
+BATCH_SIZE = 1000
+
+def fetch(instrument, resolution, upsert=False):
     """Gets bars from Yahoo for a specific instrument and resolution. Existing
-    bars will be overwritten if they fall within the range."""
+    bars will be overwritten if they fall within the range, and the
+    timestamps of the saved bars are returned.
 
-    ticker = yf.Ticker(instrument.symbol)
-    interval, period = get_yahoo_params(resolution)
-    history = ticker.history(period=period, interval=interval)
-    start = datetime.timestamp(history.iloc[0].name)
-    end = datetime.timestamp(history.iloc[-1].name)
-    instrument.bars.filter(
-        resolution=resolution, timestamp__gte=start, timestamp__lte=end
-    ).delete()
-    return save_bars(history, instrument, resolution)
+    If upsert is True, existing bars are updated in place rather than deleted,
+    and a dictionary of counts is returned instead of the timestamps."""
+
+    history = get_history(instrument, resolution)
+    return save_history(history, instrument, resolution, upsert=upsert)
 
 
-def update(instrument, resolution):
+def update(instrument, resolution, upsert=False, incremental=False):
     """Gets new bars for an instrument. The most recent bar for the resolution
-    will be deleted and refetched, along with any more recent than it."""
+    will be deleted and refetched, along with any more recent than it.
+
+    If upsert is True, refetched bars are updated in place rather than deleted,
+    and a dictionary of counts is returned instead of the timestamps.
+
+    If incremental is True, only prices from the most recent bar onwards are
+    requested, and they are upserted - the most recent bar is updated if it
+    has changed, and later bars are inserted. Nothing is written if there is
+    nothing new."""
 
+    start = get_update_start(instrument, resolution, incremental=incremental)
+    if start is None:
+        return fetch(instrument, resolution, upsert=upsert or incremental)
+    history = get_history(instrument, resolution, start=start)
+    return save_update(
+        history, instrument, resolution, start, upsert=upsert,
+        incremental=incremental
+    )
+
+
+def get_update_start(instrument, resolution, incremental=False):
+    """Works out the timestamp an update of an instrument should request
+    prices from - the most recent bar's own timestamp if the update is
+    incremental, or the date needed to refetch it if not. If the instrument
+    has no bars of the resolution, None is returned and all bars should be
+    fetched."""
+
+    if incremental:
+        last = instrument.latest_bar(resolution)
+        return last.timestamp if last else None
     last = instrument.bars.filter(resolution=resolution).last()
-    if not last: return fetch(instrument, resolution)
-    start = get_start_date(last.timestamp, resolution)
-    interval, _ = get_yahoo_params(resolution)
-    ticker = yf.Ticker(instrument.symbol)
-    history = ticker.history(start=str(datetime.utcfromtimestamp(start).date()), interval=interval)
-    instrument.bars.filter(
-        resolution=resolution, timestamp__gte=start
-    ).delete()
-    return save_bars(history, instrument, resolution)
+    return get_start_date(last.timestamp, resolution) if last else None
+
+
+def save_update(history, instrument, resolution, start, upsert=False,
+                incremental=False):
+    """Saves the prices requested for an update from a start timestamp - only
+    those from the start onwards if the update is incremental, otherwise
+    replacing all bars from the start onwards."""
+
+    if incremental:
+        return save_tail(history, instrument, resolution, start)
+    return save_history(
+        history, instrument, resolution, start=start, upsert=upsert
+    )
+
+
+def fetch_many(instruments, resolution, chunk_size=100, upsert=False):
+    """Gets bars from Yahoo for many instruments, requesting them a chunk of
+    symbols at a time rather than one by one. A dictionary of symbols to
+    saved bars (or errors) is returned."""
+
+    return save_many({None: list(instruments)}, resolution, chunk_size, upsert)
+
+
+def update_many(instruments, resolution, chunk_size=100, upsert=False,
+                incremental=False):
+    """Gets new bars for many instruments. Instruments are grouped by the date
+    they need prices from, and each group is requested a chunk of symbols at a
+    time. Instruments with no bars yet have all their bars fetched. A
+    dictionary of symbols to saved bars (or errors) is returned.
+
+    If incremental is True, prices are requested from the day of each
+    instrument's most recent bar, and only those from that bar onwards are
+    upserted, as with update."""
+
+    instruments = list(instruments)
+    lasts, groups = get_last_timestamps(instruments, resolution), {}
+    for instrument in instruments:
+        last = lasts.get(instrument.id)
+        start = None if last is None else (
+            last if incremental else get_start_date(last, resolution)
+        )
+        if start is not None: start -= start % 86400
+        groups.setdefault(start, []).append(instrument)
+    return save_many(
+        groups, resolution, chunk_size, upsert, lasts=lasts if incremental else None
+    )
+
+
+def save_many(groups, resolution, chunk_size=100, upsert=False, lasts=None):
+    """Takes a dictionary of start timestamps to instruments, requests prices
+    for each group in chunks, and saves them. Instruments which Yahoo returns
+    no prices for are left alone.
+
+    If a dictionary of instrument IDs to the timestamps of their most recent
+    bars is given, the update is incremental - prices from each instrument's
+    most recent bar onwards are upserted, and instruments with no bars have
+    all their prices upserted.
+
+    Each instrument is saved in its own transaction, and one which fails does
+    not affect the others - the error is returned in place of its saved bars,
+    as it is for every instrument in a chunk whose request fails."""
+
+    saved, incremental = {}, lasts is not None
+    for start, instruments in groups.items():
+        for i in range(0, len(instruments), chunk_size):
+            chunk = instruments[i:i + chunk_size]
+            try:
+                histories = get_histories(chunk, resolution, start=start)
+            except Exception as e:
+                for instrument in chunk: saved[instrument.symbol] = e
+                continue
+            for instrument in chunk:
+                history = histories.get(instrument.symbol)
+                if isinstance(history, Exception):
+                    saved[instrument.symbol] = history
+                    continue
+                if history is None or not len(history):
+                    saved[instrument.symbol] = {
+                        "inserted": 0, "updated": 0, "unchanged": 0
+                    } if upsert or incremental else []
+                    continue
+                try:
+                    with transaction.atomic():
+                        if incremental and instrument.id in lasts:
+                            saved[instrument.symbol] = save_tail(
+                                history, instrument, resolution, lasts[instrument.id]
+                            )
+                        else:
+                            saved[instrument.symbol] = save_history(
+                                history, instrument, resolution, start=start,
+                                upsert=upsert or incremental
+                            )
+                except Exception as e: saved[instrument.symbol] = e
+    return saved
+
+
+def get_histories(instruments, resolution, start=None):
+    """Requests prices for several instruments in one call to the data
+    provider, as a dictionary of symbols to dataframes - or to exceptions, for
+    any whose prices couldn't be got.
+
+    This makes no database queries, so it is safe to call from other
+    threads."""
+
+    interval, period = get_yahoo_params(resolution)
+    with measure("request", symbols=len(instruments), resolution=resolution) as record:
+        histories = get_provider().history(
+            [instrument.symbol for instrument in instruments], interval,
+            start=start, period=None if start is not None else period
+        )
+        count_frames(record, histories.values())
+    return histories
+
+
+def get_history(instrument, resolution, start=None, timeout=None):
+    """Requests a dataframe of prices from the data provider for an
+    instrument. If a start timestamp is given, prices from that day onwards
+    are requested, otherwise all available prices are.
+
+    This makes no database queries, so it is safe to call from other
+    threads."""
+
+    interval, period = get_yahoo_params(resolution)
+    with measure("request", symbol=instrument.symbol, resolution=resolution) as record:
+        history = get_provider().history(
+            [instrument.symbol], interval, start=start,
+            period=None if start is not None else period, timeout=timeout
+        ).get(instrument.symbol, pd.DataFrame(columns=[f.title() for f in OHLCV]))
+        count_frames(record, [history])
+    return history
+
+
+def get_history_between(instrument, resolution, start, end):
+    """Requests a dataframe of prices from the data provider for an
+    instrument between two timestamps, or None if it has none.
+
+    This makes no database queries, so it is safe to call from other
+    threads."""
+
+    interval = get_yahoo_params(resolution)[0]
+    with measure("request", symbol=instrument.symbol, resolution=resolution) as record:
+        history = get_provider().history(
+            [instrument.symbol], interval, start=start, end=end
+        ).get(instrument.symbol)
+        count_frames(record, [history])
+    return history
+
+
+def save_history(history, instrument, resolution, start=None, upsert=False):
+    """Saves a dataframe of prices requested from Yahoo. Existing bars from the
+    start timestamp onwards are deleted first - or if there is no start
+    timestamp, those within the range of the dataframe.
+
+    The deletion and the saving happen in one transaction, so bars are never
+    left deleted if the new ones can't be saved, and indicators computed past
+    a replaced bar are recomputed in full when next loaded. If upsert is True, nothing
+    is deleted and existing bars are updated in place instead."""
+
+    if upsert: return upsert_bars(history, instrument, resolution)
+    bars = instrument.bars.filter(resolution=resolution)
+    with transaction.atomic():
+        with measure("delete", symbol=instrument.symbol, resolution=resolution) as record:
+            if start is None and len(history):
+                timestamps = index_to_timestamps(history.index, resolution)
+                start, bars = int(timestamps.min()), bars.filter(
+                    timestamp__lte=int(timestamps.max())
+                )
+            if start is not None:
+                record["rows"] = bars.filter(timestamp__gte=start).delete()[0]
+        if record["rows"]: Indicator.invalidate(instrument.id, resolution, start)
+        return save_bars(history, instrument, resolution)
+
+
+def save_tail(history, instrument, resolution, last):
+    """Upserts the bars in a dataframe of prices from the timestamp of the
+    most recent bar onwards, ignoring any earlier ones."""
+
+    timestamps = index_to_timestamps(history.index, resolution)
+    return upsert_bars(history[timestamps >= last], instrument, resolution)
 
 
 def save_bars(df, instrument, resolution):
-    """Saves a Pandas dataframe of prices to database."""
-
-    bars = [Bar(
-        instrument=instrument, resolution=resolution,
-        open=round(bar.Open, 3), close=round(bar.Close, 3),
-        high=round(bar.High, 3), low=round(bar.Low, 3),
-        volume=int(bar.Volume), timestamp=datetime.timestamp(bar.name)
-    ) for bar in df.replace({np.nan: 0}).iloc()]
-    return Bar.objects.bulk_create(bars)
+    """Saves a Pandas dataframe of prices to database, and adds them to any
+    cached arrays of the instrument's bars.
+
+    Bars are created and inserted a batch at a time, so that only one batch
+    of model instances is held at once however long the dataframe is - the
+    timestamps of the saved bars are returned as a NumPy array rather than
+    the bars themselves."""
+
+    tags = {"symbol": instrument.symbol, "resolution": resolution}
+    arrays = convert_frame(df, resolution, tags)
+    with measure("insert", **tags) as record:
+        for start in range(0, len(arrays["timestamp"]), BATCH_SIZE):
+            Bar.objects.bulk_create(create_bars(
+                arrays, instrument, resolution, start, start + BATCH_SIZE
+            ))
+        record["rows"] = len(arrays["timestamp"])
+    with measure("refresh", **tags):
+        append_arrays(instrument.id, resolution, arrays)
+        LatestBar.refresh(instrument.id, resolution)
+    return arrays["timestamp"]
+
+
+def upsert_bars(df, instrument, resolution):
+    """Saves a Pandas dataframe of prices to database without deleting
+    anything. Bars which don't exist yet are inserted, existing bars whose
+    prices or volume have changed are updated, and the rest are left alone.
+    Indicators computed past an updated bar are recomputed in full when next
+    loaded.
+
+    A dictionary with the number of bars inserted, updated and unchanged is
+    returned."""
+
+    tags = {"symbol": instrument.symbol, "resolution": resolution}
+    arrays = convert_frame(df, resolution, tags)
+    timestamps = arrays["timestamp"]
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    if not len(timestamps): return counts
+    with measure("lookup", **tags) as record:
+        existing = {row[1]: row for row in instrument.bars.filter(
+            resolution=resolution,
+            timestamp__gte=int(timestamps.min()), timestamp__lte=int(timestamps.max())
+        ).values_list("id", "timestamp", *OHLCV)}
+        record["rows"] = len(existing)
+    new, changed = [], []
+    for bar in create_bars(arrays, instrument, resolution):
+        row = existing.get(bar.timestamp)
+        if row is None:
+            new.append(bar)
+        elif tuple(getattr(bar, field) for field in OHLCV) != row[2:]:
+            bar.id = row[0]
+            changed.append(bar)
+    with transaction.atomic():
+        with measure("insert", **tags) as record:
+            Bar.objects.bulk_create(new, batch_size=BATCH_SIZE)
+            record["rows"] = len(new)
+        with measure("update", **tags) as record:
+            Bar.objects.bulk_update(changed, OHLCV, batch_size=BATCH_SIZE)
+            record["rows"] = len(changed)
+        if changed: Indicator.invalidate(
+            instrument.id, resolution, min(bar.timestamp for bar in changed)
+        )
+        if new or changed:
+            with measure("refresh", **tags):
+                append_arrays(instrument.id, resolution, arrays)
+                LatestBar.refresh(instrument.id, resolution)
+    counts["inserted"], counts["updated"] = len(new), len(changed)
+    counts["unchanged"] = len(timestamps) - len(new) - len(changed)
+    return counts
+
+
+def convert_frame(df, resolution, tags):
+    """Converts a dataframe of prices to validated bar arrays, measured as
+    the convert stage."""
+
+    with measure("convert", **tags) as record:
+        arrays = get_bar_arrays(df, resolution)
+        validate_bar_arrays(arrays, resolution)
+        record["rows"], record["bytes"] = len(arrays["timestamp"]), array_bytes(arrays)
+    return arrays
+
+
+def get_bar_arrays(df, resolution=None):
+    """Converts a Pandas dataframe of prices to a dictionary of NumPy arrays,
+    one per bar field. Prices are rounded to three decimal places, missing
+    values become zero, and if a timestamp appears more than once, the last
+    row for it is used."""
+
+    timestamps = index_to_timestamps(df.index, resolution)
+    keep = ~pd.Index(timestamps).duplicated(keep="last")
+    df, arrays = df[keep], {"timestamp": timestamps[keep]}
+    for field in OHLCV:
+        values = df[field.title()].to_numpy(dtype="float64")
+        values = np.where(np.isnan(values), 0, values)
+        arrays[field] = values.astype("int64") if field == "volume" else (
+            np.round(values, 3)
+        )
+    return arrays
+
+
+def index_to_timestamps(index, resolution=None):
+    """Converts a Pandas datetime index to an array of integer UNIX timestamps.
+    Naive datetimes are taken to be UTC.
+
+    For resolutions of D and above, each datetime is replaced by the UNIX
+    midnight of its date where it is - Yahoo gives these as local
+    midnights."""
+
+    index = pd.DatetimeIndex(index)
+    if resolution and resolution[-1] in "DWMY":
+        index = index.tz_localize(None).normalize()
+    elif index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    return index.values.astype("datetime64[s]").astype("int64")
+
+
+def create_bars(arrays, instrument, resolution, start=0, end=None):
+    """Creates unsaved bars from a dictionary of NumPy arrays, optionally only
+    for a slice of them. The bars are created from positional values in field
+    order, which skips most of the model's keyword argument handling."""
+
+    constants = {"id": None, "resolution": resolution, "instrument_id": instrument.id}
+    columns = [
+        [constants[field.attname]] * len(arrays["timestamp"][start:end])
+        if field.attname in constants else arrays[field.attname][start:end].tolist()
+        for field in Bar._meta.concrete_fields
+    ]
+    return [Bar(*values) for values in zip(*columns)]
+
+
+def get_last_timestamps(instruments, resolution):
+    """Gets the timestamp of the most recent bar of a resolution for each of
+    several instruments in one query of the latest bars, as a dictionary of
+    instrument IDs to timestamps. Instruments with no bars are left out."""
+
+    return dict(LatestBar.objects.filter(
+        instrument__in=instruments, resolution=resolution
+    ).values_list("instrument", "timestamp"))
 
 
 def get_yahoo_params(resolution):
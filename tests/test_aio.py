@@ -0,0 +1,49 @@
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar
+from candlestick.aio import afetch, aupdate, aupdate_many
+
+@override_settings(
+    CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+    CANDLESTICK_PROVIDER_OPTIONS={"now": 1624406400}
+)
+class AsyncTests(TestCase):
+
+    def setUp(self):
+        self.aapl = mixer.blend(Instrument, symbol="AAPL")
+        self.tsla = mixer.blend(Instrument, symbol="TSLA")
+
+
+    async def test_can_fetch(self):
+        bars = await afetch(self.aapl, "D")
+        self.assertEqual(len(bars), 36524)
+        self.assertEqual((await self.aapl.alatest_bar("D")).timestamp, bars[-1])
+        counts = await self.aapl.afetch("D", upsert=True)
+        self.assertEqual(counts["unchanged"], 36524)
+
+
+    async def test_can_update(self):
+        counts = await self.aapl.aupdate("H", incremental=True)
+        self.assertGreater(counts["inserted"], 10000)
+        counts = await aupdate(self.aapl, "H", incremental=True)
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 1})
+        bar = await self.aapl.alatest_bar("H")
+        self.assertEqual(bar.timestamp, 1624402800)
+
+
+    async def test_can_update_many(self):
+        with patch("candlestick.yahoo.get_history", side_effect=[
+            ValueError("No data"), (await self.tsla.bars.ato_frame())
+        ]):
+            results = await aupdate_many([self.aapl, self.tsla], "D", concurrency=1)
+        self.assertIsInstance(results["AAPL"], ValueError)
+        self.assertEqual(len(results["TSLA"]), 0)
+
+
+    async def test_can_export(self):
+        await self.aapl.afetch("W")
+        arrays = await self.aapl.bars.filter(resolution="W").ato_arrays()
+        df = await self.aapl.bars.filter(resolution="W").ato_frame(timezone="UTC")
+        self.assertEqual(len(arrays["close"]), len(df))
+        self.assertEqual(df["Close"].iloc[-1], arrays["close"][-1])
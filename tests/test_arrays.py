@@ -0,0 +1,110 @@
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar
+from candlestick.arrays import load_arrays, append_npy, limit_size, series_path
+from candlestick.yahoo import save_bars
+from candlestick.providers import SyntheticProvider
+
+NOW = 1624406400
+
+class ArrayCacheTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(
+            CANDLESTICK_ARRAY_CACHE=self.directory,
+            CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+            CANDLESTICK_PROVIDER_OPTIONS={"now": NOW}
+        )
+        self.settings.enable()
+        self.instrument = mixer.blend(Instrument, symbol="AAPL")
+        self.provider = SyntheticProvider(now=NOW)
+        save_bars(self.history(NOW - 3600, NOW - 600), self.instrument, "m")
+
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+
+    def history(self, start, end):
+        return self.provider.history(["AAPL"], "1m", start=start, end=end)["AAPL"]
+
+
+    def test_can_load_memory_mapped_arrays(self):
+        arrays = load_arrays(self.instrument, "m")
+        self.assertIsInstance(arrays["close"].base, np.memmap)
+        self.assertEqual(len(arrays["timestamp"]), 50)
+        expected = self.instrument.bars.filter(resolution="m").to_arrays()
+        for field, array in expected.items():
+            self.assertTrue(np.array_equal(arrays[field], array))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.instrument.load_arrays("m")["open"]), 50)
+
+
+    def test_saved_bars_are_appended(self):
+        load_arrays(self.instrument, "m")
+        save_bars(self.history(NOW - 600, NOW), self.instrument, "m")
+        with self.assertNumQueries(1):
+            arrays = load_arrays(self.instrument, "m")
+        self.assertEqual(len(arrays["timestamp"]), 60)
+        self.assertEqual(arrays["timestamp"][-1], NOW - 60)
+        self.assertEqual(arrays["close"][-1], self.instrument.latest_bar("m").close)
+
+
+    def test_upserted_tail_replaces_cached_bars(self):
+        load_arrays(self.instrument, "m")
+        self.instrument.update("m", incremental=True)
+        with self.assertNumQueries(1):
+            arrays = load_arrays(self.instrument, "m")
+        expected = self.instrument.bars.filter(resolution="m").to_arrays()
+        self.assertTrue(np.array_equal(arrays["timestamp"], expected["timestamp"]))
+
+
+    def test_stale_arrays_are_rewritten(self):
+        load_arrays(self.instrument, "m")
+        Bar.objects.filter(timestamp=NOW - 660).update(close=1)
+        self.assertEqual(len(load_arrays(self.instrument, "m")["close"]), 50)
+        Bar.objects.create(
+            timestamp=NOW, resolution="m", open=1, high=1, low=1, close=1,
+            volume=1, instrument=self.instrument
+        )
+        arrays = load_arrays(self.instrument, "m")
+        self.assertEqual(len(arrays["close"]), 51)
+        self.assertEqual(arrays["close"][-2], 1)
+
+
+    def test_overlapping_bars_invalidate_arrays(self):
+        load_arrays(self.instrument, "m")
+        self.instrument.bars.filter(timestamp__gte=NOW - 1800).delete()
+        save_bars(self.history(NOW - 1800, NOW - 1200), self.instrument, "m")
+        self.assertFalse(os.path.exists(series_path(self.directory, self.instrument.id, "m")))
+        self.assertEqual(len(load_arrays(self.instrument, "m")["timestamp"]), 40)
+
+
+    def test_can_load_without_bars(self):
+        self.assertEqual(len(load_arrays(self.instrument, "D")["close"]), 0)
+        self.assertEqual(len(load_arrays(self.instrument, "D")["close"]), 0)
+
+
+    def test_can_append_to_npy(self):
+        path = os.path.join(self.directory, "test.npy")
+        np.save(path, np.arange(5))
+        append_npy(path, 3, np.array([7, 8, 9]))
+        self.assertEqual(np.load(path).tolist(), [0, 1, 2, 7, 8, 9])
+
+
+    def test_least_recently_used_arrays_are_removed(self):
+        other = mixer.blend(Instrument, symbol="TSLA")
+        save_bars(self.history(NOW - 3600, NOW - 600), other, "m")
+        load_arrays(self.instrument, "m")
+        time.sleep(0.01)
+        load_arrays(other, "m")
+        limit_size(self.directory, max_bytes=4000)
+        self.assertFalse(os.path.exists(series_path(self.directory, self.instrument.id, "m")))
+        self.assertTrue(os.path.exists(series_path(self.directory, other.id, "m")))
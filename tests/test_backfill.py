@@ -0,0 +1,87 @@
+from io import StringIO
+from unittest.mock import patch, Mock
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Backfill
+from candlestick.backfill import backfill, get_window
+from candlestick.yahoo import upsert_bars
+
+NOW = 1624406400
+
+@override_settings(
+    CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+    CANDLESTICK_PROVIDER_OPTIONS={"now": NOW}
+)
+class BackfillTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument, symbol="AAPL")
+
+
+    def test_can_backfill_in_windows(self):
+        callback = Mock()
+        counts = backfill(
+            self.instrument, "H", start=NOW - 10 * 86400, end=NOW, window=3,
+            callback=callback
+        )
+        self.assertEqual(counts, {"inserted": 240, "updated": 0, "unchanged": 0})
+        self.assertEqual(self.instrument.bars.filter(resolution="H").count(), 240)
+        self.assertEqual(callback.call_count, 4)
+        self.assertEqual(callback.call_args_list[0][0][1]["inserted"], 72)
+        checkpoint = Backfill.objects.get(instrument=self.instrument)
+        self.assertTrue(checkpoint.finished)
+        self.assertEqual(checkpoint.progress, 1)
+        self.assertEqual(self.instrument.latest_bar("H").timestamp, NOW - 3600)
+
+
+    def test_can_resume_interrupted_backfill(self):
+        calls = []
+        def failing_upsert(df, instrument, resolution):
+            calls.append(df)
+            if len(calls) == 3: raise ValueError("Connection lost")
+            return upsert_bars(df, instrument, resolution)
+        with patch("candlestick.backfill.upsert_bars", side_effect=failing_upsert):
+            with self.assertRaises(ValueError):
+                backfill(self.instrument, "H", start=NOW - 10 * 86400, end=NOW, window=3)
+        checkpoint = Backfill.objects.get(instrument=self.instrument)
+        self.assertEqual(checkpoint.position, NOW - 4 * 86400)
+        self.assertAlmostEqual(checkpoint.progress, 0.6)
+        self.assertEqual(self.instrument.bars.count(), 144)
+        counts = backfill(self.instrument, "H", window=3)
+        self.assertEqual(counts["inserted"], 96)
+        self.assertEqual(self.instrument.bars.count(), 240)
+
+
+    def test_can_restart_backfill(self):
+        backfill(self.instrument, "D", start=NOW - 10 * 86400, end=NOW)
+        counts = backfill(
+            self.instrument, "D", start=NOW - 20 * 86400, end=NOW, restart=True
+        )
+        self.assertEqual(counts, {"inserted": 10, "updated": 0, "unchanged": 10})
+        self.assertEqual(Backfill.objects.get().start, NOW - 20 * 86400)
+
+
+    def test_backfill_defaults_to_all_available(self):
+        backfill(self.instrument, "m", end=NOW)
+        checkpoint = Backfill.objects.get()
+        self.assertEqual(checkpoint.start, NOW - 7 * 86400)
+        self.assertEqual(self.instrument.bars.count(), 7 * 1440)
+
+
+    def test_can_get_windows(self):
+        self.assertEqual(get_window("1m"), 7)
+        self.assertEqual(get_window("H"), 90)
+        self.assertEqual(get_window("D"), 3650)
+
+
+    def test_can_backfill_with_command(self):
+        out = StringIO()
+        call_command(
+            "backfill", "AAPL", "D", start="2021-06-01", end="2021-06-23",
+            window=10, stdout=out
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn("AAPL: 45% (to 2021-06-11)", lines[0])
+        self.assertIn("22 D bars inserted", lines[-1])
@@ -4,7 +4,10 @@ from django.test import TestCase
 from django.core.exceptions import ValidationError
 from mixer.backend.django import mixer
 from unittest.mock import patch, PropertyMock
-from candlestick.models import Bar, Instrument
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import pre_save
+from candlestick.models import Bar, Instrument, validate_bar_arrays
 
 class BarCreationTests(TestCase):
 
@@ -43,6 +46,75 @@ class BarCreationTests(TestCase):
                 timestamp=1000, open=1, low=0, high=3, close=2, volume=10,
                 resolution="D", instrument=instrument
             )
+    
+
+    def test_bar_must_be_unique(self):
+        instrument = mixer.blend(Instrument)
+        Bar.objects.create(
+            timestamp=1000, open=1, low=0, high=3, close=2, volume=10,
+            resolution="H", instrument=instrument
+        )
+        Bar.objects.create(
+            timestamp=1000, open=1, low=0, high=3, close=2, volume=10,
+            resolution="m", instrument=instrument
+        )
+        with self.assertRaises(ValidationError):
+            Bar.objects.create(
+                timestamp=1000, open=4, low=0, high=5, close=2, volume=10,
+                resolution="H", instrument=instrument
+            )
+
+
+
+    def test_validation_only_listens_to_own_models(self):
+        self.assertTrue(pre_save.has_listeners(Bar))
+        self.assertTrue(pre_save.has_listeners(Instrument))
+        self.assertFalse(pre_save.has_listeners(ContentType))
+
+
+
+class BarArrayValidationTests(TestCase):
+
+    def setUp(self):
+        self.arrays = {
+            "timestamp": np.array([0, 86400]), "open": np.array([1.0, 2.0]),
+            "high": np.array([3.0, 4.0]), "low": np.array([0.5, 1.0]),
+            "close": np.array([2.0, 3.0]), "volume": np.array([10, 20])
+        }
+
+
+    def test_valid_arrays(self):
+        validate_bar_arrays(self.arrays, "D")
+        validate_bar_arrays(self.arrays, "30m")
+    
+
+    def test_resolution_validation(self):
+        for res in ["X", "3x", "100H"]:
+            with self.assertRaises(ValidationError):
+                validate_bar_arrays(self.arrays, res)
+    
+
+    def test_must_be_unix_midnight_if_res_over_D(self):
+        self.arrays["timestamp"] = np.array([86400, 1000])
+        validate_bar_arrays(self.arrays, "H")
+        with self.assertRaises(ValidationError) as e:
+            validate_bar_arrays(self.arrays, "W")
+        self.assertIn("1000", str(e.exception))
+    
+
+    def test_values_must_be_finite(self):
+        self.arrays["high"] = np.array([3.0, np.nan])
+        with self.assertRaises(ValidationError):
+            validate_bar_arrays(self.arrays, "D")
+        self.arrays["high"] = np.array([3.0, np.inf])
+        with self.assertRaises(ValidationError):
+            validate_bar_arrays(self.arrays, "D")
+    
+
+    def test_values_cannot_be_negative(self):
+        self.arrays["volume"] = np.array([10, -1])
+        with self.assertRaises(ValidationError):
+            validate_bar_arrays(self.arrays, "D")
 
 
 
@@ -56,6 +128,48 @@ class BarOrdering(TestCase):
 
 
 
+class BarExportTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument, timezone="America/New_York")
+        for timestamp, close in [(7200, 3), (3600, 2), (10800, 4)]:
+            mixer.blend(
+                Bar, timestamp=timestamp, resolution="H", open=1, high=5,
+                low=0.5, close=close, volume=10, instrument=self.instrument
+            )
+        mixer.blend(Bar, timestamp=86400, resolution="D")
+    
+
+    def test_can_export_arrays(self):
+        with self.assertNumQueries(2):
+            arrays = self.instrument.bars.filter(resolution="H").to_arrays(chunk_size=2)
+        self.assertEqual(arrays["timestamp"].tolist(), [3600, 7200, 10800])
+        self.assertEqual(arrays["close"].tolist(), [2, 3, 4])
+        self.assertEqual(arrays["volume"].dtype, np.int64)
+        self.assertEqual(arrays["close"].dtype, np.float64)
+    
+
+    def test_can_export_no_arrays(self):
+        arrays = Bar.objects.filter(resolution="Y").to_arrays()
+        self.assertEqual(len(arrays["timestamp"]), 0)
+    
+
+    def test_can_export_frame_in_instrument_timezone(self):
+        df = self.instrument.bars.filter(resolution="H").to_frame()
+        self.assertEqual(list(df.columns), ["Open", "High", "Low", "Close", "Volume"])
+        self.assertEqual(df.Close.tolist(), [2, 3, 4])
+        self.assertEqual(str(df.index.tz), "America/New_York")
+        self.assertEqual(df.index[0], datetime(1970, 1, 1, 1, tzinfo=pytz.UTC))
+    
+
+    def test_can_export_frame_in_given_timezone(self):
+        df = Bar.objects.filter(resolution="H").to_frame()
+        self.assertEqual(str(df.index.tz), "UTC")
+        df = Bar.objects.filter(resolution="H").to_frame(timezone="Europe/London")
+        self.assertEqual(str(df.index.tz), "Europe/London")
+
+
+
 class EndTimestampTests(TestCase):
 
     def test_simple_end_timestamps(self):
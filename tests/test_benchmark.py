@@ -0,0 +1,30 @@
+import json
+from io import StringIO
+from django.test import TestCase
+from django.core.management import call_command
+from candlestick.models import Instrument, Bar
+from candlestick.benchmark import run_benchmarks
+
+class BenchmarkTests(TestCase):
+
+    def test_can_run_benchmarks(self):
+        results = run_benchmarks(sizes=[500, 1000], repeat=2)
+        self.assertEqual(results["database"], "sqlite")
+        self.assertEqual(set(results["sizes"]), {"500", "1000"})
+        for size in results["sizes"].values():
+            self.assertGreater(size["save_bars_rows_per_second"], 0)
+            self.assertGreater(size["row_conversion_rows_per_second"], 0)
+            self.assertGreater(size["vectorised_conversion_rows_per_second"], 0)
+            self.assertGreater(size["latest_price_ms"], 0)
+            self.assertGreater(size["range_query_ms"], 0)
+            self.assertGreater(size["update_ms"], 0)
+            self.assertGreater(size["end_timestamps_per_second"], 0)
+        self.assertFalse(Instrument.objects.count())
+        self.assertFalse(Bar.objects.count())
+    
+
+    def test_can_run_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark", sizes="1e3", repeat=1, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertIn("1000", results["sizes"])
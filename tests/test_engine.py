@@ -0,0 +1,119 @@
+import threading
+import pandas as pd
+from datetime import timezone
+from django.test import TestCase
+from unittest.mock import patch, Mock
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar
+from candlestick.engine import update_concurrently, count_saved
+
+def make_history(*timestamps):
+    return pd.DataFrame(
+        data = {
+            "Open": [10] * len(timestamps), "Close": [12] * len(timestamps),
+            "High": [14] * len(timestamps), "Low": [8] * len(timestamps),
+            "Volume": [100] * len(timestamps)
+        },
+        index=[pd.Timestamp(t, unit="s", tzinfo=timezone.utc) for t in timestamps]
+    )
+
+
+
+class ConcurrentUpdateTests(TestCase):
+
+    def setUp(self):
+        self.aapl = mixer.blend(Instrument, symbol="AAPL")
+        self.tsla = mixer.blend(Instrument, symbol="TSLA")
+        self.amzn = mixer.blend(Instrument, symbol="AMZN")
+        mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.aapl)
+        self.patch1 = patch("candlestick.yahoo.get_history")
+        self.mock_history = self.patch1.start()
+        def history(instrument, resolution, start=None, timeout=None):
+            if instrument.symbol == "AMZN": raise ValueError("No data")
+            if start: return make_history(946684800, 946771200)
+            return make_history(946684800, 946771200, 946857600)
+        self.mock_history.side_effect = history
+    
+
+    def tearDown(self):
+        self.patch1.stop()
+    
+
+    def test_can_update_concurrently(self):
+        callback = Mock()
+        summary = update_concurrently(
+            [self.aapl, self.tsla, self.amzn], "D", workers=2, timeout=5,
+            batch_size=1, callback=callback
+        )
+        self.mock_history.assert_any_call(self.aapl, "D", start=946684800, timeout=5)
+        self.mock_history.assert_any_call(self.tsla, "D", start=None, timeout=5)
+        self.assertEqual(self.aapl.bars.count(), 2)
+        self.assertEqual(self.tsla.bars.count(), 3)
+        self.assertEqual(summary["symbols"], 2)
+        self.assertEqual(summary["bars"], 5)
+        self.assertEqual(summary["errors"], 1)
+        self.assertGreater(summary["bars_per_second"], 0)
+        self.assertEqual(callback.call_count, 3)
+        errors = [c[0] for c in callback.call_args_list if isinstance(c[0][1], Exception)]
+        self.assertEqual(errors[0][0], "AMZN")
+    
+
+    def test_downloads_are_bounded(self):
+        instruments = [mixer.blend(Instrument, symbol=f"X{i}") for i in range(20)]
+        counts, outstanding = {"started": 0, "saved": 0}, []
+        def history(instrument, resolution, start=None, timeout=None):
+            counts["started"] += 1
+            outstanding.append(counts["started"] - counts["saved"])
+            return make_history(946684800)
+        self.mock_history.side_effect = history
+        def callback(*args):
+            counts["saved"] += 1
+        summary = update_concurrently(
+            instruments, "D", workers=2, batch_size=1, callback=callback
+        )
+        self.assertEqual(summary["symbols"], 20)
+        self.assertLessEqual(max(outstanding), 4)
+    
+
+    def test_worker_threads_close_old_connections(self):
+        threads = []
+        with patch(
+            "candlestick.engine.close_old_connections",
+            side_effect=lambda: threads.append(threading.get_ident())
+        ):
+            update_concurrently([self.aapl, self.tsla, self.amzn], "D", workers=2)
+        self.assertEqual(len(threads), 6)
+        self.assertNotIn(threading.get_ident(), threads)
+    
+
+    def test_write_errors_are_isolated(self):
+        with patch("candlestick.yahoo.save_bars") as mock_save:
+            mock_save.side_effect = [Exception("DB error"), [1, 2]]
+            summary = update_concurrently([self.aapl, self.tsla], "D", workers=1)
+        self.assertEqual(summary["symbols"], 1)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["bars"], 2)
+    
+
+    def test_can_upsert_concurrently(self):
+        summary = update_concurrently([self.aapl], "D", workers=1, upsert=True)
+        self.assertEqual(summary["bars"], 2)
+        self.assertEqual(self.aapl.bars.count(), 2)
+    
+
+    def test_can_update_incrementally_concurrently(self):
+        summary = update_concurrently(
+            [self.aapl, self.tsla], "D", workers=1, incremental=True
+        )
+        self.mock_history.assert_any_call(self.aapl, "D", start=946684800, timeout=None)
+        self.assertEqual(summary["bars"], 5)
+        self.assertEqual(self.aapl.bars.count(), 2)
+        self.assertEqual(self.tsla.bars.count(), 3)
+
+
+
+class SavedCountTests(TestCase):
+
+    def test_can_count_saved(self):
+        self.assertEqual(count_saved([1, 2, 3]), 3)
+        self.assertEqual(count_saved({"inserted": 1, "updated": 2, "unchanged": 3}), 3)
@@ -0,0 +1,108 @@
+import numpy as np
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.core.exceptions import ValidationError
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar, validate_bar_arrays
+from candlestick.fields import encode_resolution, decode_resolution
+
+def raw_bars():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT resolution, close FROM candlestick_bar ORDER BY id")
+        return cursor.fetchall()
+
+
+
+class ResolutionCodeTests(TestCase):
+
+    def test_can_encode_resolutions(self):
+        self.assertEqual(encode_resolution("s"), 0)
+        self.assertEqual(encode_resolution("m"), 1)
+        self.assertEqual(encode_resolution("15m"), 121)
+        self.assertEqual(encode_resolution("99Y"), 798)
+
+
+    def test_can_decode_resolutions(self):
+        for resolution in ["s", "m", "2m", "15m", "H", "D", "5D", "W", "M", "3M", "Y"]:
+            self.assertEqual(decode_resolution(encode_resolution(resolution)), resolution)
+
+
+
+@override_settings(CANDLESTICK_COMPACT_STORAGE=True)
+class CompactStorageTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument)
+
+
+    def test_values_are_stored_compactly(self):
+        Bar.objects.create(
+            timestamp=1624406400, resolution="15m", open=320.13, high=321.4,
+            low=319.88, close=320.17, volume=10, instrument=self.instrument
+        )
+        self.assertEqual(raw_bars(), [("121", 320170)]) # Test columns aren't compact
+        bar = Bar.objects.get(resolution="15m", close__gt=320.16)
+        self.assertEqual(bar.close, 320.17)
+        self.assertEqual(bar.resolution, "15m")
+        self.assertEqual(self.instrument.latest_bar("15m").close, 320.17)
+        self.assertEqual(self.instrument.bars.to_arrays()["open"].tolist(), [320.13])
+
+
+    def test_prices_must_fit(self):
+        arrays = {
+            "timestamp": np.array([0]), "open": np.array([3e6]),
+            "high": np.array([3e6]), "low": np.array([1.0]),
+            "close": np.array([1.0]), "volume": np.array([3 * 10 ** 9])
+        }
+        with self.assertRaises(ValidationError):
+            validate_bar_arrays(arrays, "m")
+        with override_settings(CANDLESTICK_COMPACT_STORAGE=False):
+            validate_bar_arrays(arrays, "m")
+
+
+    def test_prices_of_bars_must_fit(self):
+        values = dict(
+            timestamp=0, resolution="m", open=3e6, high=3e6, low=1, close=1,
+            volume=1, instrument=self.instrument
+        )
+        with self.assertRaises(ValidationError) as context:
+            Bar.objects.create(**values)
+        self.assertIn("open", context.exception.message_dict)
+        with self.assertRaises(ValueError), transaction.atomic():
+            Bar.objects.bulk_create([Bar(**values)])
+        self.assertFalse(Bar.objects.exists())
+        Bar.objects.create(**{**values, "open": 2147483.647, "high": 2147483.647})
+        self.assertEqual(Bar.objects.get().high, 2147483.647)
+
+
+
+class CompactStorageMigrationTests(TransactionTestCase):
+
+    def migrate(self, target=None):
+        executor = MigrationExecutor(connection)
+        executor.migrate(
+            [("candlestick", target)] if target else executor.loader.graph.leaf_nodes()
+        )
+
+
+    def test_can_migrate_to_compact_storage(self):
+        self.migrate("0005_partition_bars")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO candlestick_instrument (symbol, currency) VALUES ('AAPL', 'USD')"
+            )
+            cursor.execute(
+                "INSERT INTO candlestick_bar (timestamp, resolution, open, low, "
+                "high, close, volume, instrument_id) SELECT 1624406400, '15m', "
+                "320.13, 319.88, 321.4, 320.17, 10, id FROM candlestick_instrument"
+            )
+        try:
+            with override_settings(CANDLESTICK_COMPACT_STORAGE=True):
+                self.migrate("0006_compact_storage")
+                self.assertEqual(raw_bars(), [(121, 320170)])
+                self.assertEqual(Bar.objects.get().low, 319.88)
+                self.migrate("0005_partition_bars")
+            self.assertEqual(raw_bars(), [("15m", 320.17)])
+        finally:
+            self.migrate()
@@ -0,0 +1,114 @@
+import pytz
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar
+from candlestick.gaps import find_gaps, merge_gaps, repair_gaps
+from candlestick.providers import SyntheticProvider
+from candlestick.yahoo import save_bars
+
+NOW = 1624406400 # Wednesday 23 June 2021
+DAY = 86400
+
+@override_settings(
+    CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+    CANDLESTICK_PROVIDER_OPTIONS={"now": NOW}
+)
+class GapTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument, symbol="AAPL", timezone=None)
+        history = SyntheticProvider(now=NOW).history(
+            ["AAPL"], "60m", start=NOW - 20 * DAY, end=NOW
+        )["AAPL"]
+        save_bars(history, self.instrument, "H")
+        self.bars = self.instrument.bars.filter(resolution="H")
+        self.bars.filter(timestamp__gte=NOW - 15 * DAY, timestamp__lt=NOW - 14 * DAY).delete()
+        self.bars.filter(timestamp=NOW - 5 * 3600).delete()
+
+
+    def create_bars(self, resolution, timestamps):
+        for timestamp in timestamps: mixer.blend(
+            Bar, instrument=self.instrument, resolution=resolution,
+            timestamp=timestamp, open=1, high=1, low=1, close=1
+        )
+
+
+    def test_can_find_gaps(self):
+        with self.assertNumQueries(1):
+            gaps = find_gaps(self.instrument, "H")
+        self.assertEqual(gaps, [
+            (NOW - 15 * DAY, NOW - 14 * DAY), (NOW - 5 * 3600, NOW - 4 * 3600)
+        ])
+        self.assertEqual(self.instrument.find_gaps("H", start=NOW - DAY), gaps[1:])
+        self.assertEqual(self.instrument.find_gaps("H", end=NOW - DAY), gaps[:1])
+        self.assertEqual(self.instrument.find_gaps("D"), [])
+
+
+    def test_can_find_gaps_with_compact_storage(self):
+        with override_settings(CANDLESTICK_COMPACT_STORAGE=True):
+            self.create_bars("D", [NOW - 3 * DAY, NOW - DAY, NOW])
+            self.assertEqual(find_gaps(self.instrument, "D"), [(NOW - 2 * DAY, NOW - DAY)])
+
+
+    def test_can_find_gaps_in_months(self):
+        self.create_bars("M", [1609459200, 1612137600, 1617235200]) # Jan, Feb, Apr
+        self.assertEqual(find_gaps(self.instrument, "M"), [(1614556800, 1617235200)])
+
+
+    def test_weekends_are_not_gaps(self):
+        self.instrument.timezone = pytz.timezone("America/New_York")
+        self.instrument.save()
+        monday = NOW - 2 * DAY
+        self.create_bars("D", [
+            monday - 7 * DAY, monday - 3 * DAY, monday, monday + DAY, monday + 3 * DAY
+        ])
+        self.assertEqual(find_gaps(self.instrument, "D"), [
+            (monday - 6 * DAY, monday - 3 * DAY), (monday + 2 * DAY, monday + 3 * DAY)
+        ])
+        open_, close = monday + 48600, monday + 68400
+        self.create_bars("30m", [
+            close - 3 * DAY, # Friday, then no bars until Monday
+            open_, close, # Gap within Monday
+            open_ + 2 * DAY, # Tuesday missing
+        ])
+        self.assertEqual(find_gaps(self.instrument, "30m"), [
+            (open_ + 1800, close), (close + 1800, open_ + 2 * DAY)
+        ])
+
+
+    def test_can_merge_gaps(self):
+        self.assertEqual(merge_gaps([(0, 10), (20, 30), (50, 60)], 40), [(0, 30), (50, 60)])
+        self.assertEqual(merge_gaps([(0, 100)], 40), [(0, 40), (40, 80), (80, 100)])
+
+
+    def test_can_repair_gaps(self):
+        expected = self.bars.count() + 25
+        ranges = []
+        counts = repair_gaps(
+            self.instrument, "H", window=3, callback=lambda *args: ranges.append(args[0])
+        )
+        self.assertEqual(counts, {"inserted": 25, "updated": 0, "unchanged": 0})
+        self.assertEqual(self.bars.count(), expected)
+        self.assertEqual(len(ranges), 2)
+        self.assertEqual(find_gaps(self.instrument, "H"), [])
+
+
+    def test_only_gaps_are_requested(self):
+        with patch.object(SyntheticProvider, "history", return_value={}) as history:
+            self.instrument.repair_gaps("H", window=30)
+        history.assert_called_once_with(
+            ["AAPL"], "60m", start=NOW - 15 * DAY, end=NOW - 4 * 3600
+        )
+
+
+    def test_can_find_and_repair_gaps_with_command(self):
+        out = StringIO()
+        call_command("gaps", "AAPL", "H", stdout=out)
+        self.assertIn("2 gaps in H bars for AAPL", out.getvalue())
+        self.assertIn("2021-06-08 00:00:00 to 2021-06-09 00:00:00", out.getvalue())
+        call_command("gaps", "all", "H", "--repair", stdout=out)
+        self.assertIn("25 H bars inserted", out.getvalue())
+        self.assertFalse(self.instrument.find_gaps("H"))
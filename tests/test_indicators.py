@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+from django.test import TestCase
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar, Indicator
+from candlestick.indicators import compute, parse_name, sma, ema, rsi, atr, vwap
+from candlestick.yahoo import save_history, upsert_bars
+
+def make_arrays(count):
+    random = np.random.default_rng(1)
+    close = 100 + np.cumsum(random.normal(0, 1, count))
+    return {
+        "timestamp": np.arange(count, dtype="int64") * 3600,
+        "open": close - 0.5, "high": close + random.uniform(0, 2, count),
+        "low": close - random.uniform(0, 2, count), "close": close,
+        "volume": random.integers(1, 1000, count)
+    }
+
+
+def split(arrays, *cuts):
+    bounds = [0, *cuts, len(arrays["timestamp"])]
+    return [{field: array[start:end] for field, array in arrays.items()}
+        for start, end in zip(bounds, bounds[1:])]
+
+
+
+class IndicatorTests(TestCase):
+
+    def setUp(self):
+        self.arrays = make_arrays(300)
+        self.close = self.arrays["close"]
+
+
+    def test_sma(self):
+        values, _ = sma(self.arrays, 5)
+        self.assertTrue(np.isnan(values[:4]).all())
+        expected = [self.close[i - 4:i + 1].mean() for i in range(4, 300)]
+        self.assertTrue(np.allclose(values[4:], expected))
+
+
+    def test_ema(self):
+        values, _ = ema(self.arrays, 10)
+        self.assertTrue(np.isnan(values[:9]).all())
+        expected = [self.close[:10].mean()]
+        for close in self.close[10:]:
+            expected.append(expected[-1] + (close - expected[-1]) * 2 / 11)
+        self.assertTrue(np.allclose(values[9:], expected))
+
+
+    def test_rsi(self):
+        values, _ = rsi(self.arrays, 14)
+        self.assertTrue(np.isnan(values[:14]).all())
+        changes = np.diff(self.close)
+        gain = np.maximum(changes[:14], 0).mean()
+        loss = np.maximum(-changes[:14], 0).mean()
+        expected = [100 - 100 / (1 + gain / loss)]
+        for change in changes[14:]:
+            gain = (gain * 13 + max(change, 0)) / 14
+            loss = (loss * 13 + max(-change, 0)) / 14
+            expected.append(100 - 100 / (1 + gain / loss))
+        self.assertTrue(np.allclose(values[14:], expected))
+        values, _ = rsi({"close": np.arange(20.0)}, 14)
+        self.assertEqual(values[-1], 100)
+
+
+    def test_atr(self):
+        values, _ = atr(self.arrays, 14)
+        self.assertTrue(np.isnan(values[:13]).all())
+        high, low, close = self.arrays["high"], self.arrays["low"], self.close
+        ranges = [high[0] - low[0]] + [
+            max(high[i], close[i - 1]) - min(low[i], close[i - 1])
+            for i in range(1, 300)
+        ]
+        expected = [np.mean(ranges[:14])]
+        for true_range in ranges[14:]:
+            expected.append((expected[-1] * 13 + true_range) / 14)
+        self.assertTrue(np.allclose(values[13:], expected))
+
+
+    def test_vwap(self):
+        values, _ = vwap(self.arrays)
+        typical = (self.arrays["high"] + self.arrays["low"] + self.close) / 3
+        volume = self.arrays["volume"]
+        self.assertAlmostEqual(values[23], (typical[:24] * volume[:24]).sum() / volume[:24].sum())
+        self.assertAlmostEqual(values[24], typical[24])
+        self.assertAlmostEqual(values[26], (typical[24:27] * volume[24:27]).sum() / volume[24:27].sum())
+        values, _ = vwap(self.arrays, anchor=None)
+        self.assertAlmostEqual(values[-1], (typical * volume).sum() / volume.sum())
+
+
+    def test_incremental_computation_matches(self):
+        for name in ["sma_5", "ema_10", "rsi", "atr_3", "vwap"]:
+            expected, _ = compute(self.arrays, name)
+            values, state = [], None
+            for arrays in split(self.arrays, 1, 2, 5, 40, 41, 180):
+                new, state = compute(arrays, name, state)
+                values.append(new)
+            self.assertTrue(np.allclose(
+                np.concatenate(values), expected, equal_nan=True
+            ), name)
+
+
+    def test_names(self):
+        self.assertEqual(parse_name("rsi"), (rsi, 14))
+        self.assertEqual(parse_name("sma_50"), (sma, 50))
+        self.assertEqual(parse_name("vwap"), (vwap, None))
+        for name in ["macd", "sma_", "sma_0", "sma_x", "vwap_5"]:
+            with self.assertRaises(ValueError):
+                parse_name(name)
+
+
+
+class SavedIndicatorTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument)
+        self.arrays = make_arrays(100)
+        for i in range(90): self.create_bar(i)
+
+
+    def create_bar(self, i):
+        Bar.objects.create(
+            instrument=self.instrument, resolution="H",
+            timestamp=self.arrays["timestamp"][i], open=self.arrays["open"][i],
+            high=self.arrays["high"][i], low=self.arrays["low"][i],
+            close=self.arrays["close"][i], volume=self.arrays["volume"][i]
+        )
+
+
+    def expected(self, name):
+        return compute(self.instrument.bars.filter(resolution="H").to_arrays(), name)[0]
+
+
+    def make_history(self, start, end, scale=1):
+        return pd.DataFrame({
+            field.title(): self.arrays[field][start:end] * (
+                1 if field == "volume" else scale
+            ) for field in ["open", "high", "low", "close", "volume"]
+        }, index=pd.to_datetime(self.arrays["timestamp"][start:end], unit="s", utc=True))
+
+
+    def test_can_load_indicator(self):
+        values = self.instrument.indicator("H", "ema_10")
+        self.assertEqual(values["timestamp"].tolist(), self.arrays["timestamp"][:90].tolist())
+        self.assertTrue(np.allclose(values["value"], self.expected("ema_10"), equal_nan=True))
+        indicator = Indicator.objects.get()
+        self.assertEqual((indicator.timestamp, indicator.count), (89 * 3600, 89))
+
+
+    def test_only_new_bars_are_computed(self):
+        self.instrument.indicator("H", "rsi")
+        for i in range(90, 100): self.create_bar(i)
+        with self.assertNumQueries(10):
+            values = self.instrument.indicator("H", "rsi")
+        self.assertEqual(len(values["value"]), 100)
+        self.assertTrue(np.allclose(values["value"], self.expected("rsi"), equal_nan=True))
+
+
+    def test_changed_latest_bar_is_recomputed(self):
+        self.instrument.indicator("H", "sma")
+        self.instrument.bars.filter(timestamp=89 * 3600).update(close=500)
+        values = self.instrument.indicator("H", "sma")
+        self.assertTrue(np.allclose(values["value"], self.expected("sma"), equal_nan=True))
+
+
+    def test_changed_earlier_bars_are_recomputed(self):
+        self.instrument.indicator("H", "atr")
+        self.instrument.bars.filter(timestamp__lt=3600 * 10).delete()
+        values = self.instrument.indicator("H", "atr")
+        self.assertEqual(len(values["value"]), 80)
+        self.assertTrue(np.allclose(values["value"], self.expected("atr"), equal_nan=True))
+
+
+    def test_rewritten_earlier_bars_are_recomputed(self):
+        self.instrument.indicator("H", "ema")
+        upsert_bars(self.make_history(0, 90, scale=0.5), self.instrument, "H")
+        self.assertIsNone(Indicator.objects.get().timestamp)
+        values = self.instrument.indicator("H", "ema")
+        self.assertTrue(np.allclose(values["value"], self.expected("ema"), equal_nan=True))
+        save_history(self.make_history(80, 90, scale=2), self.instrument, "H")
+        values = self.instrument.indicator("H", "ema")
+        self.assertTrue(np.allclose(values["value"], self.expected("ema"), equal_nan=True))
+        bar = self.instrument.bars.get(timestamp=3600)
+        bar.close = 1000
+        bar.save()
+        values = self.instrument.indicator("H", "ema")
+        self.assertTrue(np.allclose(values["value"], self.expected("ema"), equal_nan=True))
+
+
+    def test_rewritten_latest_bar_keeps_state(self):
+        self.instrument.indicator("H", "ema")
+        upsert_bars(self.make_history(89, 90, scale=2), self.instrument, "H")
+        self.assertEqual(Indicator.objects.get().timestamp, 89 * 3600)
+        values = self.instrument.indicator("H", "ema")
+        self.assertTrue(np.allclose(values["value"], self.expected("ema"), equal_nan=True))
+
+
+    def test_can_load_indicator_without_bars(self):
+        values = self.instrument.indicator("D", "vwap")
+        self.assertEqual(len(values["value"]), 0)
+        with self.assertRaises(ValueError):
+            self.instrument.indicator("H", "macd")
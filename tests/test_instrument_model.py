@@ -1,8 +1,10 @@
 from unittest.mock import patch
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.core.cache import caches
 from django.core.exceptions import ValidationError
 from mixer.backend.django import mixer
-from candlestick.models import Instrument, Bar
+from candlestick.models import Instrument, Bar, LatestBar
 
 class InstrumentCreationTests(TestCase):
 
@@ -54,6 +56,79 @@ class InstrumentLatestBar(TestCase):
         mixer.blend(Bar, timestamp=200, close=80, resolution="m", instrument=instrument)
         mixer.blend(Bar, timestamp=400, close=80, resolution="m")
         self.assertEqual(instrument.latest_price, 50)
+    
+
+    def test_can_get_latest_bar_by_resolution(self):
+        instrument = mixer.blend(Instrument)
+        mixer.blend(Bar, timestamp=300, close=50, resolution="m", instrument=instrument)
+        mixer.blend(Bar, timestamp=86400, close=20, resolution="D", instrument=instrument)
+        mixer.blend(Bar, timestamp=0, close=10, resolution="D", instrument=instrument)
+        self.assertEqual(instrument.latest_bar("m").close, 50)
+        self.assertEqual(instrument.latest_bar("D").close, 20)
+        self.assertEqual(instrument.latest_bar().timestamp, 86400)
+        self.assertIsNone(instrument.latest_bar("H"))
+        with self.assertNumQueries(1):
+            self.assertEqual(instrument.latest_price, 20)
+    
+
+    def test_can_refresh_latest_bar(self):
+        instrument = mixer.blend(Instrument)
+        mixer.blend(Bar, timestamp=100, close=20, resolution="m", instrument=instrument)
+        mixer.blend(Bar, timestamp=200, close=30, resolution="m", instrument=instrument)
+        instrument.bars.filter(timestamp=200).delete()
+        self.assertEqual(instrument.latest_price, 30)
+        LatestBar.refresh(instrument.id, "m")
+        self.assertEqual(instrument.latest_price, 20)
+        instrument.bars.all().delete()
+        LatestBar.refresh(instrument.id, "m")
+        self.assertIsNone(instrument.latest_price)
+    
+
+    def test_can_annotate_latest_prices(self):
+        i1 = mixer.blend(Instrument, symbol="A")
+        i2 = mixer.blend(Instrument, symbol="B")
+        i3 = mixer.blend(Instrument, symbol="C")
+        mixer.blend(Bar, timestamp=100, close=20, resolution="m", instrument=i1)
+        mixer.blend(Bar, timestamp=200, close=30, resolution="m", instrument=i1)
+        mixer.blend(Bar, timestamp=86400, close=40, resolution="D", instrument=i2)
+        with self.assertNumQueries(1):
+            prices = [i.latest_price for i in Instrument.objects.with_latest_price()]
+        self.assertEqual(prices, [30, 40, None])
+        with self.assertNumQueries(1):
+            prices = [i.latest_price for i in Instrument.objects.with_latest_price("m")]
+        self.assertEqual(prices, [30, None, None])
+    
+
+    @override_settings(
+        CANDLESTICK_CACHE="default",
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_latest_bars_can_be_cached(self):
+        caches["default"].clear()
+        instrument = mixer.blend(Instrument)
+        mixer.blend(Bar, timestamp=100, close=20, resolution="m", instrument=instrument)
+        self.assertEqual(instrument.latest_price, 20)
+        with self.assertNumQueries(0):
+            self.assertEqual(instrument.latest_price, 20)
+        mixer.blend(Bar, timestamp=200, close=30, resolution="m", instrument=instrument)
+        self.assertEqual(instrument.latest_price, 30)
+
+
+    @override_settings(
+        CANDLESTICK_CACHE="default",
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_cached_latest_bars_are_cleared_on_commit(self):
+        caches["default"].clear()
+        instrument = mixer.blend(Instrument)
+        mixer.blend(Bar, timestamp=100, close=20, resolution="m", instrument=instrument)
+        stale = LatestBar.objects.get(instrument=instrument)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                mixer.blend(Bar, timestamp=200, close=30, resolution="m", instrument=instrument)
+                caches["default"].set(LatestBar.cache_key(instrument.id), stale)
+                self.assertEqual(instrument.latest_price, 20)
+        self.assertEqual(instrument.latest_price, 30)
 
 
 
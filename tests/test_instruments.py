@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import tempfile
+from io import StringIO
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+from candlestick.models import Instrument
+from candlestick.instruments import read_instruments, import_instruments
+from candlestick.management.commands.update import Command as UpdateCommand
+
+class ImportTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        Instrument.objects.create(symbol="AAPL", exchange="NASDAQ", currency="USD")
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f: f.write(content)
+        return path
+
+
+    def test_can_read_csv(self):
+        path = self.write("instruments.csv", "symbol,exchange,currency\nTSLA,NASDAQ,USD\n")
+        self.assertEqual(read_instruments(path), [
+            {"symbol": "TSLA", "exchange": "NASDAQ", "currency": "USD"}
+        ])
+
+
+    def test_can_read_json(self):
+        path = self.write("instruments.json", json.dumps([{"symbol": "TSLA"}]))
+        self.assertEqual(read_instruments(path), [{"symbol": "TSLA"}])
+        rows = read_instruments(os.path.join("candlestick", "fixtures", "instruments.json"))
+        self.assertEqual((rows[0]["symbol"], rows[0]["exchange"]), ("AAPL", "NASDAQ"))
+        with self.assertRaises(ValueError):
+            read_instruments(self.write("instruments.txt", ""))
+
+
+    def test_can_import_instruments(self):
+        counts = import_instruments([
+            {"symbol": "AAPL", "exchange": "NASDAQ", "currency": "USD"},
+            {"symbol": "AAPL", "exchange": "LSE", "currency": "GBP", "timezone": "Europe/London"},
+            {"symbol": "TSLA", "exchange": "", "currency": "USD", "name": "Tesla"},
+            {"symbol": "TSLA", "exchange": "", "currency": "USD", "name": "Tesla Inc."},
+        ])
+        self.assertEqual(counts, {"created": 2, "updated": 0, "unchanged": 1})
+        self.assertEqual(Instrument.objects.count(), 3)
+        tsla = Instrument.objects.get(symbol="TSLA")
+        self.assertEqual((tsla.name, tsla.exchange), ("Tesla Inc.", None))
+        self.assertEqual(str(Instrument.objects.get(exchange="LSE").timezone), "Europe/London")
+
+
+    def test_can_update_instruments(self):
+        with self.assertNumQueries(6):
+            counts = import_instruments([
+                {"symbol": "AAPL", "exchange": "NASDAQ", "currency": "USD", "name": "Apple"},
+                {"symbol": "TSLA", "exchange": "NASDAQ", "currency": "USD"},
+            ], batch_size=1)
+        self.assertEqual(counts, {"created": 1, "updated": 1, "unchanged": 0})
+        self.assertEqual(Instrument.objects.get(symbol="AAPL").name, "Apple")
+
+
+    def test_invalid_rows_save_nothing(self):
+        with self.assertRaises(ValidationError) as context:
+            import_instruments([
+                {"symbol": "TSLA", "currency": "USD"},
+                {"symbol": "GOOG"},
+                {"symbol": "AMZN", "currency": "USD", "timezone": "Mars/Base"},
+                {"symbol": "MSFT", "currency": "USD", "sector": "Tech"},
+            ])
+        self.assertEqual(len(context.exception.messages), 3)
+        self.assertIn("Row 2: currency", context.exception.messages[0])
+        self.assertEqual(Instrument.objects.count(), 1)
+
+
+    def test_can_import_with_command(self):
+        path = self.write("instruments.csv", "symbol,exchange,currency\nTSLA,NASDAQ,USD\nAAPL,NASDAQ,USD\n")
+        out = StringIO()
+        call_command("import_instruments", path, stdout=out)
+        self.assertIn("1 instruments created, 0 updated, 1 unchanged", out.getvalue())
+        path = self.write("instruments.csv", "symbol,currency\nGOOG,\n")
+        with self.assertRaises(CommandError):
+            call_command("import_instruments", path, stdout=out)
+
+
+
+@override_settings(
+    CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+    CANDLESTICK_PROVIDER_OPTIONS={"now": 1624406400}
+)
+class SymbolResolutionTests(TestCase):
+
+    def setUp(self):
+        for symbol in ["AAPL", "TSLA", "GOOG"]: mixer.blend(Instrument, symbol=symbol)
+
+
+    def test_symbols_are_resolved_in_one_query(self):
+        with self.assertNumQueries(1):
+            instruments = UpdateCommand().get_instruments(["TSLA", "AAPL", "TSLA"])
+        self.assertEqual([i.symbol for i in instruments], ["TSLA", "AAPL"])
+        with self.assertRaises(CommandError):
+            UpdateCommand().get_instruments(["TSLA", "MSFT"])
+
+
+    def test_can_update_symbols_with_command(self):
+        out = StringIO()
+        call_command("update", "TSLA,AAPL", "M", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn("for TSLA", lines[0])
+        self.assertIn("for AAPL", lines[1])
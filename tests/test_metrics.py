@@ -0,0 +1,150 @@
+import os
+import socket
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import Mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+from candlestick.models import Instrument
+from candlestick.metrics import measure, profile, summarise, format_profile, stage_measured
+from candlestick.metrics import get_sinks, LoggingSink, StatsdSink, PrometheusSink
+
+NOW = 1624406400
+
+@override_settings(
+    CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+    CANDLESTICK_PROVIDER_OPTIONS={"now": NOW}
+)
+class MeasurementTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument, symbol="AAPL")
+
+
+    def test_can_measure_stage(self):
+        receiver = Mock()
+        stage_measured.connect(receiver)
+        try:
+            with measure("count", symbol="AAPL") as record:
+                Instrument.objects.count()
+                Instrument.objects.count()
+                record["rows"] = 1
+        finally:
+            stage_measured.disconnect(receiver)
+        kwargs = receiver.call_args[1]
+        self.assertEqual(kwargs["stage"], "count")
+        self.assertEqual((kwargs["rows"], kwargs["queries"]), (1, 2))
+        self.assertEqual(kwargs["tags"], {"symbol": "AAPL"})
+        self.assertGreater(kwargs["seconds"], 0)
+
+
+    def test_stages_of_fetch_are_profiled(self):
+        with profile() as records:
+            self.instrument.fetch("H")
+        stages = summarise(records)
+        self.assertEqual(list(stages), ["request", "delete", "convert", "insert", "refresh"])
+        self.assertEqual(stages["request"]["rows"], stages["insert"]["rows"])
+        self.assertGreater(stages["request"]["bytes"], 0)
+        self.assertGreater(stages["insert"]["queries"], 0)
+        self.assertLess(stages["insert"]["queries"], stages["insert"]["rows"])
+        with profile() as records:
+            self.instrument.update("H", incremental=True)
+        self.assertEqual(list(summarise(records)), [
+            "request", "convert", "lookup", "insert", "update"
+        ])
+        self.assertIn("request", format_profile(records).splitlines()[1])
+        with measure("outside"): pass
+        self.assertNotIn("outside", summarise(records))
+
+
+    def test_backfills_and_gap_repairs_are_profiled(self):
+        with profile() as records:
+            self.instrument.backfill("H", start=NOW - 20 * 86400, end=NOW, window=10)
+        self.assertEqual(summarise(records)["request"]["calls"], 2)
+        self.assertEqual(summarise(records)["request"]["rows"], 480)
+        self.instrument.timezone = None
+        self.instrument.bars.filter(timestamp=NOW - 5 * 3600).delete()
+        with profile() as records:
+            self.instrument.repair_gaps("H")
+        self.assertEqual(summarise(records)["request"]["calls"], 1)
+        out = StringIO()
+        call_command(
+            "backfill", "AAPL", "D", "--start", "2021-06-01", "--profile", stdout=out
+        )
+        self.assertIn("request", out.getvalue())
+
+
+    def test_can_profile_commands(self):
+        out = StringIO()
+        call_command("fetch", "AAPL", "D", profile=True, stdout=out)
+        self.assertIn("Stage", out.getvalue())
+        self.assertIn("insert", out.getvalue())
+        call_command("update", "AAPL", "D", stdout=out)
+        self.assertEqual(out.getvalue().count("Stage"), 1)
+
+
+
+class SinkTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_sinks_are_configured_by_settings(self):
+        self.assertEqual(get_sinks(), [])
+        with override_settings(CANDLESTICK_METRICS={
+            "candlestick.metrics.LoggingSink": {"level": "DEBUG"}
+        }):
+            sinks = get_sinks()
+            self.assertEqual(len(sinks), 1)
+            self.assertIs(get_sinks()[0], sinks[0])
+            with self.assertLogs("candlestick.metrics", "DEBUG") as logs:
+                with measure("test", resolution="D") as record: record["rows"] = 5
+        self.assertIn("stage=test", logs.output[0])
+        self.assertIn("rows=5 queries=0 resolution=D", logs.output[0])
+
+
+    def test_logging_sink(self):
+        with self.assertLogs("candlestick.metrics", "INFO") as logs:
+            LoggingSink().record("insert", 0.5, 10, None, 1, {"symbol": "AAPL"})
+        self.assertTrue(logs.output[0].endswith(
+            "stage=insert seconds=0.5000 rows=10 queries=1 symbol=AAPL"
+        ))
+
+
+    def test_statsd_sink(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5)
+        try:
+            sink = StatsdSink(port=server.getsockname()[1], host="127.0.0.1", tags=True)
+            sink.record("insert", 0.5, 10, None, 1, {"symbol": "AAPL"})
+            lines = server.recv(4096).decode().splitlines()
+        finally:
+            server.close()
+        self.assertEqual(lines, [
+            "candlestick.insert.time:500.000|ms|#symbol:AAPL",
+            "candlestick.insert.calls:1|c|#symbol:AAPL",
+            "candlestick.insert.rows:10|c|#symbol:AAPL",
+            "candlestick.insert.queries:1|c|#symbol:AAPL",
+        ])
+
+
+    def test_prometheus_sink(self):
+        path = os.path.join(self.directory, "candlestick.prom")
+        sink = PrometheusSink(path)
+        sink.record("insert", 0.5, 10, None, 1, {"resolution": "D"})
+        sink.record("insert", 0.25, 5, None, 1, {"resolution": "D"})
+        sink.record("request", 2, 15, 1000, 0, {"resolution": "D"})
+        with open(path) as f: lines = f.read().splitlines()
+        self.assertIn("# TYPE candlestick_stage_seconds_total counter", lines)
+        self.assertIn('candlestick_stage_seconds_total{stage="insert",resolution="D"} 0.75', lines)
+        self.assertIn('candlestick_stage_calls_total{stage="insert",resolution="D"} 2', lines)
+        self.assertIn('candlestick_stage_bytes_total{stage="request",resolution="D"} 1000', lines)
+        self.assertFalse(os.path.exists(path + ".tmp"))
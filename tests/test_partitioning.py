@@ -0,0 +1,193 @@
+import numpy as np
+from io import StringIO
+from time import time
+from unittest import skipUnless
+from unittest.mock import patch, Mock, MagicMock
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar, LatestBar
+from candlestick.partitioning import partition_name, month_range, get_months
+from candlestick.partitioning import is_partitioned, partition_table, PartitionBars
+
+def make_connection(first=None):
+    cursor = Mock()
+    def fetchone():
+        sql = cursor.execute.call_args[0][0]
+        if "pg_get_serial_sequence" in sql: return ("public.candlestick_bar_id_seq",)
+        if "MIN" in sql: return (first,)
+    cursor.fetchone.side_effect = fetchone
+    conn = MagicMock(vendor="postgresql")
+    conn.ops.quote_name = lambda name: f'"{name}"'
+    conn.cursor.return_value.__enter__.return_value = cursor
+    return conn, cursor
+
+
+
+class PartitionNameTests(TestCase):
+
+    def test_can_get_partition_names(self):
+        self.assertEqual(partition_name("m"), "candlestick_bar_min")
+        self.assertEqual(partition_name("15m", "2021-06"), "candlestick_bar_15min_202106")
+        self.assertEqual(partition_name("M"), "candlestick_bar_mo")
+        self.assertEqual(partition_name(), "candlestick_bar_other")
+
+
+    def test_can_get_month_range(self):
+        self.assertEqual(month_range("2021-12"), (1638316800, 1640995200))
+
+
+    @patch("candlestick.partitioning.time")
+    def test_can_get_months(self, mock_time):
+        mock_time.return_value = 1624406400
+        months = get_months(1617235200, 2)
+        self.assertEqual([str(m) for m in months], [
+            "2021-04", "2021-05", "2021-06", "2021-07", "2021-08"
+        ])
+        self.assertEqual(len(get_months(1700000000, 2)), 3)
+
+
+
+class PartitioningTests(TestCase):
+
+    @patch("candlestick.partitioning.time")
+    @override_settings(CANDLESTICK_PARTITION_RESOLUTIONS=["m"])
+    def test_can_partition_table(self, mock_time):
+        mock_time.return_value = 1624406400
+        conn, cursor = make_connection(1622505600)
+        partition_table(conn)
+        sql = [c[0][0] for c in cursor.execute.call_args_list]
+        self.assertEqual(sql[0], 'ALTER TABLE "candlestick_bar" RENAME TO "candlestick_bar_unpartitioned"')
+        self.assertIn("PARTITION BY LIST (resolution)", sql[2])
+        self.assertIn('ADD PRIMARY KEY (id, resolution, "timestamp")', sql[3])
+        self.assertIn('ALTER SEQUENCE public.candlestick_bar_id_seq OWNED BY "candlestick_bar".id', sql)
+        attached = [s for s in sql if "ATTACH PARTITION" in s]
+        self.assertEqual(len(attached), 4)
+        self.assertIn('"candlestick_bar_min_202106" FOR VALUES FROM (1622505600) TO (1625097600)', attached[0])
+        self.assertEqual(sql[-3], 'INSERT INTO "candlestick_bar" SELECT * FROM "candlestick_bar_unpartitioned"')
+        self.assertEqual(sql[-2], 'DROP TABLE "candlestick_bar_unpartitioned"')
+        self.assertIn("FOREIGN KEY (instrument_id)", sql[-1])
+
+
+    @skipUnless(connection.vendor == "sqlite", "Needs a database other than PostgreSQL")
+    @override_settings(CANDLESTICK_PARTITION_BARS=True)
+    def test_operation_does_nothing_on_other_databases(self):
+        with patch("candlestick.partitioning.partition_table") as mock_partition:
+            PartitionBars().database_forwards("candlestick", Mock(connection=connection), None, None)
+            self.assertFalse(mock_partition.called)
+        self.assertFalse(is_partitioned())
+
+
+    def test_operation_needs_setting(self):
+        conn, cursor = make_connection()
+        with patch("candlestick.partitioning.partition_table") as mock_partition:
+            PartitionBars().database_forwards("candlestick", Mock(connection=conn), None, None)
+            self.assertFalse(mock_partition.called)
+            with override_settings(CANDLESTICK_PARTITION_BARS=True):
+                PartitionBars().database_forwards("candlestick", Mock(connection=conn), None, None)
+            mock_partition.assert_called_with(conn)
+
+
+    def test_command_needs_partitioned_table(self):
+        with self.assertRaises(CommandError):
+            call_command("create_partitions")
+
+
+
+def count_rows(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+        return cursor.fetchone()[0]
+
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning needs PostgreSQL")
+@override_settings(CANDLESTICK_PARTITION_RESOLUTIONS=["m", "H"])
+class PostgresPartitioningTests(TransactionTestCase):
+
+    def migrate(self, target=None):
+        executor = MigrationExecutor(connection)
+        executor.migrate(
+            [("candlestick", target)] if target else executor.loader.graph.leaf_nodes()
+        )
+
+
+    def tearDown(self):
+        self.migrate()
+
+
+    def test_can_partition_existing_bars_and_back(self):
+        self.check_round_trip()
+
+
+    @override_settings(CANDLESTICK_COMPACT_STORAGE=True)
+    def test_can_partition_compact_bars_and_back(self):
+        self.check_round_trip()
+
+
+    def check_round_trip(self):
+        self.migrate("0004_backfill")
+        apple, tesla = mixer.blend(Instrument), mixer.blend(Instrument)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO candlestick_bar ("timestamp", resolution, open, low, '
+                "high, close, volume, instrument_id) VALUES (%s, %s, 1, 1, 1, %s, 10, %s)", [
+                    (1620000000, "m", 1.5, apple.id), (1623456000, "m", 2.5, apple.id),
+                    (1620000000, "m", 3.5, tesla.id), (1620000000, "H", 4.5, apple.id),
+                    (1619827200, "D", 5.5, apple.id),
+                ]
+            )
+        with override_settings(CANDLESTICK_PARTITION_BARS=True):
+            self.migrate()
+            self.assertTrue(is_partitioned())
+            self.assertEqual(count_rows("candlestick_bar"), 5)
+            self.assertEqual(count_rows("candlestick_bar_min_202105"), 2)
+            self.assertEqual(count_rows("candlestick_bar_min_202106"), 1)
+            self.assertEqual(count_rows("candlestick_bar_h_202105"), 1)
+            self.assertEqual(count_rows("candlestick_bar_other"), 1)
+            self.assertEqual(Bar.objects.get(resolution="D").close, 5.5)
+
+            month = np.datetime64(int(time()), "s").astype("datetime64[M]") + 5
+            bar = Bar.objects.create(
+                instrument=apple, resolution="m", timestamp=month_range(month)[0],
+                open=1, high=1, low=1, close=6.5, volume=10
+            )
+            self.assertEqual(count_rows("candlestick_bar_min_default"), 1)
+            for instrument in [apple, tesla]: LatestBar.refresh(instrument.id, "m")
+            out = StringIO()
+            call_command("create_partitions", months=5, drop_before="2021-06-01", stdout=out)
+            self.assertEqual(out.getvalue().splitlines(), [
+                f"Created {partition_name('m', month - 1)}",
+                f"Created {partition_name('m', month)}",
+                f"Created {partition_name('H', month - 1)}",
+                f"Created {partition_name('H', month)}",
+                "Dropped candlestick_bar_min_202105",
+                "Dropped candlestick_bar_h_202105",
+                "Partitions are up to date",
+            ])
+            self.assertEqual(count_rows("candlestick_bar_min_default"), 0)
+            self.assertEqual(count_rows(partition_name("m", month)), 1)
+            self.assertEqual(
+                sorted(Bar.objects.values_list("close", flat=True)), [2.5, 5.5, 6.5]
+            )
+            self.assertEqual(apple.latest_bar("m").timestamp, bar.timestamp)
+            self.assertFalse(LatestBar.objects.filter(instrument=tesla).exists())
+
+            self.migrate("0004_backfill")
+            self.assertFalse(is_partitioned())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, resolution, close FROM candlestick_bar ORDER BY "timestamp"'
+            )
+            self.assertEqual([row[1:] for row in cursor.fetchall()], [
+                ("D", 5.5), ("m", 2.5), ("m", 6.5)
+            ])
+            cursor.execute(
+                'INSERT INTO candlestick_bar ("timestamp", resolution, open, low, '
+                "high, close, volume, instrument_id) VALUES (1, 'm', 1, 1, 1, 1, 1, %s) "
+                "RETURNING id", [apple.id]
+            )
+            self.assertGreater(cursor.fetchone()[0], bar.id)
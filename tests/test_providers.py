@@ -0,0 +1,259 @@
+import os
+import json
+import tempfile
+import pandas as pd
+from django.test import TestCase, override_settings
+from unittest.mock import patch, Mock, ANY
+from mixer.backend.django import mixer
+from candlestick.models import Instrument
+from candlestick.providers import *
+
+def yahoo_response(status, body):
+    body = body if isinstance(body, str) else json.dumps(body)
+    response = Mock(status_code=status, text=body, url="https://query2.finance.yahoo.com")
+    response.json.side_effect = lambda: json.loads(body)
+    return response
+
+
+
+class ProviderSettingTests(TestCase):
+
+    def test_default_provider_is_yahoo(self):
+        self.assertIsInstance(get_provider(), YahooProvider)
+        self.assertIs(get_provider(), get_provider())
+    
+
+    @override_settings(
+        CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+        CANDLESTICK_PROVIDER_OPTIONS={"now": 1000000}
+    )
+    def test_can_configure_provider(self):
+        provider = get_provider()
+        self.assertIsInstance(provider, SyntheticProvider)
+        self.assertEqual(provider.now, 1000000)
+    
+
+    def test_base_provider_needs_history(self):
+        with self.assertRaises(NotImplementedError):
+            Provider().history(["AAPL"], "1d")
+
+
+
+class YahooProviderTests(TestCase):
+
+    @patch("yfinance.Ticker")
+    def test_can_get_one_symbol(self, mock_ticker):
+        histories = YahooProvider().history(["AAPL"], "1d", start=86400, end=172800, timeout=5)
+        mock_ticker.return_value.history.assert_called_with(
+            interval="1d", start="1970-01-02", end="1970-01-03", timeout=5
+        )
+        self.assertEqual(histories, {"AAPL": mock_ticker.return_value.history.return_value})
+    
+
+    @patch("yfinance.Ticker")
+    def test_can_start_mid_day(self, mock_ticker):
+        YahooProvider().history(["AAPL"], "1h", start=90000)
+        mock_ticker.return_value.history.assert_called_with(
+            interval="1h", start=90000
+        )
+    
+
+    @patch("yfinance.Ticker")
+    def test_can_get_several_symbols(self, mock_ticker):
+        mock_ticker.side_effect = lambda symbol, session: Mock(history=Mock(
+            side_effect=ValueError() if symbol == "TSLA" else lambda **kwargs: symbol
+        ))
+        histories = YahooProvider().history(["AAPL", "TSLA"], "1d", period="7d")
+        self.assertEqual(histories["AAPL"], "AAPL")
+        self.assertIsInstance(histories["TSLA"], ValueError)
+
+
+    @patch("candlestick.providers.sleep")
+    def test_yahoo_errors_are_not_hidden(self, mock_sleep):
+        import yfinance.data
+        def get(data, url, params=None, timeout=30):
+            calls.append(params)
+            if "period1" not in params: return yahoo_response(200, {"chart": {
+                "result": [{"meta": {"exchangeTimezoneName": "America/New_York"}}],
+                "error": None
+            }})
+            if failing[0]: return yahoo_response(503, "<html>Down</html>")
+            return yahoo_response(404, {"chart": {
+                "result": None, "error": {"code": "Not Found", "description": "No data"}
+            }})
+        calls, failing = [], [True]
+        provider = YahooProvider(retries=2)
+        with patch.object(yfinance.data.YfData, "get", get):
+            with patch.object(yfinance.data.YfData, "cache_get", get):
+                with self.assertRaises(ValueError):
+                    provider.history(["CSTEST"], "1d", start=1641600000, end=1642032000)
+                self.assertEqual(len([c for c in calls if "period1" in c]), 3)
+                histories = provider.history(
+                    ["CSTEST", "CSTEST2"], "1d", start=1641600000, end=1642032000
+                )
+                self.assertIsInstance(histories["CSTEST"], ValueError)
+                failing[0] = False
+                histories = provider.history(["CSTEST"], "1d", start=1641600000, end=1642032000)
+                self.assertEqual(len(histories["CSTEST"]), 0)
+
+    @patch("yfinance.Ticker")
+    def test_session_is_shared(self, mock_ticker):
+        provider = YahooProvider()
+        provider.history(["AAPL"], "1d")
+        provider.history(["TSLA"], "1d")
+        sessions = [c[1]["session"] for c in mock_ticker.call_args_list]
+        self.assertIs(sessions[0], sessions[1])
+    
+
+    @patch("candlestick.providers.sleep")
+    def test_retryable_errors_are_retried(self, mock_sleep):
+        error = Exception("Too many requests")
+        error.response = Mock(status_code=429, headers={"Retry-After": "3"})
+        func = Mock(side_effect=[error, ConnectionError(), "OK"])
+        provider = YahooProvider(retries=2, backoff=1, rate=1000)
+        self.assertEqual(provider.request(func, 1, a=2), "OK")
+        func.assert_called_with(1, a=2)
+        self.assertEqual(mock_sleep.call_args_list[0][0][0], 3)
+        self.assertLessEqual(mock_sleep.call_args_list[1][0][0], 2)
+    
+
+    @patch("candlestick.providers.sleep")
+    def test_retries_are_limited(self, mock_sleep):
+        func = Mock(side_effect=TimeoutError())
+        with self.assertRaises(TimeoutError):
+            YahooProvider(retries=3, rate=1000).request(func)
+        self.assertEqual(func.call_count, 4)
+        func = Mock(side_effect=ValueError())
+        with self.assertRaises(ValueError):
+            YahooProvider(retries=3).request(func)
+        self.assertEqual(func.call_count, 1)
+    
+
+    def test_can_tell_retryable_errors(self):
+        error = Exception()
+        error.response = Mock(status_code=503)
+        self.assertTrue(is_retryable(error))
+        error.response = Mock(status_code=404)
+        self.assertFalse(is_retryable(error))
+        YFRateLimitError = type("YFRateLimitError", (Exception,), {})
+        self.assertTrue(is_retryable(YFRateLimitError()))
+        self.assertFalse(is_retryable(KeyError()))
+
+
+
+class RateLimitTests(TestCase):
+
+    @patch("candlestick.providers.sleep")
+    def test_rate_is_unlimited_by_default(self, mock_sleep):
+        provider = YahooProvider()
+        self.assertIsNone(provider.bucket)
+        for _ in range(20): provider.request(lambda: 1)
+        self.assertFalse(mock_sleep.called)
+        self.assertEqual(YahooProvider(rate=2).bucket.rate, 2)
+
+
+
+class TokenBucketTests(TestCase):
+
+    @patch("candlestick.providers.sleep")
+    @patch("candlestick.providers.monotonic")
+    def test_can_limit_rate(self, mock_monotonic, mock_sleep):
+        mock_monotonic.return_value = 100
+        bucket = TokenBucket(rate=2, burst=2)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertFalse(mock_sleep.called)
+        mock_sleep.side_effect = lambda seconds: setattr(
+            mock_monotonic, "return_value", mock_monotonic.return_value + seconds
+        )
+        bucket.acquire()
+        mock_sleep.assert_called_once_with(0.5)
+
+
+class SyntheticProviderTests(TestCase):
+
+    def setUp(self):
+        self.provider = SyntheticProvider(now=1624406400)
+
+
+    def test_can_make_up_prices(self):
+        histories = self.provider.history(["AAPL", "TSLA"], "1m", period="7d")
+        df = histories["AAPL"]
+        self.assertEqual(len(df), 7 * 24 * 60)
+        self.assertEqual(list(df.columns), ["Open", "High", "Low", "Close", "Volume"])
+        self.assertEqual(df.index[-1].timestamp(), 1624406340)
+        self.assertTrue((df.High >= df.Open).all() and (df.High >= df.Close).all())
+        self.assertTrue((df.Low <= df.Open).all() and (df.Low <= df.Close).all())
+        self.assertFalse(df.equals(histories["TSLA"]))
+    
+
+    def test_prices_do_not_depend_on_request(self):
+        full = self.provider.history(["AAPL"], "60m", period="60d")["AAPL"]
+        part = self.provider.history(["AAPL"], "60m", start=1624000000, end=1624200000)["AAPL"]
+        self.assertTrue(part.equals(full.loc[part.index]))
+        self.assertEqual(part.index[0].timestamp(), 1624003200)
+    
+
+    def test_can_make_up_monthly_prices(self):
+        df = self.provider.history(["AAPL"], "3mo", start=1577836800)["AAPL"]
+        self.assertEqual(df.index[0].timestamp(), 1577836800)
+        self.assertEqual(df.index[1].timestamp(), 1585699200)
+    
+
+    def test_can_make_up_many_bars(self):
+        df = SyntheticProvider(now=10 ** 9).history(["X"], "1m", period="2y")["X"]
+        self.assertGreater(len(df), 10 ** 6)
+    
+
+    @override_settings(
+        CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+        CANDLESTICK_PROVIDER_OPTIONS={"now": 1624406400}
+    )
+    def test_can_fetch_and_update_offline(self):
+        instrument = mixer.blend(Instrument, symbol="AAPL")
+        bars = instrument.fetch("H")
+        self.assertGreater(len(bars), 10000)
+        counts = instrument.update("H", upsert=True)
+        self.assertEqual(counts["inserted"] + counts["updated"], 0)
+        self.assertEqual(counts["unchanged"], 48)
+    
+
+    def test_can_update_incrementally_offline(self):
+        instrument = mixer.blend(Instrument, symbol="AAPL")
+        with override_settings(
+            CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+            CANDLESTICK_PROVIDER_OPTIONS={"now": 1624406400}
+        ):
+            instrument.fetch("H")
+            counts = instrument.update("H", incremental=True)
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 1})
+        with override_settings(
+            CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+            CANDLESTICK_PROVIDER_OPTIONS={"now": 1624417200}
+        ):
+            counts = instrument.update("H", incremental=True)
+        self.assertEqual(counts, {"inserted": 3, "updated": 0, "unchanged": 1})
+        self.assertEqual(instrument.latest_bar("H").timestamp, 1624413600)
+
+
+
+class FileProviderTests(TestCase):
+
+    def test_can_read_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            pd.DataFrame({
+                "Open": [1, 2, 3], "High": [2, 3, 4], "Low": [0, 1, 2],
+                "Close": [1, 2, 3], "Volume": [10, 20, 30], "Other": [0, 0, 0]
+            }, index=pd.Index(
+                ["2021-01-01", "2021-01-02", "2021-01-03"], name="Date"
+            )).to_csv(os.path.join(directory, "AAPL_1d.csv"))
+            histories = FileProvider(directory).history(
+                ["AAPL", "TSLA"], "1d", start=1609545600
+            )
+            window = FileProvider(directory).history(
+                ["AAPL"], "1d", start=1609459200, end=1609545600
+            )
+        self.assertEqual(list(histories), ["AAPL"])
+        self.assertEqual(histories["AAPL"].Open.tolist(), [2, 3])
+        self.assertEqual(list(histories["AAPL"].columns), ["Open", "High", "Low", "Close", "Volume"])
+        self.assertEqual(window["AAPL"].Open.tolist(), [1])
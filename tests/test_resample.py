@@ -0,0 +1,98 @@
+import numpy as np
+from django.test import TestCase
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar
+from candlestick.resample import resample, check_resolutions, resample_arrays, period_starts
+
+class ResolutionCheckingTests(TestCase):
+
+    def test_valid_resolutions(self):
+        for source, target in [
+            ["m", "15m"], ["5m", "H"], ["H", "D"], ["D", "W"], ["m", "M"],
+            ["D", "Y"], ["M", "3M"], ["3M", "Y"]
+        ]: check_resolutions(source, target)
+    
+
+    def test_invalid_resolutions(self):
+        for source, target in [
+            ["15m", "m"], ["H", "H"], ["7m", "H"], ["W", "M"], ["M", "D"],
+            ["5M", "Y"]
+        ]:
+            with self.assertRaises(ValueError):
+                check_resolutions(source, target)
+
+
+
+class ResamplingTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument)
+        for n, timestamp in enumerate(range(-600, 1200, 60)):
+            mixer.blend(
+                Bar, timestamp=timestamp, resolution="m", open=n, high=n + 5,
+                low=n, close=n + 1, volume=10, instrument=self.instrument
+            )
+    
+
+    def test_can_resample_fixed_resolution(self):
+        bars = self.instrument.resample("m", "5m")
+        self.assertEqual([b.timestamp for b in bars], [-600, -300, 0, 300, 600, 900])
+        self.assertEqual([b.open for b in bars], [0, 5, 10, 15, 20, 25])
+        self.assertEqual([b.high for b in bars], [9, 14, 19, 24, 29, 34])
+        self.assertEqual([b.low for b in bars], [0, 5, 10, 15, 20, 25])
+        self.assertEqual([b.close for b in bars], [5, 10, 15, 20, 25, 30])
+        self.assertEqual([b.volume for b in bars], [50] * 6)
+        self.assertEqual(bars[0].resolution, "5m")
+        self.assertEqual(bars[0].instrument, self.instrument)
+        self.assertFalse(self.instrument.bars.filter(resolution="5m").count())
+    
+
+    def test_can_resample_range(self):
+        bars = self.instrument.resample("m", "5m", start=0, end=600)
+        self.assertEqual([b.timestamp for b in bars], [0, 300])
+        self.assertEqual([b.open for b in bars], [10, 15])
+    
+
+    def test_can_resample_and_save(self):
+        mixer.blend(Bar, timestamp=0, resolution="15m", instrument=self.instrument)
+        bars = self.instrument.resample("m", "15m", save=True)
+        saved = self.instrument.bars.filter(resolution="15m")
+        self.assertEqual([b.timestamp for b in saved], [-900, 0, 900])
+        self.assertEqual([b.open for b in saved], [0, 10, 25])
+        self.assertEqual([b.close for b in saved], [10, 25, 30])
+        self.assertEqual(len(bars), 3)
+    
+
+    def test_can_resample_months(self):
+        for timestamp in [1577836800, 1580428800, 1580515200, 1585612800]:
+            mixer.blend(
+                Bar, timestamp=timestamp, resolution="D", open=timestamp,
+                high=2e9, low=1, close=timestamp + 1, volume=1,
+                instrument=self.instrument
+            )
+        bars = self.instrument.resample("D", "M")
+        self.assertEqual([b.timestamp for b in bars], [1577836800, 1580515200, 1583020800])
+        self.assertEqual([b.open for b in bars], [1577836800, 1580515200, 1585612800])
+        self.assertEqual([b.close for b in bars], [1580428801, 1580515201, 1585612801])
+        self.assertEqual([b.volume for b in bars], [2, 1, 1])
+        self.assertEqual(bars[0].end_timestamp, bars[1].timestamp)
+        bars = self.instrument.resample("D", "Y")
+        self.assertEqual([b.timestamp for b in bars], [1577836800])
+    
+
+    def test_weeks_start_on_mondays(self):
+        bars = resample_arrays({
+            "timestamp": np.array([1623888000, 1624233600, 1624320000]),
+            "open": np.array([1.0, 2, 3]), "high": np.array([1.0, 2, 3]),
+            "low": np.array([1.0, 2, 3]), "close": np.array([1.0, 2, 3]),
+            "volume": np.array([1, 2, 3])
+        }, "W")
+        self.assertEqual(bars["timestamp"].tolist(), [1623628800, 1624233600])
+        self.assertEqual(bars["volume"].tolist(), [1, 5])
+        self.assertEqual(bars["high"].tolist(), [1, 3])
+    
+
+    def test_can_get_period_starts(self):
+        self.assertEqual(period_starts([1624406399, 1624406400], "H").tolist(), [1624402800, 1624406400])
+        self.assertEqual(period_starts([1624406400], "W").tolist(), [1624233600])
+        self.assertEqual(period_starts([1624406400], "3M").tolist(), [1617235200])
@@ -0,0 +1,106 @@
+from io import StringIO
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from mixer.backend.django import mixer
+from candlestick.models import Instrument, Bar, LatestBar
+from candlestick.retention import get_policies, get_cutoff, prune, prune_all
+
+NOW = 1624406400
+
+@override_settings(
+    CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+    CANDLESTICK_PROVIDER_OPTIONS={"now": NOW}
+)
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument, symbol="AAPL")
+        self.instrument.backfill("m", start=NOW - 3 * 86400, end=NOW)
+    
+
+    def test_can_get_cutoff(self):
+        self.assertEqual(get_cutoff("m", 1, now=NOW + 1000), NOW - 86400 + 1000)
+        self.assertEqual(get_cutoff("m", 1, ["15m", "H"], now=NOW + 1000), NOW - 86400)
+    
+
+    def test_can_prune_and_resample(self):
+        deleted = prune("m", 1, ["15m", "H"], batch_size=500, now=NOW + 1000)
+        self.assertEqual(deleted, 2 * 1440)
+        bars = self.instrument.bars
+        self.assertFalse(bars.filter(resolution="m", timestamp__lt=NOW - 86400).exists())
+        self.assertEqual(bars.filter(resolution="m").count(), 1440)
+        self.assertEqual(bars.filter(resolution="15m").count(), 2 * 96)
+        self.assertEqual(bars.filter(resolution="H").count(), 48)
+        hour = bars.get(resolution="H", timestamp=NOW - 2 * 86400)
+        self.assertEqual(hour.end_timestamp, NOW - 2 * 86400 + 3600)
+        self.assertEqual(self.instrument.latest_bar("m").timestamp, NOW - 60)
+        self.assertEqual(prune("m", 1, ["15m", "H"], now=NOW + 1000), 0)
+    
+
+    def test_cutoff_is_start_of_every_target(self):
+        self.assertEqual(get_cutoff("D", 30, ["W", "M"], now=1713052800), 1704067200)
+        self.assertEqual(get_cutoff("D", 30, ["W", "M"], now=1714521600), 1711929600)
+
+
+    def test_weeks_are_not_split_by_months(self):
+        Bar.objects.bulk_create([Bar(
+            instrument=self.instrument, resolution="D", timestamp=timestamp,
+            open=1, high=1, low=1, close=1, volume=10
+        ) for timestamp in range(1704067200, 1714521600, 86400)])
+        LatestBar.refresh(self.instrument.id, "D")
+        prune("D", 30, ["W", "M"], now=1713052800)
+        prune("D", 30, ["W", "M"], now=1714521600)
+        bars = self.instrument.bars
+        self.assertEqual(bars.get(resolution="W", timestamp=1708905600).volume, 70)
+        self.assertEqual(bars.get(resolution="M", timestamp=1706745600).volume, 290)
+        self.assertEqual(bars.filter(resolution="D").first().timestamp, 1711929600)
+
+
+    def test_can_prune_everything(self):
+        self.assertEqual(prune("m", 0, now=NOW + 60), 3 * 1440)
+        self.assertFalse(self.instrument.bars.exists())
+        self.assertIsNone(self.instrument.latest_bar("m"))
+    
+
+    def test_batches_are_found_per_instrument_without_sorting(self):
+        other = mixer.blend(Instrument, symbol="TSLA")
+        other.backfill("m", start=NOW - 2 * 86400, end=NOW)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(prune("m", 1, batch_size=1000, now=NOW), 3 * 1440)
+        selects = [q["sql"] for q in queries if q["sql"].startswith("SELECT")
+            and "LIMIT 1000" in q["sql"]]
+        self.assertEqual(len(selects), 7)
+        for sql in selects:
+            self.assertIn('"instrument_id" =', sql)
+            self.assertNotIn("ORDER BY", sql)
+        self.assertEqual(other.bars.count(), 1440)
+    
+
+    def test_dry_run_changes_nothing(self):
+        self.assertEqual(prune("m", 1, ["H"], now=NOW, dry_run=True), 2 * 1440)
+        self.assertEqual(self.instrument.bars.count(), 3 * 1440)
+    
+
+    @override_settings(CANDLESTICK_RETENTION={"H": {"days": 1}, "m": {"days": 2, "resample": ["H"]}})
+    def test_can_prune_with_policies(self):
+        self.assertEqual(list(prune_all(now=NOW)), ["m", "H"])
+        self.assertEqual(self.instrument.bars.filter(resolution="m").count(), 2 * 1440)
+        self.assertEqual(self.instrument.bars.filter(resolution="H").count(), 0)
+    
+
+    @override_settings(CANDLESTICK_RETENTION={"H": {"days": 1, "resample": ["m"]}})
+    def test_invalid_policies(self):
+        with self.assertRaises(ValueError): get_policies()
+    
+
+    @override_settings(CANDLESTICK_RETENTION={"m": {"days": 1, "resample": ["H"]}})
+    def test_can_prune_with_command(self):
+        out = StringIO()
+        call_command("prune", dry_run=True, stdout=out)
+        self.assertIn("bars would be deleted", out.getvalue())
+        self.assertEqual(self.instrument.bars.count(), 3 * 1440)
+        call_command("prune", stdout=out)
+        self.assertIn("Pruned 1 resolution", out.getvalue())
+        self.assertTrue(self.instrument.bars.filter(resolution="H").exists())
@@ -0,0 +1,166 @@
+import os
+import pytz
+import shutil
+import tempfile
+from unittest.mock import patch
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+from candlestick.models import Instrument
+from candlestick.scheduler import Scheduler, next_close, acquire_lock
+
+NOW = 1624406400 # Wednesday 23 June 2021
+DAY = 86400
+NEW_YORK = pytz.timezone("America/New_York")
+
+class NextCloseTests(TestCase):
+
+    def test_fixed_resolutions(self):
+        self.assertEqual(next_close(NOW - 3600, "H", NOW + 100), NOW + 3600)
+        self.assertEqual(next_close(NOW, "H", NOW + 100), NOW + 3600)
+        self.assertEqual(next_close(NOW - 10 * DAY, "15m", NOW + 100), NOW + 900)
+        self.assertEqual(next_close(NOW, "D", NOW + 100), NOW + DAY)
+
+
+    def test_monthly_resolutions(self):
+        self.assertEqual(next_close(1609459200, "M", 1612137605), 1614556800)
+        self.assertEqual(next_close(1609459200, "Y", 1612137605), 1640995200)
+
+
+    def test_days_close_in_timezone(self):
+        self.assertEqual(next_close(NOW - 2 * DAY, "D", NOW + 7200, NEW_YORK), NOW + 4 * 3600)
+        self.assertEqual(next_close(NOW - DAY, "D", NOW + 3 * 3600, NEW_YORK), NOW + 4 * 3600)
+
+
+    def test_weekends_are_skipped(self):
+        friday = NOW - 5 * DAY
+        self.assertEqual(
+            next_close(friday, "D", friday + DAY + 5 * 3600, NEW_YORK),
+            friday + 4 * DAY + 4 * 3600
+        )
+        saturday = friday + DAY + 6 * 3600
+        self.assertEqual(
+            next_close(saturday - 3600, "H", saturday, NEW_YORK),
+            friday + 3 * DAY + 5 * 3600
+        )
+        self.assertEqual(next_close(saturday - 3600, "H", saturday), saturday + 3600)
+
+
+
+class LockTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "scheduler.lock")
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_only_one_lock_can_be_held(self):
+        lock = acquire_lock(self.path)
+        self.assertIsNotNone(lock)
+        self.assertIsNone(acquire_lock(self.path))
+        with self.assertRaises(CommandError):
+            call_command("candlestick_scheduler", "H", lock=self.path)
+        lock.close()
+        lock = acquire_lock(self.path)
+        self.assertIsNotNone(lock)
+        lock.close()
+
+
+
+@override_settings(
+    CANDLESTICK_PROVIDER="candlestick.providers.SyntheticProvider",
+    CANDLESTICK_PROVIDER_OPTIONS={"now": NOW}
+)
+class SchedulerTests(TestCase):
+
+    def setUp(self):
+        self.now = NOW
+        self.aapl = mixer.blend(Instrument, symbol="AAPL", timezone=None)
+        self.tsla = mixer.blend(Instrument, symbol="TSLA", timezone=None)
+        self.calls = []
+        self.scheduler = Scheduler(
+            ["H"], clock=lambda: self.now, sleep=self.sleep,
+            callback=lambda *args: self.calls.append(args[:2])
+        )
+
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+    def test_new_instruments_are_due_now_and_spread(self):
+        self.assertEqual(self.scheduler.load(), 2)
+        self.assertEqual(sorted(self.scheduler.queue), [
+            (NOW, self.aapl.id, "H"), (NOW + 30, self.tsla.id, "H")
+        ])
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.calls, [("H", "AAPL")])
+        self.assertEqual(self.aapl.latest_bar("H").timestamp, NOW - 3600)
+
+
+    def test_instruments_are_scheduled_after_bars_close(self):
+        self.scheduler.resolutions = ["H", "D"]
+        self.scheduler.load()
+        self.now += 30
+        self.scheduler.run_pending()
+        self.assertEqual(sorted(self.scheduler.queue), [
+            (NOW + 3600 + 10, self.aapl.id, "H"),
+            (NOW + 3600 + 40, self.tsla.id, "H"),
+            (NOW + DAY + 10, self.aapl.id, "D"),
+            (NOW + DAY + 40, self.tsla.id, "D"),
+        ])
+
+
+    def test_can_run_until_time(self):
+        self.scheduler.run(until=NOW + 3 * 3600 + 60)
+        self.assertEqual(len(self.calls), 8)
+        self.assertEqual(self.now, NOW + 3 * 3600 + 60)
+        self.assertEqual(sorted(self.scheduler.queue)[0][0], NOW + 4 * 3600 + 10)
+
+
+    def test_instruments_without_bars_are_retried(self):
+        with patch("candlestick.yahoo.get_history", side_effect=ValueError("No data")):
+            self.scheduler.load()
+            self.now += 30
+            self.scheduler.run_pending()
+        self.assertEqual(sorted(self.scheduler.queue)[0], (NOW + 330, self.aapl.id, "H"))
+
+
+    def test_deleted_instruments_are_dropped(self):
+        self.scheduler.load()
+        self.tsla.delete()
+        self.scheduler.load()
+        self.now += 60
+        self.scheduler.run_pending()
+        self.assertEqual(self.calls, [("H", "AAPL")])
+
+
+    def test_old_connections_are_closed_around_each_cycle(self):
+        with patch("candlestick.scheduler.close_old_connections") as close:
+            self.scheduler.run(until=NOW + 60)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(close.call_count, 4)
+
+
+    def test_database_errors_do_not_stop_the_scheduler(self):
+        self.scheduler.load()
+        with patch(
+            "candlestick.scheduler.get_last_timestamps",
+            side_effect=OperationalError("server closed the connection")
+        ), patch("candlestick.scheduler.close_old_connections") as close, \
+                self.assertLogs("candlestick.scheduler", "ERROR"):
+            self.scheduler.run(until=NOW + 60)
+            self.now = NOW + 400
+            with patch("candlestick.scheduler.Instrument.objects.all", side_effect=OperationalError):
+                self.scheduler.run(until=NOW + 460)
+        self.assertGreater(close.call_count, 4)
+        self.assertEqual(sorted(self.scheduler.queue), [
+            (NOW + 400 + 300, self.aapl.id, "H"),
+            (NOW + 400 + 330, self.tsla.id, "H"),
+        ])
@@ -1,4 +1,5 @@
 from pathlib import Path
+import os
 import sys
 sys.path.append("../..")
 
@@ -26,4 +27,14 @@ DATABASES = {
     }
 }
 
+if os.environ.get("POSTGRES_DB"):
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ["POSTGRES_DB"],
+        "USER": os.environ.get("POSTGRES_USER", "postgres"),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+        "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+    }
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
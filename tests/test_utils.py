@@ -1,4 +1,5 @@
 from datetime import datetime, date
+import numpy as np
 from candlestick.utils import *
 
 from unittest import TestCase
@@ -31,3 +32,104 @@ class TimestampToDatetimeTests(TestCase):
             timestamp_to_datetime(1222624800, None, "D"),
             date(2008, 9, 28)
         )
+
+
+
+class TimestampsToDatetimesTests(TestCase):
+
+    def test_naive_datetimes(self):
+        result = timestamps_to_datetimes([1222624800, 1222628400], None, "H")
+        self.assertEqual(result.tolist(), [
+            datetime(2008, 9, 28, 18, 0, 0), datetime(2008, 9, 28, 19, 0, 0)
+        ])
+    
+
+    def test_tz_datetimes(self):
+        tz = pytz.timezone("Europe/London")
+        result = timestamps_to_datetimes(np.array([1222624800]), tz, "H")
+        self.assertEqual(result[0], tz.localize(datetime(2008, 9, 28, 19, 0, 0)))
+        self.assertEqual(result[0], timestamp_to_datetime(1222624800, tz, "H"))
+    
+
+    def test_dates(self):
+        result = timestamps_to_datetimes([1222560000, 1222646400], None, "D")
+        self.assertEqual(result.tolist(), [date(2008, 9, 28), date(2008, 9, 29)])
+
+
+
+class EndTimestampsTests(TestCase):
+
+    def test_fixed_end_timestamps(self):
+        self.assertEqual(end_timestamps([100, 200], "30s").tolist(), [130, 230])
+        self.assertEqual(end_timestamps([86400], "4W").tolist(), [2505600])
+    
+
+    def test_month_end_timestamps(self):
+        self.assertEqual(end_timestamps([86400, 2592000], "M").tolist(), [2764800, 5011200])
+        self.assertEqual(end_timestamps([86400], "3M").tolist(), [7862400])
+        self.assertEqual(end_timestamps([-86400], "M").tolist(), [2592000])
+    
+
+    def test_month_ends_move_to_last_day(self):
+        self.assertEqual(end_timestamps([980899200, 949276800], "M").tolist(), [983318400, 951782400])
+    
+
+    def test_year_end_timestamps(self):
+        self.assertEqual(end_timestamps([86400], "Y").tolist(), [31622400])
+        self.assertEqual(end_timestamps([951782400], "Y").tolist(), [983318400])
+
+
+    def test_single_end_timestamps_match_arrays(self):
+        timestamps = [-86400, 86400, 949276800, 951782400, 980899200, 1612051200 + 3600]
+        for resolution in ["30s", "H", "D", "4W", "M", "3M", "Y"]:
+            self.assertEqual(
+                [end_timestamp(t, resolution) for t in timestamps],
+                end_timestamps(timestamps, resolution).tolist()
+            )
+        self.assertIsInstance(end_timestamp(86400, "M"), int)
+
+
+
+class ResolutionTests(TestCase):
+
+    def test_can_parse_resolution(self):
+        self.assertEqual(parse_resolution("m"), (1, "m"))
+        self.assertEqual(parse_resolution("15m"), (15, "m"))
+    
+
+    def test_can_get_resolution_seconds(self):
+        self.assertEqual(resolution_seconds("30s"), 30)
+        self.assertEqual(resolution_seconds("H"), 3600)
+        self.assertEqual(resolution_seconds("2W"), 1209600)
+        self.assertIsNone(resolution_seconds("M"))
+    
+
+    def test_can_get_resolution_months(self):
+        self.assertEqual(resolution_months("3M"), 3)
+        self.assertEqual(resolution_months("Y"), 12)
+
+
+
+class SavedDescriptionTests(TestCase):
+
+    def test_can_describe_saved_bars(self):
+        self.assertEqual(describe_saved([1, 2], "D"), "2 D bars saved")
+        self.assertEqual(describe_saved([1], "H"), "1 H bar saved")
+    
+
+    def test_can_describe_upsert_counts(self):
+        self.assertEqual(
+            describe_saved({"inserted": 1, "updated": 2, "unchanged": 3}, "D"),
+            "1 D bar inserted, 2 updated, 3 unchanged"
+        )
+
+
+
+class DateToTimestampTests(TestCase):
+
+    def test_can_convert_date(self):
+        self.assertEqual(date_to_timestamp("2021-06-23"), 1624406400)
+    
+
+    def test_invalid_dates(self):
+        with self.assertRaises(ValueError): date_to_timestamp("23/06/2021")
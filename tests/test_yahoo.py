@@ -1,11 +1,14 @@
 import pandas as pd
 import numpy as np
 from django.test import TestCase
+from django.core.exceptions import ValidationError
 from datetime import timezone
-from unittest.mock import patch, Mock
+from unittest.mock import patch, Mock, ANY
 from mixer.backend.django import mixer
 from candlestick.models import Instrument, Bar
-from candlestick.yahoo import fetch, update, get_start_date, get_yahoo_params, save_bars
+from candlestick.yahoo import fetch, update, get_start_date, get_yahoo_params, save_bars, upsert_bars, get_history
+from candlestick.yahoo import get_bar_arrays, index_to_timestamps
+from candlestick.yahoo import fetch_many, update_many, get_histories, get_last_timestamps
 
 class FetchTests(TestCase):
 
@@ -38,9 +41,9 @@ class FetchTests(TestCase):
 
 
     def test_can_fetch_bars(self):
-        with self.assertNumQueries(1):
+        with self.assertNumQueries(3):
             bars = fetch(self.instrument, "D")
-        self.mock_ticker.assert_called_with("AAPL")
+        self.mock_ticker.assert_called_with("AAPL", session=ANY)
         self.mock_params.assert_called_with("D")
         self.Ticker.history.assert_called_with(period="max", interval="D")
         self.mock_save.assert_called_with(self.Ticker.history.return_value, self.instrument, "D")
@@ -51,14 +54,25 @@ class FetchTests(TestCase):
         mixer.blend(Bar, timestamp=86400, resolution="D", instrument=self.instrument)
         mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.instrument)
         mixer.blend(Bar, timestamp=946857600, resolution="W", instrument=self.instrument)
-        with self.assertNumQueries(1):
+        with self.assertNumQueries(4):
             bars = fetch(self.instrument, "D")
-        self.mock_ticker.assert_called_with("AAPL")
+        self.mock_ticker.assert_called_with("AAPL", session=ANY)
         self.mock_params.assert_called_with("D")
         self.Ticker.history.assert_called_with(period="max", interval="D")
         self.mock_save.assert_called_with(self.Ticker.history.return_value, self.instrument, "D")
         self.assertEqual(self.instrument.bars.filter(resolution="D").count(), 1)
         self.assertEqual(bars, self.mock_save.return_value)
+    
+
+    @patch("candlestick.yahoo.upsert_bars")
+    def test_can_fetch_bars_and_upsert(self, mock_upsert):
+        mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.instrument)
+        with self.assertNumQueries(0):
+            counts = fetch(self.instrument, "D", upsert=True)
+        mock_upsert.assert_called_with(self.Ticker.history.return_value, self.instrument, "D")
+        self.assertFalse(self.mock_save.called)
+        self.assertEqual(self.instrument.bars.filter(resolution="D").count(), 1)
+        self.assertEqual(counts, mock_upsert.return_value)
 
 
 
@@ -89,18 +103,187 @@ class UpdateTests(TestCase):
     @patch("candlestick.yahoo.fetch")
     def test_can_default_to_fetch(self, mock_fetch):
         update(self.instrument, "D")
-        mock_fetch.assert_called_with(self.instrument, "D")
+        mock_fetch.assert_called_with(self.instrument, "D", upsert=False)
     
 
     def test_updating(self):
         mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.instrument)
         bars = update(self.instrument, "D")
         self.mock_start.assert_called_with(946684800, "D")
-        self.mock_ticker.assert_called_with("AAPL")
+        self.mock_ticker.assert_called_with("AAPL", session=ANY)
         self.Ticker.history.assert_called_with(start="1970-01-02", interval="1d")
         self.mock_save.assert_called_with(self.Ticker.history.return_value, self.instrument, "D")
         self.assertEqual(self.instrument.bars.filter(resolution="D").count(), 0)
         self.assertEqual(bars, self.mock_save.return_value)
+    
+
+    @patch("candlestick.yahoo.upsert_bars")
+    def test_updating_with_upsert(self, mock_upsert):
+        mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.instrument)
+        counts = update(self.instrument, "D", upsert=True)
+        self.Ticker.history.assert_called_with(start="1970-01-02", interval="1d")
+        mock_upsert.assert_called_with(self.Ticker.history.return_value, self.instrument, "D")
+        self.assertEqual(self.instrument.bars.filter(resolution="D").count(), 1)
+        self.assertEqual(counts, mock_upsert.return_value)
+    
+
+    @patch("candlestick.yahoo.fetch")
+    def test_incremental_update_can_default_to_fetch(self, mock_fetch):
+        update(self.instrument, "D", incremental=True)
+        mock_fetch.assert_called_with(self.instrument, "D", upsert=True)
+    
+
+    @patch("candlestick.yahoo.upsert_bars")
+    def test_incremental_update_starts_at_latest_bar(self, mock_upsert):
+        mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.instrument)
+        self.Ticker.history.return_value = pd.DataFrame(index=pd.to_datetime(
+            [946598400, 946684800, 946771200], unit="s", utc=True
+        ))
+        counts = update(self.instrument, "D", incremental=True)
+        self.Ticker.history.assert_called_with(start="2000-01-01", interval="1d")
+        df = mock_upsert.call_args[0][0]
+        self.assertEqual(list(index_to_timestamps(df.index)), [946684800, 946771200])
+        self.assertEqual(self.instrument.bars.filter(resolution="D").count(), 1)
+        self.assertEqual(counts, mock_upsert.return_value)
+
+
+
+class ManyInstrumentTests(TestCase):
+
+    def setUp(self):
+        self.aapl = mixer.blend(Instrument, symbol="AAPL")
+        self.tsla = mixer.blend(Instrument, symbol="TSLA")
+        self.amzn = mixer.blend(Instrument, symbol="AMZN")
+        self.patch1 = patch("candlestick.yahoo.get_histories")
+        self.mock_histories = self.patch1.start()
+        self.df = pd.DataFrame(
+            data = {
+                "Open": [10, 20], "Close": [12, 22], "High": [14, 24],
+                "Low": [8, 18], "Volume": [100, 200]
+            },
+            index=[
+                pd.Timestamp(946684800, unit="s", tzinfo=timezone.utc),
+                pd.Timestamp(946771200, unit="s", tzinfo=timezone.utc),
+            ]
+        )
+        self.mock_histories.return_value = {"AAPL": self.df, "TSLA": self.df}
+    
+
+    def tearDown(self):
+        self.patch1.stop()
+    
+
+    def test_can_fetch_many(self):
+        saved = fetch_many([self.aapl, self.tsla, self.amzn], "D", chunk_size=2)
+        self.mock_histories.assert_any_call([self.aapl, self.tsla], "D", start=None)
+        self.mock_histories.assert_any_call([self.amzn], "D", start=None)
+        self.assertEqual(len(saved["AAPL"]), 2)
+        self.assertEqual(len(saved["TSLA"]), 2)
+        self.assertEqual(saved["AMZN"], [])
+        self.assertEqual(Bar.objects.count(), 4)
+    
+
+    def test_can_update_many(self):
+        mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.aapl)
+        mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.amzn)
+        saved = update_many([self.aapl, self.tsla, self.amzn], "D", upsert=True)
+        self.assertEqual(self.mock_histories.call_count, 2)
+        self.mock_histories.assert_any_call([self.aapl, self.amzn], "D", start=946684800)
+        self.mock_histories.assert_any_call([self.tsla], "D", start=None)
+        self.assertEqual(saved["AAPL"]["inserted"], 1)
+        self.assertEqual(saved["AMZN"], {"inserted": 0, "updated": 0, "unchanged": 0})
+        self.assertEqual(self.amzn.bars.count(), 1)
+    
+
+    def test_can_update_many_incrementally(self):
+        mixer.blend(Bar, timestamp=946771200, resolution="D", instrument=self.aapl, close=1)
+        mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.tsla, close=12)
+        saved = update_many([self.aapl, self.tsla, self.amzn], "D", incremental=True)
+        self.assertEqual(self.mock_histories.call_count, 3)
+        self.mock_histories.assert_any_call([self.aapl], "D", start=946771200)
+        self.mock_histories.assert_any_call([self.tsla], "D", start=946684800)
+        self.assertEqual(saved["AAPL"], {"inserted": 0, "updated": 1, "unchanged": 0})
+        self.assertEqual(saved["AMZN"], {"inserted": 0, "updated": 0, "unchanged": 0})
+        self.assertEqual(self.aapl.bars.count(), 1)
+        self.assertEqual(self.aapl.bars.get().close, 22)
+        self.assertEqual(saved["TSLA"]["inserted"], 1)
+    
+
+    def test_failures_are_isolated(self):
+        mixer.blend(Bar, timestamp=946684800, resolution="D", instrument=self.aapl)
+        self.mock_histories.return_value = {
+            "AAPL": self.df.drop(columns=["Close"]), "TSLA": self.df
+        }
+        saved = fetch_many([self.aapl, self.tsla], "D", chunk_size=1)
+        self.assertIsInstance(saved["AAPL"], KeyError)
+        self.assertEqual(len(saved["TSLA"]), 2)
+        self.assertEqual(self.aapl.bars.count(), 1)
+        self.mock_histories.side_effect = [ValueError("Timed out"), {"AMZN": self.df}]
+        saved = fetch_many([self.aapl, self.tsla, self.amzn], "D", chunk_size=2)
+        self.assertIsInstance(saved["AAPL"], ValueError)
+        self.assertIsInstance(saved["TSLA"], ValueError)
+        self.assertEqual(len(saved["AMZN"]), 2)
+        self.mock_histories.side_effect = None
+        self.mock_histories.return_value = {"AAPL": ValueError("503"), "TSLA": self.df}
+        saved = fetch_many([self.aapl, self.tsla], "D")
+        self.assertIsInstance(saved["AAPL"], ValueError)
+        self.assertEqual(len(saved["TSLA"]), 2)
+        self.assertEqual(self.aapl.bars.count(), 1)
+    
+
+    def test_can_get_last_timestamps(self):
+        mixer.blend(Bar, timestamp=100, resolution="H", instrument=self.aapl)
+        mixer.blend(Bar, timestamp=300, resolution="H", instrument=self.aapl)
+        mixer.blend(Bar, timestamp=86400, resolution="D", instrument=self.aapl)
+        mixer.blend(Bar, timestamp=200, resolution="H", instrument=self.tsla)
+        with self.assertNumQueries(1):
+            lasts = get_last_timestamps([self.aapl, self.tsla, self.amzn], "H")
+        self.assertEqual(lasts, {self.aapl.id: 300, self.tsla.id: 200})
+
+
+
+class HistoriesTests(TestCase):
+
+    @patch("yfinance.Ticker")
+    def test_can_get_several_histories(self, mock_ticker):
+        aapl = mixer.blend(Instrument, symbol="AAPL")
+        tsla = mixer.blend(Instrument, symbol="TSLA")
+        frames = {
+            "AAPL": pd.DataFrame({"Open": [1, 3], "Close": [2, 4]}),
+            "TSLA": pd.DataFrame({"Open": [5], "Close": [6]}),
+        }
+        mock_ticker.side_effect = lambda symbol, session: Mock(
+            history=Mock(return_value=frames[symbol])
+        )
+        histories = get_histories([aapl, tsla], "D", start=86400)
+        self.assertEqual(sorted(c[0][0] for c in mock_ticker.call_args_list), ["AAPL", "TSLA"])
+        self.assertEqual(list(histories["AAPL"].Open), [1, 3])
+        self.assertEqual(list(histories["TSLA"].Open), [5])
+    
+
+    @patch("yfinance.Ticker")
+    def test_can_get_single_history(self, mock_ticker):
+        aapl = mixer.blend(Instrument, symbol="AAPL")
+        histories = get_histories([aapl], "D")
+        mock_ticker.assert_called_with("AAPL", session=ANY)
+        mock_ticker.return_value.history.assert_called_with(
+            period="100y", interval="1d"
+        )
+        self.assertEqual(histories, {"AAPL": mock_ticker.return_value.history.return_value})
+
+
+
+class HistoryTests(TestCase):
+
+    @patch("yfinance.Ticker")
+    def test_can_get_history_with_timeout(self, mock_ticker):
+        instrument = mixer.blend(Instrument, symbol="AAPL")
+        history = get_history(instrument, "D", start=86400, timeout=5)
+        mock_ticker.assert_called_with("AAPL", session=ANY)
+        mock_ticker.return_value.history.assert_called_with(
+            start="1970-01-02", interval="1d", timeout=5
+        )
+        self.assertEqual(history, mock_ticker.return_value.history.return_value)
 
 
 
@@ -133,6 +316,139 @@ class BarSavingTests(TestCase):
         bar = instrument.bars.last()
         self.assertEqual(bar.open, 30)
         self.assertEqual(bar.volume, 0)
+        self.assertEqual(instrument.latest_bar("D").timestamp, 946857600)
+    
+
+    def test_duplicate_timestamps_use_last_row(self):
+        instrument = mixer.blend(Instrument, symbol="AAPL")
+        df = pd.DataFrame(
+            data = {
+                "Open": [10, 20], "Close": [12, 22], "High": [14, 24],
+                "Low": [8, 18], "Volume": [100, 200]
+            },
+            index=[
+                pd.Timestamp(946684800, unit="s", tzinfo=timezone.utc),
+                pd.Timestamp(946684800, unit="s", tzinfo=timezone.utc),
+            ]
+        )
+        bars = save_bars(df, instrument, "D")
+        self.assertEqual(len(bars), 1)
+        self.assertEqual(instrument.bars.get().open, 20)
+
+
+
+class BarArrayTests(TestCase):
+
+    def test_can_get_bar_arrays(self):
+        df = pd.DataFrame(
+            data = {
+                "Open": [10.12345, 20, 30], "Close": [12, 22, np.nan],
+                "High": [14, 24, 34], "Low": [8, 18, 28],
+                "Volume": [100, 200, np.nan]
+            },
+            index=[
+                pd.Timestamp(946684800, unit="s", tzinfo=timezone.utc),
+                pd.Timestamp(946771200, unit="s", tzinfo=timezone.utc),
+                pd.Timestamp(946771200, unit="s", tzinfo=timezone.utc),
+            ]
+        )
+        arrays = get_bar_arrays(df)
+        self.assertEqual(arrays["timestamp"].tolist(), [946684800, 946771200])
+        self.assertEqual(arrays["open"].tolist(), [10.123, 30])
+        self.assertEqual(arrays["close"].tolist(), [12, 0])
+        self.assertEqual(arrays["volume"].tolist(), [100, 0])
+        self.assertEqual(arrays["volume"].dtype, np.int64)
+    
+
+    def test_can_convert_index_to_timestamps(self):
+        index = pd.DatetimeIndex([
+            pd.Timestamp(946684800, unit="s", tzinfo=timezone.utc)
+        ]).tz_convert("America/New_York")
+        self.assertEqual(index_to_timestamps(index).tolist(), [946684800])
+        index = pd.DatetimeIndex([pd.Timestamp(946684800, unit="s")])
+        self.assertEqual(index_to_timestamps(index).tolist(), [946684800])
+    
+
+    def test_daily_timestamps_use_local_date(self):
+        index = pd.DatetimeIndex([
+            pd.Timestamp("2000-01-01", tz="America/New_York"),
+            pd.Timestamp("2000-01-02", tz="America/New_York"),
+        ])
+        self.assertEqual(index_to_timestamps(index, "D").tolist(), [946684800, 946771200])
+        self.assertEqual(index_to_timestamps(index, "H").tolist(), [946702800, 946789200])
+    
+
+    def test_cannot_save_invalid_bars(self):
+        instrument = mixer.blend(Instrument, symbol="AAPL")
+        df = pd.DataFrame(
+            data = {
+                "Open": [10, -20], "Close": [12, 22], "High": [14, 24],
+                "Low": [8, 18], "Volume": [100, 200]
+            },
+            index=[
+                pd.Timestamp(946684800, unit="s", tzinfo=timezone.utc),
+                pd.Timestamp(946771200, unit="s", tzinfo=timezone.utc),
+            ]
+        )
+        with self.assertRaises(ValidationError):
+            save_bars(df, instrument, "D")
+        with self.assertRaises(ValidationError):
+            upsert_bars(df, instrument, "D")
+        self.assertEqual(instrument.bars.count(), 0)
+
+
+
+class BarUpsertingTests(TestCase):
+
+    def setUp(self):
+        self.instrument = mixer.blend(Instrument, symbol="AAPL")
+        self.df = pd.DataFrame(
+            data = {
+                "Open": [10, 20, 30],  "Close": [12, 22, 32], 
+                "High": [14, 24, 34], "Low": [8, 18, 28],
+                "Volume": [100, 200, 300]
+            },
+            columns=["Open", "Close", "High", "Low", "Volume"],
+            index=[
+                pd.Timestamp(946684800, unit="s", tzinfo=timezone.utc),
+                pd.Timestamp(946771200, unit="s", tzinfo=timezone.utc),
+                pd.Timestamp(946857600, unit="s", tzinfo=timezone.utc),
+            ]
+        )
+
+
+    def test_can_upsert_new_bars(self):
+        counts = upsert_bars(self.df, self.instrument, "D")
+        self.assertEqual(counts, {"inserted": 3, "updated": 0, "unchanged": 0})
+        self.assertEqual(self.instrument.bars.count(), 3)
+        self.assertEqual(self.instrument.bars.last().close, 32)
+    
+
+    def test_can_upsert_existing_bars(self):
+        b1 = mixer.blend(
+            Bar, timestamp=946684800, resolution="D", instrument=self.instrument,
+            open=10, close=12, high=14, low=8, volume=100
+        )
+        b2 = mixer.blend(
+            Bar, timestamp=946771200, resolution="D", instrument=self.instrument,
+            open=20, close=21, high=24, low=18, volume=150
+        )
+        mixer.blend(
+            Bar, timestamp=946771200, resolution="W", instrument=self.instrument,
+            open=1, close=1, high=1, low=1, volume=1
+        )
+        with self.assertNumQueries(8):
+            counts = upsert_bars(self.df, self.instrument, "D")
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "unchanged": 1})
+        self.assertEqual(self.instrument.bars.filter(resolution="D").count(), 3)
+        b2.refresh_from_db()
+        self.assertEqual((b2.close, b2.volume), (22, 200))
+        self.assertEqual(self.instrument.bars.get(resolution="W").close, 1)
+    
+
+    def test_can_upsert_nothing(self):
+        counts = upsert_bars(self.df.iloc[0:0], self.instrument, "D")
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 0})
 
 
 